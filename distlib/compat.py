@@ -199,6 +199,11 @@ except ImportError:  # pragma: no cover
             self.__dict__.update(kwargs)
 
 
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover
+    scandir = None
+
 try:
     from shutil import which
 except ImportError:  # pragma: no cover
@@ -20,7 +20,8 @@ import zipimport
 from . import DistlibException, resources
 from .compat import StringIO
 from .version import get_scheme, UnsupportedVersionError
-from .metadata import Metadata, METADATA_FILENAME, WHEEL_METADATA_FILENAME
+from .metadata import (Metadata, METADATA_FILENAME, WHEEL_METADATA_FILENAME,
+                       MetadataInvalidError)
 from .util import (parse_requirement, cached_property, parse_name_and_version,
                    read_exports, write_exports, CSVReader, CSVWriter)
 
@@ -324,6 +325,20 @@ class Distribution(object):
     present (in other words, whether the package was installed by user
     request or it was installed as a dependency)."""
 
+    metadata_loader = None
+    """
+    If not ``None``, a callable which is passed this instance and completes
+    its metadata. It's called (once) the first time requirements are asked
+    for, so that locators needn't fetch metadata which isn't needed.
+    """
+
+    # For distributions made by make_dist(..., lazy=True), the metadata is
+    # only created when first needed; until then, these hold what's needed
+    # to create it.
+    _metadata = None
+    _metadata_args = None
+    _source_url = None
+
     def __init__(self, metadata):
         """
         Initialise an instance.
@@ -331,9 +346,12 @@ class Distribution(object):
         distribution.
         """
         self.metadata = metadata
-        self.name = metadata.name
+        self._set_attributes(metadata.name, metadata.version)
+
+    def _set_attributes(self, name, version):
+        self.name = name
         self.key = self.name.lower()    # for case-insensitive comparisons
-        self.version = metadata.version
+        self.version = version
         self.locator = None
         self.digest = None
         self.extras = None      # additional features requested
@@ -341,13 +359,63 @@ class Distribution(object):
         self.download_urls = set()
         self.digests = {}
 
+    @classmethod
+    def _make_lazy(cls, name, version, summary, kwargs):
+        """
+        Make an instance whose metadata is created when first needed. The
+        name and version are validated as they would be by the metadata.
+        """
+        scheme = kwargs.get('scheme', 'default')
+        for key, value in (('name', name), ('version', version)):
+            pattern, exclusions = Metadata.SYNTAX_VALIDATORS[key]
+            if scheme not in exclusions and not pattern.match(value):
+                raise MetadataInvalidError("'%s' is an invalid value for "
+                                           "the '%s' property" % (value, key))
+        result = cls.__new__(cls)
+        result._metadata_args = (summary, kwargs)
+        result._set_attributes(name, version)
+        return result
+
     @property
-    def source_url(self):
-        """
-        The source archive download URL for this distribution.
-        """
+    def metadata(self):
+        """
+        The instance of :class:`Metadata` describing this distribution.
+        """
+        md = self._metadata
+        if md is None and self._metadata_args is not None:
+            summary, kwargs = self._metadata_args
+            md = Metadata(**kwargs)
+            md.name = self.name
+            md.version = self.version
+            md.summary = summary
+            if self._source_url is not None:
+                md.source_url = self._source_url
+            self._metadata = md
+            self._metadata_args = self._source_url = None
+        return md
+
+    @metadata.setter
+    def metadata(self, value):
+        self._metadata = value
+        self._metadata_args = self._source_url = None
+
+    def _get_source_url(self):
+        if self._metadata is None and self._metadata_args is not None:
+            return self._source_url
         return self.metadata.source_url
 
+    def _set_source_url(self, value):
+        if self._metadata is None and self._metadata_args is not None:
+            self._source_url = value
+        else:
+            self.metadata.source_url = value
+
+    source_url = property(_get_source_url, _set_source_url, None,
+                          """
+                          The source archive download URL for this
+                          distribution.
+                          """)
+
     download_url = source_url   # Backward compatibility
 
     @property
@@ -370,6 +438,10 @@ class Distribution(object):
         return plist
 
     def _get_requirements(self, req_attr):
+        loader = self.metadata_loader
+        if loader is not None:
+            self.metadata_loader = None
+            loader(self)
         md = self.metadata
         logger.debug('Getting requirements from metadata %r', md.todict())
         reqts = getattr(md, req_attr)
@@ -1303,8 +1375,16 @@ def get_required_dists(dists, dist):
 def make_dist(name, version, **kwargs):
     """
     A convenience method for making a dist given just a name and version.
+
+    If ``lazy=True`` is passed, the dist's metadata isn't created until it's
+    first needed, which saves time and memory when many dists are made but
+    few are used (as with the versions of a project found by a locator).
     """
     summary = kwargs.pop('summary', 'Placeholder for summary')
+    if kwargs.pop('lazy', False):
+        return Distribution._make_lazy(name, version,
+                                       summary or 'Placeholder for summary',
+                                       kwargs)
     md = Metadata(**kwargs)
     md.name = name
     md.version = version
@@ -5,20 +5,27 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 import hashlib
+import json
 import logging
 import os
+import posixpath
+import re
 import shutil
 import subprocess
 import tempfile
 try:
-    from threading import Thread
+    from threading import Thread, Lock
 except ImportError:
-    from dummy_threading import Thread
+    from dummy_threading import Thread, Lock
 
 from . import DistlibException
 from .compat import (HTTPBasicAuthHandler, Request, HTTPPasswordMgr,
-                     urlparse, build_opener, string_types)
-from .util import cached_property, zip_dir, ServerProxy
+                     urlparse, build_opener, string_types, queue, quote,
+                     unquote, escape, OrderedDict, HTTPError, httplib)
+from .util import (cached_property, zip_dir, ServerProxy, parse_requirement,
+                   normalize_name, Cache, Progress, get_cache_base,
+                   build_pooled_opener)
+from .version import get_scheme
 
 logger = logging.getLogger(__name__)
 
@@ -369,7 +376,19 @@ class PackageIndex(object):
                              'code %s' % rc)
         return rc == 0
 
-    def download_file(self, url, destfile, digest=None, reporthook=None):
+    # Retried downloads resume from where they left off. A download split
+    # into segments uses at most one for each this many bytes.
+    min_segment_size = 1 << 20
+
+    # The progress of a download in segments is saved each time this many
+    # bytes of a segment have been written, so that it can be resumed even
+    # if the process is killed.
+    state_interval = 1 << 20
+
+    blocksize = 8192
+
+    def download_file(self, url, destfile, digest=None, reporthook=None,
+                      retries=2, segments=1):
         """
         This is a convenience method for downloading a file from an URL.
         Normally, this will be a file from the index, though currently
@@ -381,6 +400,13 @@ class PackageIndex(object):
         done during download and checking that the downloaded data
         matched any expected value.
 
+        The file is downloaded to ``destfile + '.part'``, and only renamed
+        once it's complete and its digest is verified. If the download is
+        interrupted, it's resumed using HTTP range requests: by the retries
+        made by this method, or by a later call if they fail. The validators
+        needed to check that the file hasn't changed in the meantime are
+        kept in ``destfile + '.part.json'``.
+
         :param url: The URL of the file to be downloaded (assumed to be
                     available via an HTTP GET request).
         :param destfile: The pathname where the downloaded file is to be
@@ -390,61 +416,323 @@ class PackageIndex(object):
                        ``'md5'``) and ``value`` is the expected value.
         :param reporthook: The same as for :func:`urlretrieve` in the
                            standard library.
+        :param retries: The number of times to resume an interrupted
+                        download before giving up.
+        :param segments: If greater than 1, a large file is downloaded in up
+                         to this many segments at once, each using a
+                         separate range request, if the server allows it.
         """
         if digest is None:
-            digester = None
+            hasher = None
             logger.debug('No digest specified')
         else:
             if isinstance(digest, (list, tuple)):
                 hasher, digest = digest
             else:
                 hasher = 'md5'
-            digester = getattr(hashlib, hasher)()
             logger.debug('Digest specified: %s' % digest)
-        # The following code is equivalent to urlretrieve.
-        # We need to do it this way so that we can compute the
-        # digest of the file as we go.
-        with open(destfile, 'wb') as dfp:
-            # addinfourl is not a context manager on 2.x
-            # so we have to use try/finally
-            sfp = self.send_request(Request(url))
+        partfile = destfile + '.part'
+        statefile = partfile + '.json'
+        state = None
+        if os.path.exists(partfile) and os.path.exists(statefile):
             try:
-                headers = sfp.info()
-                blocksize = 8192
-                size = -1
-                read = 0
-                blocknum = 0
-                if "content-length" in headers:
-                    size = int(headers["Content-Length"])
-                if reporthook:
-                    reporthook(blocknum, blocksize, size)
-                while True:
-                    block = sfp.read(blocksize)
-                    if not block:
-                        break
-                    read += len(block)
-                    dfp.write(block)
-                    if digester:
-                        digester.update(block)
-                    blocknum += 1
-                    if reporthook:
-                        reporthook(blocknum, blocksize, size)
-            finally:
-                sfp.close()
-
-        # check that we got the whole file, if we can
-        if size >= 0 and read < size:
-            raise DistlibException(
-                'retrieval incomplete: got only %d out of %d bytes'
-                % (read, size))
+                with open(statefile) as f:
+                    state = json.load(f)
+            except ValueError:  # pragma: no cover
+                pass
+        if not state or state.get('url') != url:
+            state = {'url': url}
+        attempts = 0
+        while True:
+            try:
+                digester = None
+                if segments > 1:
+                    done = self._download_segments(url, partfile, state,
+                                                   segments, reporthook)
+                else:
+                    done = False
+                if not done:
+                    digester = self._download_stream(url, partfile, state,
+                                                     hasher, reporthook)
+                break
+            except (IOError, OSError, httplib.HTTPException,
+                    DistlibException) as e:
+                # HTTP errors are only worth retrying for server errors.
+                if isinstance(e, HTTPError) and e.code < 500:
+                    raise
+                self._save_download_state(statefile, state)
+                attempts += 1
+                if attempts > retries:
+                    raise
+                logger.warning('Download of %s interrupted (%s), resuming',
+                               url, e)
         # if we have a digest, it must match.
-        if digester:
+        if hasher:
+            if digester is None:
+                digester = self._hash_file(partfile, hasher)
             actual = digester.hexdigest()
             if digest != actual:
+                os.remove(partfile)
+                if os.path.exists(statefile):
+                    os.remove(statefile)
                 raise DistlibException('%s digest mismatch for %s: expected '
                                        '%s, got %s' % (hasher, destfile,
                                                        digest, actual))
             logger.debug('Digest verified: %s', digest)
+        if os.path.exists(destfile):
+            os.remove(destfile)
+        os.rename(partfile, destfile)
+        if os.path.exists(statefile):
+            os.remove(statefile)
+
+    def _save_download_state(self, statefile, state):
+        """
+        Save the state of a download, replacing the file holding it in one
+        step, so that a process killed while saving it doesn't leave it
+        unreadable.
+        """
+        tmpfile = statefile + '.tmp'
+        with open(tmpfile, 'w') as f:
+            json.dump(state, f)
+        if os.path.exists(statefile):
+            os.remove(statefile)
+        os.rename(tmpfile, statefile)
+
+    def _hash_file(self, pathname, hasher):
+        """
+        Return a digester which has been updated with the contents of a file.
+        """
+        digester = getattr(hashlib, hasher)()
+        with open(pathname, 'rb') as f:
+            while True:
+                block = f.read(65536)
+                if not block:
+                    break
+                digester.update(block)
+        return digester
+
+    def _make_range_request(self, url, start, end, state):
+        """
+        Make a request for part of a file. ``If-Range`` is used, so that if
+        the file has changed since ``state`` was recorded, all of it is sent.
+        """
+        end = '' if end is None else end
+        headers = {'Range': 'bytes=%s-%s' % (start, end)}
+        validator = state.get('etag') or state.get('last_modified')
+        if validator:
+            headers['If-Range'] = validator
+        return Request(url, headers=headers)
+
+    def _get_range_start(self, sfp):
+        """
+        Return the offset of the content of a response to a range request,
+        or ``None`` if the whole file was sent.
+        """
+        result = None
+        if sfp.getcode() == 206:
+            m = re.match(r'bytes\s+(\d+)-\d+/(\d+|\*)',
+                         sfp.info().get('Content-Range', ''))
+            if m:
+                result = int(m.group(1))
+        return result
+
+    def _download_stream(self, url, partfile, state, hasher, reporthook):
+        """
+        Download a file, or the rest of it if it's been partly downloaded,
+        to a .part file. If a hasher is specified, return a digester which
+        has been updated with the whole file.
+        """
+        offset = 0
+        # A .part file is only resumed if we know what it's part of.
+        if ('size' in state and 'segments' not in state and
+            os.path.exists(partfile)):
+            offset = os.path.getsize(partfile)
+        size = state.get('size', -1)
+        if offset and offset == size:
+            logger.debug('Already downloaded: %s', url)
+            req = None
+        elif offset:
+            logger.debug('Resuming %s at %d bytes', url, offset)
+            req = self._make_range_request(url, offset, None, state)
+        else:
+            req = Request(url)
+        if req is not None:
+            try:
+                sfp = self.send_request(req)
+            except HTTPError as e:
+                if not offset or e.code != 416:
+                    raise
+                # The .part file is no shorter than the file now is, so it
+                # can't be part of it: start again.
+                logger.debug('Range not satisfiable, restarting %s', url)
+                os.remove(partfile)
+                for key in ('size', 'etag', 'last_modified'):
+                    state.pop(key, None)
+                offset = 0
+                sfp = self.send_request(Request(url))
+            try:
+                headers = sfp.info()
+                if offset and self._get_range_start(sfp) != offset:
+                    offset = 0      # the whole file was sent
+                # The digest is computed as the data arrives. Digester state
+                # can't be saved, so that of a resumed file is recomputed.
+                digester = None
+                if hasher:
+                    if offset:
+                        digester = self._hash_file(partfile, hasher)
+                    else:
+                        digester = getattr(hashlib, hasher)()
+                if offset:
+                    m = re.search(r'/(\d+)$', headers.get('Content-Range'))
+                    size = int(m.group(1)) if m else -1
+                elif 'content-length' in headers:
+                    size = int(headers['Content-Length'])
+                else:
+                    size = -1
+                state.pop('segments', None)
+                state.update(size=size, etag=headers.get('ETag'),
+                             last_modified=headers.get('Last-Modified'))
+                # Saved now, so that the download can be resumed however
+                # it's interrupted. The size of the .part file says how much
+                # of it has been downloaded.
+                self._save_download_state(partfile + '.json', state)
+                read = offset
+                blocksize = self.blocksize
+                blocknum = offset // blocksize
+                if reporthook:
+                    reporthook(blocknum, blocksize, size)
+                with open(partfile, 'ab' if offset else 'wb') as dfp:
+                    while True:
+                        block = sfp.read(blocksize)
+                        if not block:
+                            break
+                        read += len(block)
+                        dfp.write(block)
+                        if digester:
+                            digester.update(block)
+                        blocknum += 1
+                        if reporthook:
+                            reporthook(blocknum, blocksize, size)
+            finally:
+                sfp.close()
+            # check that we got the whole file, if we can
+            if size >= 0 and read < size:
+                raise DistlibException(
+                    'retrieval incomplete: got only %d out of %d bytes'
+                    % (read, size))
+            return digester
+        if hasher:
+            return self._hash_file(partfile, hasher)
+
+    def _download_segments(self, url, partfile, state, segments, reporthook):
+        """
+        Download a file in segments, using a range request for each, at the
+        same time. Segments already downloaded (as recorded in ``state``)
+        aren't downloaded again. Return ``False`` if the file isn't suitable
+        for this (because it's small, or the server doesn't support range
+        requests), else ``True`` once it's been downloaded.
+        """
+        statefile = partfile + '.json'
+        if 'segments' not in state or not os.path.exists(partfile):
+            sfp = self.send_request(self._make_range_request(url, 0, 0, {}))
+            try:
+                headers = sfp.info()
+                m = re.match(r'bytes\s+0-0/(\d+)',
+                             headers.get('Content-Range', ''))
+                if sfp.getcode() != 206 or not m:
+                    return False
+                size = int(m.group(1))
+            finally:
+                sfp.close()
+            n = min(segments, size // self.min_segment_size)
+            if n < 2:
+                return False
+            # Only recorded now, as a size in the state says that the .part
+            # file is part of the file, which _download_stream() resumes.
+            state.update(size=size, etag=headers.get('ETag'),
+                         last_modified=headers.get('Last-Modified'))
+            step = size // n
+            # Each segment is [start, end, number of bytes downloaded].
+            state['segments'] = [[i * step, (i + 1) * step - 1, 0]
+                                 for i in range(n)]
+            state['segments'][-1][1] = size - 1
+            with open(partfile, 'wb') as f:
+                f.truncate(size)
+            self._save_download_state(statefile, state)
+        size = state['size']
+        lock = Lock()
+        progress = [sum(s[2] for s in state['segments']) // self.blocksize]
+        errors = []
+
+        def fetch(segment):
+            try:
+                start, end, done = segment
+                if start + done > end:
+                    return
+                req = self._make_range_request(url, start + done, end, state)
+                sfp = self.send_request(req)
+                try:
+                    if self._get_range_start(sfp) != start + done:
+                        # The file has changed, so start again.
+                        with lock:
+                            state.pop('segments', None)
+                            state.pop('size', None)
+                        raise DistlibException('range request for %s not '
+                                               'honoured' % url)
+                    # Bytes written, but not yet counted in the segment. They
+                    # are only counted once flushed, so that the saved state
+                    # never claims more than is in the file.
+                    pending = [0]
+                    try:
+                        with open(partfile, 'r+b') as dfp:
+                            dfp.seek(start + done)
+                            while True:
+                                block = sfp.read(self.blocksize)
+                                if not block:
+                                    break
+                                dfp.write(block)
+                                pending[0] += len(block)
+                                with lock:
+                                    progress[0] += 1
+                                    if reporthook:
+                                        reporthook(progress[0],
+                                                   self.blocksize, size)
+                                if pending[0] >= self.state_interval:
+                                    dfp.flush()
+                                    with lock:
+                                        segment[2] += pending[0]
+                                        pending[0] = 0
+                                        if 'segments' in state:
+                                            self._save_download_state(
+                                                statefile, state)
+                    finally:
+                        # The file has been closed, so all of it was written.
+                        with lock:
+                            segment[2] += pending[0]
+                finally:
+                    sfp.close()
+                if start + segment[2] <= end:
+                    raise DistlibException(
+                        'retrieval incomplete: got only %d out of %d bytes'
+                        % (segment[2], end - start + 1))
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+
+        threads = []
+        for segment in state['segments']:
+            t = Thread(target=fetch, args=(segment,))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+        for start, end, done in state['segments']:
+            if start + done <= end:
+                raise DistlibException('retrieval of %s incomplete' % url)
+        return True
 
     def send_request(self, req):
         """
@@ -511,3 +799,583 @@ class PackageIndex(object):
         if self.rpc_proxy is None:
             self.rpc_proxy = ServerProxy(self.url, timeout=3.0)
         return self.rpc_proxy.search(terms, operator or 'and')
+
+
+class FileStore(Cache):
+    """
+    A content-addressed store of files, keyed by their SHA256 digests, so
+    that a file is only stored once however many URLs it's found at. Other
+    digests of stored files (e.g. MD5) can be recorded as aliases, so that
+    files can be found using them too.
+    """
+    def __init__(self, base=None):
+        """
+        Initialise an instance.
+
+        :param base: The directory to hold the store. If not specified, a
+                     ``file-store`` directory under :func:`get_cache_base`
+                     is used.
+        """
+        if base is None:
+            # Use native string to avoid issues on 2.x: see Python #20140.
+            base = os.path.join(get_cache_base(), str('file-store'))
+        super(FileStore, self).__init__(base)
+
+    def path(self, sha256):
+        """
+        Return the pathname for the file with a SHA256 digest, whether or
+        not it's in the store.
+        """
+        return os.path.join(self.base, sha256[:2], sha256)
+
+    def get(self, sha256):
+        """
+        Return the pathname of the file with a SHA256 digest, or ``None`` if
+        it's not in the store.
+        """
+        result = self.path(sha256)
+        if not os.path.isfile(result):
+            result = None
+        return result
+
+    def add(self, pathname, sha256):
+        """
+        Move a file, whose SHA256 digest has been verified, into the store
+        and return its new pathname. The file should be on the same file
+        system as the store (e.g. in a temporary file made using
+        :meth:`mkstemp`). If the store already has the file, it's removed.
+        """
+        result = self.path(sha256)
+        d = os.path.dirname(result)
+        if not os.path.isdir(d):
+            try:
+                os.makedirs(d)
+            except OSError:     # pragma: no cover
+                # Made by another thread or process in the meantime
+                if not os.path.isdir(d):
+                    raise
+        if os.path.exists(result):
+            os.remove(pathname)
+        else:
+            os.rename(pathname, result)
+        return result
+
+    def mkstemp(self):
+        """
+        Make a temporary file in the store, for downloading into. Return a
+        tuple of an open file descriptor and the file's pathname.
+        """
+        return tempfile.mkstemp(dir=self.base, prefix='.part-')
+
+    def _alias_path(self, hasher, digest):
+        return os.path.join(self.base, 'aliases', hasher, digest)
+
+    def get_alias(self, hasher, digest):
+        """
+        Return the SHA256 digest recorded for another digest of a file, or
+        ``None``.
+        """
+        result = None
+        path = self._alias_path(hasher, digest)
+        if os.path.exists(path):
+            with open(path) as f:
+                result = f.read().strip()
+        return result
+
+    def add_alias(self, hasher, digest, sha256):
+        """
+        Record another digest of a file with a SHA256 digest.
+        """
+        path = self._alias_path(hasher, digest)
+        d = os.path.dirname(path)
+        if not os.path.isdir(d):
+            try:
+                os.makedirs(d)
+            except OSError:     # pragma: no cover
+                if not os.path.isdir(d):
+                    raise
+        with open(path, 'w') as f:
+            f.write(sha256)
+
+
+class DownloadManager(object):
+    """
+    Downloads many files at once into a :class:`FileStore`, verifying their
+    digests. A file which is already in the store isn't downloaded, and a
+    file listed more than once (with the same digest, at different URLs) is
+    only downloaded once, from the first of its URLs which works.
+    """
+
+    # Files are read and written in blocks of this size.
+    blocksize = 65536
+
+    def __init__(self, store=None, num_workers=4, pool=None, timeout=None):
+        """
+        Initialise an instance.
+
+        :param store: The :class:`FileStore` to download into. If not
+                      specified, one in the default location is used.
+        :param num_workers: The maximum number of files to download at once.
+        :param pool: The :class:`~distlib.util.ConnectionPool` from which
+                     to reuse HTTP connections. If not specified, the default
+                     pool is used.
+        :param timeout: The timeout, in seconds, for requests.
+        """
+        self.store = store or FileStore()
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.opener = build_pooled_opener(pool=pool)
+        self.progress = None
+        self._lock = Lock()
+        self.downloaded = 0     # files downloaded
+        self.reused = 0         # files found in the store
+
+    @property
+    def stats(self):
+        """
+        Return a dictionary with the numbers of files ``downloaded`` and
+        ``reused`` (found in the store) by this instance, and the ``bytes``
+        downloaded, ``elapsed`` time and throughput (``rate``, in bytes per
+        second) of the last call to :meth:`download`.
+        """
+        progress = self.progress
+        if progress is None:
+            received = elapsed = rate = 0
+        else:
+            received = progress.cur
+            elapsed = progress.elapsed
+            rate = float(received) / elapsed if elapsed else 0.0
+        return {
+            'downloaded': self.downloaded,
+            'reused': self.reused,
+            'bytes': received,
+            'elapsed': elapsed,
+            'rate': rate,
+        }
+
+    def _expect(self, size):
+        """
+        Adjust the total number of bytes which :attr:`progress` expects to
+        be downloaded: by the size of a download as it starts, and by the
+        shortfall of one which ends early. If the size of a download isn't
+        known (``None``), neither is the total.
+        """
+        with self._lock:
+            progress = self.progress
+            if size is None:
+                progress.max = None
+            elif progress.max is not None:
+                progress.max += size
+
+    def _fetch(self, url, digest, reporthook):
+        """
+        Download a file into the store, returning its pathname there.
+        """
+        sha256 = hashlib.sha256()
+        if digest is None or digest[0] == 'sha256':
+            digester = None
+        else:
+            digester = getattr(hashlib, digest[0])()
+        fd, fn = self.store.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                resp = self.opener.open(Request(url), timeout=self.timeout)
+                size = -1
+                read = 0
+                try:
+                    size = int(resp.info().get('Content-Length', -1))
+                    self._expect(size if size >= 0 else None)
+                    while True:
+                        block = resp.read(self.blocksize)
+                        if not block:
+                            break
+                        read += len(block)
+                        f.write(block)
+                        sha256.update(block)
+                        if digester:
+                            digester.update(block)
+                        with self._lock:
+                            self.progress.increment(len(block))
+                        if reporthook:
+                            reporthook(self.progress)
+                finally:
+                    resp.close()
+                    if read < size:
+                        self._expect(read - size)
+            if size >= 0 and read < size:
+                raise DistlibException(
+                    'retrieval incomplete: got only %d out of %d bytes'
+                    % (read, size))
+            actual = sha256.hexdigest()
+            if digest:
+                hasher, expected = digest
+                if digester:
+                    value = digester.hexdigest()
+                else:
+                    value = actual
+                if value != expected:
+                    raise DistlibException('%s digest mismatch for %s: '
+                                           'expected %s, got %s' %
+                                           (hasher, url, expected, value))
+                if digester:
+                    self.store.add_alias(hasher, expected, actual)
+            result = self.store.add(fn, actual)
+        except Exception:
+            if os.path.exists(fn):
+                os.remove(fn)
+            raise
+        with self._lock:
+            self.downloaded += 1
+        return result
+
+    def download(self, files, reporthook=None):
+        """
+        Download files into the store.
+
+        :param files: An iterable of (url, digest) tuples, where the digest
+                      is ``None``, a (hasher, value) tuple or, as for
+                      :meth:`PackageIndex.download_file`, an MD5 value.
+        :param reporthook: If specified, called with :attr:`progress` (a
+                           :class:`~distlib.util.Progress` instance counting
+                           the bytes downloaded) as data is received.
+        :return: A tuple of two dictionaries, keyed by URL: the first maps
+                 URLs to the pathnames of their files in the store, and the
+                 second maps the URLs of files which couldn't be downloaded
+                 to the exceptions which prevented it.
+        """
+        paths = {}
+        failed = {}
+        groups = OrderedDict()   # (hasher, value) or URL -> (digest, URLs)
+        for url, digest in files:
+            if isinstance(digest, string_types):
+                digest = ('md5', digest)
+            elif digest is not None:
+                digest = tuple(digest)
+            if url in paths:
+                continue
+            if digest is None:
+                key = url
+            else:
+                if digest[0] == 'sha256':
+                    sha256 = digest[1]
+                else:
+                    sha256 = self.store.get_alias(*digest)
+                path = sha256 and self.store.get(sha256)
+                if path:
+                    paths[url] = path
+                    self.reused += 1
+                    continue
+                key = digest
+            urls = groups.setdefault(key, (digest, []))[1]
+            if url not in urls:
+                urls.append(url)
+        todo = queue.Queue()
+        for item in groups.values():
+            todo.put(item)
+        # The total grows as downloads start and give their sizes.
+        self.progress = Progress(maxval=0).start()
+
+        def work():
+            while True:
+                try:
+                    digest, urls = todo.get(False)
+                except queue.Empty:
+                    break
+                errors = {}
+                for url in urls:
+                    try:
+                        path = self._fetch(url, digest, reporthook)
+                    except Exception as e:
+                        logger.warning('Unable to download %s: %s', url, e)
+                        errors[url] = e
+                    else:
+                        with self._lock:
+                            for u in urls:
+                                paths[u] = path
+                        break
+                else:
+                    with self._lock:
+                        failed.update(errors)
+
+        threads = []
+        for i in range(min(self.num_workers, todo.qsize())):
+            t = Thread(target=work)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        self.progress.stop()
+        return paths, failed
+
+
+class Mirror(object):
+    """
+    A local mirror of the distribution archives of some projects, which is
+    brought up to date using :meth:`sync`. Archives are kept in a directory
+    for each project (named as per PEP 503) under the mirror's root, which
+    can be served using a :class:`~distlib.locators.DirectoryLocator`. A
+    static "simple" index of them is written to the ``simple`` directory.
+    A manifest records what has been mirrored, so that only new files are
+    downloaded by later runs.
+    """
+
+    manifest_name = 'mirror.json'
+    index_dir = 'simple'
+
+    def __init__(self, root, locator=None, index=None, num_workers=4):
+        """
+        Initialise an instance.
+
+        :param root: The directory to hold the mirror.
+        :param locator: The locator used to find the files to mirror. If not
+                        specified, the default locator is used.
+        :param index: The :class:`PackageIndex` used to download files. If
+                      not specified, one for PyPI is used.
+        :param num_workers: The number of files to download at once.
+        """
+        if locator is None:
+            # imported here so that importing distlib.index doesn't pull in
+            # (and set up) the default locator, which isn't otherwise needed
+            from .locators import default_locator as locator
+        self.root = os.path.abspath(root)
+        self.locator = locator
+        self.index = index or PackageIndex()
+        self.num_workers = num_workers
+        self._lock = Lock()
+        self.manifest = self._load_manifest()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, self.manifest_name)
+
+    def _load_manifest(self):
+        result = {'version': 1, 'files': {}}
+        path = self.manifest_path
+        if os.path.exists(path):
+            with open(path) as f:
+                result = json.load(f)
+        return result
+
+    def _write(self, path, data):
+        """
+        Write text to a file, replacing it only once it's been written.
+        """
+        d = os.path.dirname(path)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        fn = path + '.tmp'
+        with open(fn, 'wb') as f:
+            f.write(data.encode('utf-8'))
+        self._rename(fn, path)
+
+    def _rename(self, src, dst):
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+    def save_manifest(self):
+        """
+        Save the manifest of mirrored files.
+        """
+        with self._lock:
+            data = json.dumps(self.manifest, indent=1, sort_keys=True)
+        self._write(self.manifest_path, data)
+
+    def find_files(self, requirements, latest_only=False, prereleases=False):
+        """
+        Find the files to mirror for some requirements.
+
+        :param requirements: The requirements to mirror, such as ``'foo'``
+                             or ``'foo (>= 1.0)'``.
+        :param latest_only: If ``True``, only the files for the latest
+                            matching version of each project are found.
+                            Otherwise, all matching versions' files are.
+        :param prereleases: If ``True``, pre-releases are included.
+        :return: A list of dictionaries describing files, with the
+                 ``project``, ``version``, ``url``, ``digest`` (if known)
+                 and ``path`` (relative to the mirror root, using ``/`` as
+                 the separator) of each.
+        """
+        result = []
+        seen = set()
+        locator = self.locator
+        for requirement in requirements:
+            r = parse_requirement(requirement)
+            if r is None:
+                raise DistlibException('Not a valid requirement: %r' %
+                                       requirement)
+            project = normalize_name(r.name)
+            found = []  # (version, url, digest) tuples
+            if latest_only:
+                dist = locator.locate(requirement, prereleases)
+                if dist is not None:
+                    for url in sorted(dist.download_urls):
+                        found.append((dist.version, url,
+                                      dist.digests.get(url)))
+            else:
+                versions = locator.get_project(r.name)
+                digests = versions.get('digests', {})
+                matcher = get_scheme(locator.scheme).matcher(r.requirement)
+                for version, urls in versions.get('urls', {}).items():
+                    try:
+                        if not matcher.match(version):
+                            continue
+                        if (not prereleases and
+                            matcher.version_class(version).is_prerelease):
+                            continue
+                    except Exception:
+                        logger.warning('Ignoring invalid version %r of %s',
+                                       version, r.name)
+                        continue
+                    for url in sorted(urls):
+                        found.append((version, url, digests.get(url)))
+            for version, url, digest in found:
+                filename = unquote(posixpath.basename(urlparse(url)[2]))
+                if not filename or filename.startswith('.'):
+                    continue
+                path = '%s/%s' % (project, filename)
+                if path not in seen:
+                    seen.add(path)
+                    result.append({'project': project, 'version': version,
+                                   'url': url, 'digest': digest,
+                                   'path': path})
+        return result
+
+    def _get_pathname(self, path):
+        return os.path.join(self.root, *path.split('/'))
+
+    def _add(self, info, sha256):
+        with self._lock:
+            self.manifest['files'][info['path']] = {
+                'project': info['project'],
+                'version': info['version'],
+                'url': info['url'],
+                'sha256': sha256,
+            }
+
+    def _hash_file(self, pathname, hasher='sha256'):
+        digester = getattr(hashlib, hasher)()
+        with open(pathname, 'rb') as f:
+            for block in iter(lambda: f.read(65536), b''):
+                digester.update(block)
+        return digester.hexdigest()
+
+    def _download(self, info):
+        """
+        Download a file to the mirror. :meth:`PackageIndex.download_file`
+        only gives the file its final name once it's complete and its digest
+        is verified, and keeps partial downloads so that they can be resumed.
+        """
+        pathname = self._get_pathname(info['path'])
+        with self._lock:
+            d = os.path.dirname(pathname)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+        digest = info['digest']
+        self.index.download_file(info['url'], pathname, digest)
+        if digest and digest[0] == 'sha256':
+            sha256 = digest[1]
+        else:
+            sha256 = self._hash_file(pathname)
+        self._add(info, sha256)
+
+    def _adopt(self, info):
+        """
+        Check whether a file is already in the mirror. A complete file which
+        isn't in the manifest (e.g. because a previous run was interrupted)
+        is added to it, if its digest matches.
+        """
+        path = info['path']
+        pathname = self._get_pathname(path)
+        if not os.path.isfile(pathname):
+            return False
+        if path in self.manifest['files']:
+            return True
+        digest = info['digest']
+        if digest:
+            hasher, value = digest
+            if self._hash_file(pathname, hasher) != value:
+                return False
+        self._add(info, self._hash_file(pathname))
+        return True
+
+    def sync(self, requirements, latest_only=False, prereleases=False):
+        """
+        Bring the mirror up to date for some requirements, downloading the
+        files (found as for :meth:`find_files`) which aren't yet mirrored,
+        using up to :attr:`num_workers` threads. The manifest and static
+        index are then written, even if some downloads failed.
+
+        :return: A dictionary with a list of the paths ``downloaded``, the
+                 number of files ``skipped`` because they were already
+                 mirrored, and a dictionary of the exceptions which caused
+                 any downloads to fail (``failed``), keyed by URL.
+        """
+        files = self.find_files(requirements, latest_only, prereleases)
+        todo = queue.Queue()
+        skipped = 0
+        for info in files:
+            if self._adopt(info):
+                skipped += 1
+            else:
+                todo.put(info)
+        downloaded = []
+        failed = {}
+
+        def work():
+            while True:
+                try:
+                    info = todo.get(False)
+                except queue.Empty:
+                    break
+                try:
+                    self._download(info)
+                    downloaded.append(info['path'])
+                except Exception as e:
+                    logger.warning('Unable to mirror %s: %s', info['url'], e)
+                    failed[info['url']] = e
+
+        try:
+            threads = []
+            for i in range(min(self.num_workers, todo.qsize())):
+                t = Thread(target=work)
+                t.daemon = True
+                t.start()
+                threads.append(t)
+            for t in threads:
+                t.join()
+        finally:
+            self.save_manifest()
+        self.write_index()
+        return {'downloaded': sorted(downloaded), 'skipped': skipped,
+                'failed': failed}
+
+    def write_index(self):
+        """
+        Write a static "simple" index (as per PEP 503) of the mirrored files
+        to the ``simple`` directory of the mirror. It can be served by any
+        web server, or used directly via a ``file:`` URL.
+        """
+        projects = {}
+        with self._lock:
+            for path, info in self.manifest['files'].items():
+                projects.setdefault(info['project'], []).append((path, info))
+        page = ('<!DOCTYPE html>\n<html><head><title>%s</title></head>'
+                '<body>\n%s</body></html>\n')
+        base = os.path.join(self.root, self.index_dir)
+        links = []
+        for project in sorted(projects):
+            links.append('<a href="%s/">%s</a><br/>\n' %
+                         (quote(project), escape(project)))
+            entries = []
+            for path, info in sorted(projects[project]):
+                filename = path.rsplit('/', 1)[-1]
+                entries.append('<a href="../../%s#sha256=%s">%s</a><br/>\n' %
+                               (quote(path), info['sha256'],
+                                escape(filename)))
+            self._write(os.path.join(base, project, 'index.html'),
+                        page % ('Links for %s' % escape(project),
+                                ''.join(entries)))
+        self._write(os.path.join(base, 'index.html'),
+                    page % ('Simple index', ''.join(links)))
@@ -5,37 +5,51 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 
-import gzip
-from io import BytesIO
+from bisect import bisect_right
+import codecs
+from collections import deque
+import hashlib
 import json
 import logging
 import os
+import platform
 import posixpath
 import re
+try:
+    import sqlite3
+except ImportError:  # pragma: no cover
+    sqlite3 = None
+import tempfile
 try:
     import threading
 except ImportError:  # pragma: no cover
     import dummy_threading as threading
+import time
 import zlib
 
 from . import DistlibException
 from .compat import (urljoin, urlparse, urlunparse, url2pathname, pathname2url,
-                     queue, quote, unescape, string_types, build_opener,
+                     queue, quote, unescape, string_types, StringIO,
                      HTTPRedirectHandler as BaseRedirectHandler, text_type,
-                     Request, HTTPError, URLError)
+                     Request, HTTPError, URLError, scandir, OrderedDict,
+                     xmlrpclib)
 from .database import Distribution, DistributionPath, make_dist
 from .metadata import Metadata
 from .util import (cached_property, parse_credentials, ensure_slash,
                    split_filename, get_project_data, parse_requirement,
-                   parse_name_and_version, ServerProxy, normalize_name)
+                   parse_name_and_version, ServerProxy, normalize_name,
+                   Cache, get_cache_base, build_pooled_opener)
 from .version import get_scheme, UnsupportedVersionError
-from .wheel import Wheel, is_compatible
+from .wheel import Wheel, RemoteWheel, is_compatible
 
 logger = logging.getLogger(__name__)
 
 HASHER_HASH = re.compile('^(\w+)=([a-f0-9]+)')
 CHARSET = re.compile(r';\s*charset\s*=\s*(.*)\s*$', re.I)
-HTML_CONTENT_TYPE = re.compile('text/html|application/x(ht)?ml')
+HTML_CONTENT_TYPE = re.compile('text/html|application/x(ht)?ml|'
+                               r'application/vnd\.pypi\.simple\.v1\+html')
+SIMPLE_JSON_CONTENT_TYPE = re.compile(
+    r'application/vnd\.pypi\.simple\.v1\+json')
 DEFAULT_INDEX = 'https://pypi.python.org/pypi'
 
 def get_all_distribution_names(url=None):
@@ -80,6 +94,571 @@ class RedirectHandler(BaseRedirectHandler):
 
     http_error_301 = http_error_303 = http_error_307 = http_error_302
 
+EXTRA_MARKER = re.compile(r"""^extra\s*==\s*(['"])([^'"]+)\1$""")
+
+def _update_requirements(md, other):
+    """
+    Update the requirements and extras in metadata from metadata in the
+    legacy (key-value) format, such as that in a wheel or sdist.
+    """
+    entries = []
+    for reqt in other.run_requires:
+        reqt, _, marker = reqt.partition(';')
+        entry = {'requires': [reqt.strip()]}
+        marker = marker.strip()
+        if marker:
+            m = EXTRA_MARKER.match(marker)
+            if m:
+                entry['extra'] = m.group(2)
+            else:
+                entry['environment'] = marker
+        entries.append(entry)
+    md.run_requires = entries
+    if other.extras:
+        md.extras = other.extras
+    if other.summary:
+        md.summary = other.summary
+
+
+def _has_versions(result):
+    """
+    Say whether a result from :meth:`Locator.get_project` has any versions in
+    it.
+    """
+    for k in result:
+        if k not in ('urls', 'digests'):
+            return True
+    return False
+
+
+def _write_file(path, chunks):
+    """
+    Write chunks of bytes to a file by writing them to a temporary file and
+    renaming it, so that concurrent readers (possibly in other processes)
+    never see a partial file. The temporary file is removed if this fails.
+    """
+    fd, fn = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(chunks)
+        try:
+            os.rename(fn, path)
+        except OSError:  # pragma: no cover
+            # Windows won't rename over an existing file
+            os.remove(path)
+            os.rename(fn, path)
+    except Exception:  # pragma: no cover
+        if os.path.exists(fn):
+            os.remove(fn)
+        raise
+
+
+class LocatorCache(object):
+    """
+    A cache for the results of :meth:`Locator.get_project`, keyed by project
+    name. By default it's unbounded and entries never expire, but it can be
+    limited to a maximum number of entries and/or an approximate memory
+    budget (evicting the least recently used entries first), and entries can
+    be given a time to live - with a separate one for results in which no
+    versions were found, if desired.
+
+    Any object with ``get``, ``put`` and ``clear`` methods like those of this
+    class can be used as a locator's cache. If it also has a ``get_extra``
+    method, :meth:`Locator.locate` uses it to keep the parsed versions of a
+    project with its result.
+    """
+
+    # Rough per-item memory costs, in bytes, used to estimate the size of a
+    # result: each version's Distribution and Metadata instances, and each
+    # URL with its digest (in addition to the length of the URL).
+    version_size = 1024
+    url_size = 200
+
+    def __init__(self, max_entries=None, max_size=None, ttl=None,
+                 negative_ttl=None):
+        """
+        Initialise an instance.
+
+        :param max_entries: The maximum number of projects to hold results
+                            for, or ``None`` for no limit.
+        :param max_size: The approximate maximum memory, in bytes, to be
+                         used by the cached results, or ``None`` for no
+                         limit.
+        :param ttl: The number of seconds for which a result can be used, or
+                    ``None`` for no limit.
+        :param negative_ttl: The number of seconds for which a result with no
+                             versions in it can be used. If ``None``, ``ttl``
+                             applies. If zero, such results aren't cached.
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # name -> (result, expiry time, size, extra data)
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0      # removed to keep within the limits
+        self.expirations = 0    # removed because they had expired
+
+    @property
+    def stats(self):
+        """
+        Return a dictionary of counters describing cache effectiveness, and
+        the current number of ``entries`` and their approximate ``size``.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'size': self.size,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_negative(self, result):
+        """
+        Say whether a result has no versions in it.
+        """
+        return not _has_versions(result)
+
+    def estimate_size(self, result):
+        """
+        Estimate the memory used by a result, in bytes.
+        """
+        urls = result.get('digests', {})
+        versions = len(result) - ('urls' in result) - ('digests' in result)
+        return (versions * self.version_size +
+                sum(len(url) + self.url_size for url in urls))
+
+    def get(self, name):
+        """
+        Get the result for a project, or ``None`` if there isn't a usable one.
+        """
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None and entry[1] is not None:
+                if time.time() >= entry[1]:
+                    self.size -= entry[2]
+                    self.expirations += 1
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            # Re-insert, to make this the most recently used entry.
+            self._entries[name] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, name, result):
+        """
+        Store the result for a project.
+        """
+        ttl = self.ttl
+        if self.negative_ttl is not None and self.is_negative(result):
+            ttl = self.negative_ttl
+        if ttl is not None and ttl <= 0:
+            return
+        expires = None if ttl is None else time.time() + ttl
+        size = self.estimate_size(result)
+        with self._lock:
+            old = self._entries.pop(name, None)
+            if old is not None:
+                self.size -= old[2]
+            self._entries[name] = (result, expires, size, {})
+            self.size += size
+            while self._entries and (
+                (self.max_entries is not None and
+                 len(self._entries) > self.max_entries) or
+                (self.max_size is not None and self.size > self.max_size)):
+                key = next(iter(self._entries))
+                self.size -= self._entries.pop(key)[2]
+                self.evictions += 1
+
+    def get_extra(self, name, result):
+        """
+        Get a dictionary in which to keep data derived from the result for a
+        project, which is discarded along with the result.
+
+        :param name: The name of the project.
+        :param result: The result the data is derived from.
+        :return: The dictionary, or ``None`` if ``result`` isn't the result
+                 held for the project.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None or entry[0] is not result:
+            return None
+        return entry[3]
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class _HostState(object):
+    """
+    The health of a single host, as tracked by :class:`HostHealth`.
+    """
+    def __init__(self, window):
+        self.outcomes = deque(maxlen=window)    # (ok, elapsed) tuples
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0           # consecutive failures
+        self.state = 'closed'
+        self.opened = None          # when the circuit was last opened
+        self.probing = False        # whether a half-open probe is in flight
+
+    @property
+    def latency(self):
+        times = [t for ok, t in self.outcomes if ok]
+        if not times:
+            return None
+        return sum(times) / len(times)
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for ok, t in self.outcomes if not ok) / float(
+            len(self.outcomes))
+
+
+class HostHealth(object):
+    """
+    Tracks the health of hosts which locators make requests to: their
+    latency and error rate over recent requests, and a circuit breaker for
+    each host. After a number of consecutive failures, a host's circuit is
+    opened and requests to it aren't allowed. Once a while has passed, the
+    circuit is half-open: a single request is allowed as a probe, which
+    closes the circuit if it succeeds and opens it again if it fails.
+
+    An instance can be shared between locators, and is used to choose the
+    best of a set of equivalent mirrors.
+    """
+    def __init__(self, failure_threshold=3, reset_timeout=30.0, window=20):
+        """
+        Initialise an instance.
+
+        :param failure_threshold: The number of consecutive failures after
+                                  which a host's circuit is opened.
+        :param reset_timeout: The number of seconds after which an open
+                              circuit becomes half-open, allowing a request
+                              to probe the host again.
+        :param window: The number of recent requests to each host over which
+                       latency and error rate are measured.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.window = window
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get_state(self, host):
+        # This must be called with self._lock held.
+        result = self._hosts.get(host)
+        if result is None:
+            result = self._hosts[host] = _HostState(self.window)
+        return result
+
+    def allow(self, host):
+        """
+        Say whether a request to a host may be made now. If the host's
+        circuit is half-open, this returns ``True`` for a single probe
+        request, whose outcome must be recorded using :meth:`record`.
+        """
+        with self._lock:
+            state = self._get_state(host)
+            if state.state == 'open':
+                if time.time() - state.opened < self.reset_timeout:
+                    return False
+                state.state = 'half-open'
+            if state.state == 'half-open':
+                if state.probing:
+                    return False
+                state.probing = True
+            return True
+
+    def record(self, host, ok, elapsed=None):
+        """
+        Record the outcome of a request to a host.
+
+        :param host: The host the request was made to.
+        :param ok: Whether the host responded (even if with an error such as
+                   a 404), rather than failing to respond properly.
+        :param elapsed: The number of seconds the host took to respond.
+        """
+        with self._lock:
+            state = self._get_state(host)
+            state.requests += 1
+            state.outcomes.append((ok, elapsed or 0.0))
+            state.probing = False
+            if ok:
+                state.failures = 0
+                state.state = 'closed'
+            else:
+                state.errors += 1
+                state.failures += 1
+                if (state.state == 'half-open' or
+                    state.failures >= self.failure_threshold):
+                    if state.state != 'open':
+                        logger.warning('Not using %s for %s seconds after '
+                                       'repeated failures', host,
+                                       self.reset_timeout)
+                    state.state = 'open'
+                    state.opened = time.time()
+
+    def rank(self, hosts):
+        """
+        Order hosts from best to worst: those whose circuits are closed
+        first, fastest first, then the others. Hosts which haven't been used
+        yet count as fastest, so that each gets tried. Otherwise, the order
+        passed in is kept.
+        """
+        with self._lock:
+            def key(item):
+                i, host = item
+                state = self._hosts.get(host)
+                if state is None:
+                    return (False, 0.0, i)
+                return (state.state != 'closed', state.latency or 0.0, i)
+
+            return [host for i, host in sorted(enumerate(hosts), key=key)]
+
+    @property
+    def stats(self):
+        """
+        Return a dictionary mapping each host to a dictionary describing its
+        health: its circuit ``state`` (``'closed'``, ``'open'`` or
+        ``'half-open'``), counts of ``requests`` and ``errors``, and its
+        ``error_rate`` and mean ``latency`` (or ``None``) over recent
+        requests.
+        """
+        with self._lock:
+            return dict((host, {
+                'state': state.state,
+                'requests': state.requests,
+                'errors': state.errors,
+                'error_rate': state.error_rate,
+                'latency': state.latency,
+            }) for host, state in self._hosts.items())
+
+
+class ProjectStore(object):
+    """
+    A persistent store for the results of :meth:`Locator.get_project`, which
+    can be shared by locators in several processes on the same machine. It
+    uses an SQLite database in WAL mode, so that readers aren't blocked by a
+    writer (or by each other).
+
+    Entries can be given a time to live. They can also be invalidated
+    explicitly, e.g. for the projects which PyPI's changelog says have
+    changed since the last serial number seen (which can be recorded in the
+    store).
+
+    Projects which a locator found not to exist are recorded separately
+    (see :meth:`is_missing`), usually with a shorter time to live, so that
+    names which are never going to be found on an index (such as those of
+    private projects) needn't be looked up there every time.
+    """
+
+    def __init__(self, path=None, ttl=None, timeout=30.0, negative_ttl=None):
+        """
+        Initialise an instance.
+
+        :param path: The pathname of the database. If not specified,
+                     ``locator-store.db`` under :func:`get_cache_base` is
+                     used.
+        :param ttl: The number of seconds for which entries can be used, or
+                    ``None`` for no limit.
+        :param timeout: The number of seconds to wait for another process
+                        which is writing to the database.
+        :param negative_ttl: The number of seconds for which a record of a
+                             project not being found can be used. If
+                             ``None``, ``ttl`` applies. If zero, such records
+                             aren't kept.
+        """
+        if sqlite3 is None:  # pragma: no cover
+            raise DistlibException('sqlite3 is not available')
+        if path is None:
+            # Use native string to avoid issues on 2.x: see Python #20140.
+            path = os.path.join(get_cache_base(), str('locator-store.db'))
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        # Connections can't be shared between threads.
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS projects ('
+                         'source TEXT, name TEXT, data TEXT, stored REAL, '
+                         'PRIMARY KEY (source, name))')
+            conn.execute('CREATE TABLE IF NOT EXISTS info ('
+                         'key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS missing ('
+                         'source TEXT, name TEXT, stored REAL, '
+                         'PRIMARY KEY (source, name))')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """
+        Close the calling thread's connection to the database.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, source, name):
+        """
+        Get the data stored for a project, or ``None`` if there isn't any (or
+        it has expired).
+
+        :param source: Identifies the locator which produced the data (see
+                       :attr:`Locator.store_key`).
+        :param name: The name of the project.
+        """
+        row = self._connect().execute(
+            'SELECT data, stored FROM projects WHERE source = ? AND name = ?',
+            (source, normalize_name(name))).fetchone()
+        result = None
+        if row is not None:
+            data, stored = row
+            if self.ttl is None or time.time() - stored < self.ttl:
+                result = json.loads(data)
+        return result
+
+    def put(self, source, name, data):
+        """
+        Store the data for a project.
+
+        :param source: As for :meth:`get`.
+        :param name: The name of the project.
+        :param data: The data, which must be serializable as JSON.
+        """
+        name = normalize_name(name)
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO projects '
+                         '(source, name, data, stored) VALUES (?, ?, ?, ?)',
+                         (source, name, json.dumps(data), time.time()))
+            conn.execute('DELETE FROM missing WHERE source = ? AND name = ?',
+                         (source, name))
+
+    def is_missing(self, source, name):
+        """
+        Say whether a project was recorded by :meth:`put_missing` as not
+        having been found (and the record hasn't expired).
+
+        :param source: As for :meth:`get`.
+        :param name: The name of the project.
+        """
+        ttl = self.negative_ttl
+        if ttl is not None and ttl <= 0:
+            return False
+        row = self._connect().execute(
+            'SELECT stored FROM missing WHERE source = ? AND name = ?',
+            (source, normalize_name(name))).fetchone()
+        return row is not None and (ttl is None or
+                                    time.time() - row[0] < ttl)
+
+    def put_missing(self, source, name):
+        """
+        Record that a project wasn't found.
+
+        :param source: As for :meth:`get`.
+        :param name: The name of the project.
+        """
+        ttl = self.negative_ttl
+        if ttl is not None and ttl <= 0:
+            return
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO missing '
+                         '(source, name, stored) VALUES (?, ?, ?)',
+                         (source, normalize_name(name), time.time()))
+
+    @property
+    def serial(self):
+        """
+        The last serial number recorded by :meth:`invalidate`, or ``None``.
+        """
+        row = self._connect().execute(
+            "SELECT value FROM info WHERE key = 'serial'").fetchone()
+        return None if row is None else int(row[0])
+
+    def invalidate(self, names=None, serial=None):
+        """
+        Remove the entries for some projects.
+
+        :param names: The names of the projects to remove entries for, from
+                      all locators. If ``None``, all entries are removed.
+                      Records of projects not being found are removed too.
+        :param serial: If specified, the serial number up to which changes
+                       have been processed, which is recorded in the store.
+        """
+        with self._connect() as conn:
+            if names is None:
+                conn.execute('DELETE FROM projects')
+                conn.execute('DELETE FROM missing')
+            else:
+                names = [(normalize_name(n),) for n in set(names)]
+                conn.executemany('DELETE FROM projects WHERE name = ?', names)
+                conn.executemany('DELETE FROM missing WHERE name = ?', names)
+            if serial is not None:
+                conn.execute("INSERT OR REPLACE INTO info (key, value) "
+                             "VALUES ('serial', ?)", (str(serial),))
+
+
+class _Flight(object):
+    """
+    A call to :meth:`Locator.get_project` which is in progress, and whose
+    result can be waited for by other callers wanting the same project.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # The errors which occurred during the lookup, and whether the
+        # source said the project doesn't exist. These decide whether the
+        # result can be stored, without regard to any other lookups.
+        self.errors = []
+        self.not_found = False
+
+
+class _ErrorQueue(queue.Queue):
+    """
+    The queue holding a locator's errors. Each error put on it is also
+    recorded against the lookup being made by the thread which puts it, if
+    any (see :meth:`Locator.get_project`).
+    """
+    def __init__(self, local):
+        queue.Queue.__init__(self)
+        self._local = local
+
+    def put(self, item, block=True, timeout=None):
+        lookup = getattr(self._local, 'lookup', None)
+        if lookup is not None:
+            lookup.errors.append(item)
+        queue.Queue.put(self, item, block, timeout)
+
+
 class Locator(object):
     """
     A base class for locators - things that locate distributions.
@@ -96,24 +675,53 @@ class Locator(object):
 
     downloadable_extensions = source_extensions + ('.whl',)
 
-    def __init__(self, scheme='default'):
+    # The maximum number of threads used by locate_many() to locate
+    # distributions for different projects concurrently.
+    locate_workers = 10
+
+    # Whether a project which isn't found can be recorded as missing in a
+    # ProjectStore, so that it isn't looked up again until the record
+    # expires. This is only done for locators which use the network, and
+    # which can tell a project not existing from a failure to look it up.
+    cache_missing = False
+
+    def __init__(self, scheme='default', pool=None, cache=None, store=None):
         """
         Initialise an instance.
         :param scheme: Because locators look for most recent versions, they
                        need to know the version scheme to use. This specifies
                        the current PEP-recommended scheme - use ``'legacy'``
                        if you need to support existing distributions on PyPI.
-        """
-        self._cache = {}
+        :param pool: The :class:`~distlib.util.ConnectionPool` from which
+                     to reuse HTTP connections. If not specified, the
+                     default pool (shared by all locators) is used.
+        :param cache: The :class:`LocatorCache` (or compatible object) to
+                      hold the results of :meth:`get_project`. If not
+                      specified, an unbounded cache is used.
+        :param store: A :class:`ProjectStore` in which to keep the results of
+                      :meth:`get_project`, so that they can be shared with
+                      other processes.
+        """
+        if cache is None:
+            cache = LocatorCache()
+        self._cache = cache
+        self.store = store
+        # Calls to get_project in progress, keyed by name, so that concurrent
+        # calls for the same project share a single lookup.
+        self._flights = {}
+        self._flights_lock = threading.Lock()
         self.scheme = scheme
         # Because of bugs in some of the handlers on some of the platforms,
-        # we use our own opener rather than just using urlopen.
-        self.opener = build_opener(RedirectHandler())
+        # we use our own opener rather than just using urlopen. It keeps
+        # connections alive so that they can be reused for later requests.
+        self.opener = build_pooled_opener(RedirectHandler(), pool=pool)
         # If get_project() is called from locate(), the matcher instance
         # is set from the requirement passed to locate(). See issue #18 for
-        # why this can be useful to know.
+        # why this can be useful to know. It's held per thread, so that
+        # locate() can be called from several threads at once.
+        self._local = threading.local()
         self.matcher = None
-        self.errors = queue.Queue()
+        self.errors = _ErrorQueue(self._local)
 
     def get_errors(self):
         """
@@ -136,8 +744,18 @@ class Locator(object):
         # Just get the errors and throw them away
         self.get_errors()
 
+    def _set_not_found(self):
+        """
+        Note that the source said the project being looked up by the current
+        thread doesn't exist (see :attr:`cache_missing`).
+        """
+        lookup = getattr(self._local, 'lookup', None)
+        if lookup is not None:
+            lookup.not_found = True
+
     def clear_cache(self):
-        self._cache.clear()
+        if self._cache is not None:
+            self._cache.clear()
 
     def _get_scheme(self):
         return self._scheme
@@ -147,6 +765,14 @@ class Locator(object):
 
     scheme = property(_get_scheme, _set_scheme)
 
+    def _get_matcher(self):
+        return getattr(self._local, 'matcher', None)
+
+    def _set_matcher(self, value):
+        self._local.matcher = value
+
+    matcher = property(_get_matcher, _set_matcher)
+
     def _get_project(self, name):
         """
         For a given project, get a dictionary mapping available versions to Distribution
@@ -171,15 +797,168 @@ class Locator(object):
         instances.
 
         This calls _get_project to do all the work, and just implements a caching layer on top.
+        If the project is already being looked up by another thread, the
+        result of that lookup is waited for and returned, rather than the
+        project being looked up again.
+        """
+        cache = self._cache
+        with self._flights_lock:
+            if cache is not None:
+                result = cache.get(name)
+                if result is not None:
+                    return result
+            flight = self._flights.get(name)
+            leader = flight is None
+            if leader:
+                flight = self._flights[name] = _Flight()
+        if not leader:
+            logger.debug('Waiting for lookup of %s in progress', name)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        # The flight is the current thread's lookup, against which errors
+        # are recorded (the previous one is restored afterwards, in case
+        # this is a lookup made during another).
+        previous = getattr(self._local, 'lookup', None)
+        self._local.lookup = flight
+        try:
+            if cache is not None:
+                self.clear_errors()
+            result = self._get_stored_project(name)
+            if cache is not None:
+                cache.put(name, result)
+            flight.result = result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            self._local.lookup = previous
+            with self._flights_lock:
+                del self._flights[name]
+            flight.done.set()
+        return result
+
+    @property
+    def store_key(self):
+        """
+        A string which identifies the source of this locator's results in a
+        :class:`ProjectStore`: the name of its class, its version scheme and
+        its URL or directory, if it has one.
+        """
+        parts = [type(self).__name__, self.scheme]
+        source = getattr(self, 'base_url', getattr(self, 'base_dir', None))
+        if source:
+            parts.append(source)
+        return ' '.join(parts)
+
+    def _get_stored_project(self, name):
+        """
+        Get a project from the store, if there is one, falling back to
+        _get_project (and saving its result in the store).
+        """
+        store = self.store
+        if store is None:
+            return self._get_project(name)
+        key = self.store_key
+        if self.cache_missing and store.is_missing(key, name):
+            logger.debug('%s is known not to exist in %s', name, key)
+            return {'urls': {}, 'digests': {}}
+        data = store.get(key, name)
+        if data is not None:
+            try:
+                return self._result_from_data(data)
+            except Exception:  # pragma: no cover
+                logger.warning('Ignoring unusable stored data for %s', name,
+                               exc_info=True)
+        result = self._get_project(name)
+        # Don't store results which may be incomplete because of errors in
+        # this lookup.
+        if not self._local.lookup.errors:
+            if self.cache_missing and self._is_missing(result):
+                store.put_missing(key, name)
+            else:
+                data = self._result_to_data(result)
+                if data is not None:
+                    store.put(key, name, data)
+        return result
+
+    def _is_missing(self, result):
         """
-        if self._cache is None:
-            result = self._get_project(name)
-        elif name in self._cache:
-            result = self._cache[name]
-        else:
-            self.clear_errors()
-            result = self._get_project(name)
-            self._cache[name] = result
+        Say whether a result from _get_project, found without errors, means
+        that the project doesn't exist (see :attr:`cache_missing`). That's
+        only so if the source said so, using :meth:`_set_not_found`.
+        """
+        return self._local.lookup.not_found and not _has_versions(result)
+
+    def _result_to_data(self, result):
+        """
+        Convert a result from _get_project to data which can be serialized
+        as JSON, or return ``None`` if it can't be stored: for example, if
+        the metadata of some distributions is still to be loaded.
+        """
+        versions = {}
+        for k, dist in result.items():
+            if k in ('urls', 'digests'):
+                continue
+            if dist.metadata_loader is not None:
+                return None
+            d = {
+                'digest': dist.digest,
+                'download_urls': sorted(dist.download_urls),
+                'digests': dist.digests,
+            }
+            if dist._metadata is None and dist._metadata_args is not None:
+                # Don't create metadata which hasn't been needed yet.
+                d.update(name=dist.name, version=dist.version,
+                         source_url=dist.source_url)
+            else:
+                f = StringIO()
+                try:
+                    dist.metadata.write(fileobj=f)
+                except Exception:
+                    logger.debug('Not storing %s', dist, exc_info=True)
+                    return None
+                d['metadata'] = f.getvalue()
+            if 'exports' in vars(dist):
+                d['exports'] = dist.exports
+            versions[k] = d
+        return {
+            'versions': versions,
+            'urls': dict((k, sorted(v)) for k, v in
+                         result.get('urls', {}).items()),
+            'digests': result.get('digests', {}),
+        }
+
+    def _result_from_data(self, data):
+        """
+        Convert data saved by _result_to_data back to a result.
+        """
+        def digest(d):
+            return tuple(d) if d else d
+
+        result = {
+            'urls': dict((k, set(v)) for k, v in data['urls'].items()),
+            'digests': dict((k, digest(v)) for k, v in
+                            data['digests'].items()),
+        }
+        for version, d in data['versions'].items():
+            if 'metadata' in d:
+                md = Metadata(fileobj=StringIO(d['metadata']),
+                              scheme=self.scheme)
+                dist = Distribution(md)
+            else:
+                dist = make_dist(d['name'], d['version'], scheme=self.scheme,
+                                 lazy=True)
+                dist.source_url = d['source_url']
+            dist.locator = self
+            dist.digest = digest(d['digest'])
+            dist.download_urls = set(d['download_urls'])
+            dist.digests = dict((k, digest(v)) for k, v in
+                                d['digests'].items())
+            if 'exports' in d:
+                dist.exports = d['exports']
+            result[version] = dist
         return result
 
     def score_url(self, url):
@@ -232,10 +1011,6 @@ class Locator(object):
         If it is, a dictionary is returned with keys "name", "version",
         "filename" and "url"; otherwise, None is returned.
         """
-        def same_project(name1, name2):
-            return normalize_name(name1) == normalize_name(name2)
-
-        result = None
         scheme, netloc, path, params, query, frag = urlparse(url)
         if frag.lower().startswith('egg='):
             logger.debug('%s: version hint in fragment: %r',
@@ -248,9 +1023,31 @@ class Locator(object):
         origpath = path
         if path and path[-1] == '/':
             path = path[:-1]
-        if path.endswith('.whl'):
+        result = self.convert_filename_to_download_info(
+            posixpath.basename(path), project_name)
+        if result:
+            result['url'] = urlunparse((scheme, netloc, origpath,
+                                        params, query, ''))
+            if algo:
+                result['%s_digest' % algo] = digest
+        return result
+
+    def convert_filename_to_download_info(self, filename, project_name):
+        """
+        See if a filename is that of a suitable distribution archive for a
+        project.
+
+        If it is, a dictionary is returned with keys "name", "version" and
+        "filename" (and "python-version", if known); otherwise, None is
+        returned.
+        """
+        def same_project(name1, name2):
+            return normalize_name(name1) == normalize_name(name2)
+
+        result = None
+        if filename.endswith('.whl'):
             try:
-                wheel = Wheel(path)
+                wheel = Wheel(filename)
                 if is_compatible(wheel, self.wheel_tags):
                     if project_name is None:
                         include = True
@@ -261,15 +1058,13 @@ class Locator(object):
                             'name': wheel.name,
                             'version': wheel.version,
                             'filename': wheel.filename,
-                            'url': urlunparse((scheme, netloc, origpath,
-                                               params, query, '')),
                             'python-version': ', '.join(
                                 ['.'.join(list(v[2:])) for v in wheel.pyver]),
                         }
             except Exception as e:  # pragma: no cover
-                logger.warning('invalid path for wheel: %s', path)
-        elif path.endswith(self.downloadable_extensions):
-            path = filename = posixpath.basename(path)
+                logger.warning('invalid path for wheel: %s', filename)
+        elif filename.endswith(self.downloadable_extensions):
+            path = filename
             for ext in self.downloadable_extensions:
                 if path.endswith(ext):
                     path = path[:-len(ext)]
@@ -283,15 +1078,11 @@ class Locator(object):
                                 'name': name,
                                 'version': version,
                                 'filename': filename,
-                                'url': urlunparse((scheme, netloc, origpath,
-                                                   params, query, '')),
                                 #'packagetype': 'sdist',
                             }
                             if pyver:
                                 result['python-version'] = pyver
                     break
-        if result and algo:
-            result['%s_digest' % algo] = digest
         return result
 
     def _get_digest(self, info):
@@ -320,15 +1111,14 @@ class Locator(object):
         version = info.pop('version')
         if version in result:
             dist = result[version]
-            md = dist.metadata
         else:
-            dist = make_dist(name, version, scheme=self.scheme)
-            md = dist.metadata
+            # The metadata is only created if this version is actually used.
+            dist = make_dist(name, version, scheme=self.scheme, lazy=True)
         dist.digest = digest = self._get_digest(info)
         url = info['url']
         result['digests'][url] = digest
-        if md.source_url != info['url']:
-            md.source_url = self.prefer_url(md.source_url, url)
+        if dist.source_url != info['url']:
+            dist.source_url = self.prefer_url(dist.source_url, url)
             result['urls'].setdefault(version, set()).add(url)
         dist.locator = self
         result[version] = dist
@@ -355,30 +1145,21 @@ class Locator(object):
         logger.debug('matcher: %s (%s)', matcher, type(matcher).__name__)
         versions = self.get_project(r.name)
         if len(versions) > 2:   # urls and digests keys are present
-            # sometimes, versions are invalid
-            slist = []
-            vcls = matcher.version_class
-            for k in versions:
-                if k in ('urls', 'digests'):
-                    continue
+            # Look for the highest matching version, starting at the top.
+            slist = self._get_sorted_versions(r.name, versions, matcher)
+            for v, k in reversed(slist):
                 try:
-                    if not matcher.match(k):
+                    if not matcher.match(v):
                         logger.debug('%s did not match %r', matcher, k)
+                    elif prereleases or not v.is_prerelease:
+                        version = k
+                        result = versions[k]
+                        break
                     else:
-                        if prereleases or not vcls(k).is_prerelease:
-                            slist.append(k)
-                        else:
-                            logger.debug('skipping pre-release '
-                                         'version %s of %s', k, matcher.name)
+                        logger.debug('skipping pre-release '
+                                     'version %s of %s', k, matcher.name)
                 except Exception:  # pragma: no cover
                     logger.warning('error matching %s with %r', matcher, k)
-                    pass # slist.append(k)
-            if len(slist) > 1:
-                slist = sorted(slist, key=scheme.key)
-            if slist:
-                logger.debug('sorted list: %s', slist)
-                version = slist[-1]
-                result = versions[version]
         if result:
             if r.extras:
                 result.extras = r.extras
@@ -392,53 +1173,258 @@ class Locator(object):
         self.matcher = None
         return result
 
+    def _get_sorted_versions(self, name, versions, matcher):
+        """
+        Get the versions in a result of :meth:`get_project`, parsed for a
+        matcher and sorted in ascending order.
+
+        The list is kept with the result in the cache, for as long as the
+        result is cached and unchanged, so that locating several
+        requirements for a project (or the same requirement several times)
+        only parses its versions once.
+
+        :param name: The name of the project.
+        :param versions: A dictionary returned by :meth:`get_project`.
+        :param matcher: The :class:`~distlib.version.Matcher` instance
+                        which the versions will be matched against.
+        :return: A list of (version, key) tuples, where version is an
+                 instance of the matcher's version class and key is the
+                 corresponding key in ``versions``. Keys which aren't valid
+                 versions are omitted.
+        """
+        vcls = matcher.version_class
+        get_extra = getattr(self._cache, 'get_extra', None)
+        extra = None if get_extra is None else get_extra(name, versions)
+        if extra is not None:
+            entry = extra.get(vcls)
+            if entry is not None and entry[0] == len(versions):
+                return entry[1]
+        result = []
+        for k in versions:
+            if k in ('urls', 'digests'):
+                continue
+            try:
+                result.append((vcls(k), k))
+            except Exception:
+                logger.warning('error parsing version %r of %s', k,
+                               matcher.name)
+        # The sort is stable, so for equal versions the last one seen is
+        # still chosen, as when the keys were sorted.
+        result.sort(key=lambda t: t[0]._parts)
+        if extra is not None:
+            extra[vcls] = (len(versions), result)
+        return result
+
+    def locate_many(self, requirements, prereleases=False):
+        """
+        Find the most recent distributions which match several requirements.
+
+        Requirements are grouped by project, so that each project is looked
+        up only once, and different projects are looked up concurrently
+        using up to :attr:`locate_workers` threads.
+
+        :param requirements: An iterable of requirements, each as would be
+                             passed to :meth:`locate`.
+        :param prereleases: As for :meth:`locate`.
+        :return: A dictionary mapping each requirement to a
+                 :class:`Distribution` instance, or to ``None`` if no such
+                 distribution could be located.
+        """
+        groups = {}
+        for requirement in requirements:
+            r = parse_requirement(requirement)
+            if r is None:
+                raise DistlibException('Not a valid requirement: %r' %
+                                       requirement)
+            groups.setdefault(normalize_name(r.name), []).append(requirement)
+        result = {}
+        errors = []
+        work = queue.Queue()
+        for group in groups.values():
+            work.put(group)
+
+        def worker():
+            while True:
+                try:
+                    group = work.get(False)
+                except queue.Empty:
+                    break
+                for requirement in group:
+                    try:
+                        result[requirement] = self.locate(requirement,
+                                                          prereleases)
+                    except Exception as e:
+                        errors.append(e)
+                        return
+
+        num_workers = min(self.locate_workers, len(groups))
+        if num_workers <= 1:
+            worker()
+        else:
+            threads = []
+            for i in range(num_workers):
+                t = threading.Thread(target=worker)
+                t.daemon = True
+                t.start()
+                threads.append(t)
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+        return result
+
 
 class PyPIRPCLocator(Locator):
     """
     This locator uses XML-RPC to locate distributions. It therefore
     cannot be used with simple mirrors (that only mirror file content).
     """
-    def __init__(self, url, **kwargs):
+    cache_missing = True
+
+    def __init__(self, url, chunk_size=50, workers=1, **kwargs):
         """
         Initialise an instance.
 
         :param url: The URL to use for XML-RPC.
+        :param chunk_size: The number of releases whose URLs and data are
+                           fetched in a single XML-RPC multicall. If ``None``,
+                           or if the server doesn't support multicalls, a
+                           separate call is made for each.
+        :param workers: The number of chunks of releases which are fetched
+                        concurrently, each over its own connection.
         :param kwargs: Passed to the superclass constructor.
         """
         super(PyPIRPCLocator, self).__init__(**kwargs)
         self.base_url = url
+        self.chunk_size = chunk_size
+        self.workers = workers
         self.client = ServerProxy(url, timeout=3.0)
+        # A ServerProxy can't be used by more than one thread at a time, so
+        # idle ones are kept here (each keeping its connection alive) to be
+        # reused by later calls.
+        self._clients = [self.client]
+        self._clients_lock = threading.Lock()
+        self._multicall = True
+
+    def _get_client(self):
+        with self._clients_lock:
+            if self._clients:
+                return self._clients.pop()
+        return ServerProxy(self.base_url, timeout=3.0)
+
+    def _release_client(self, client):
+        with self._clients_lock:
+            self._clients.append(client)
 
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
-        return set(self.client.list_packages())
+        client = self._get_client()
+        try:
+            return set(client.list_packages())
+        finally:
+            self._release_client(client)
+
+    def _fetch(self, name, versions):
+        """
+        Fetch the URLs and data for some releases of a project, returning a
+        list of (version, urls, data) tuples.
+        """
+        client = self._get_client()
+        try:
+            if self.chunk_size and self._multicall:
+                multicall = xmlrpclib.MultiCall(client)
+                for v in versions:
+                    multicall.release_urls(name, v)
+                    multicall.release_data(name, v)
+                try:
+                    values = multicall()
+                except xmlrpclib.Fault as e:
+                    logger.debug('Multicalls not supported by %s: %s',
+                                 self.base_url, e)
+                    self._multicall = False
+                else:
+                    values = list(values)
+                    return [(v, values[2 * i], values[2 * i + 1])
+                            for i, v in enumerate(versions)]
+            return [(v, client.release_urls(name, v),
+                     client.release_data(name, v)) for v in versions]
+        finally:
+            self._release_client(client)
+
+    def _fetch_concurrently(self, name, chunks):
+        """
+        Fetch several chunks of releases at once, using up to
+        :attr:`workers` threads including the calling one.
+        """
+        outcomes = [None] * len(chunks)
+        todo = queue.Queue()
+        for i in range(len(chunks)):
+            todo.put(i)
+
+        def work():
+            while True:
+                try:
+                    i = todo.get(False)
+                except queue.Empty:
+                    break
+                try:
+                    outcomes[i] = (True, self._fetch(name, chunks[i]))
+                except Exception as e:
+                    outcomes[i] = (False, e)
+
+        threads = []
+        for i in range(min(self.workers, len(chunks)) - 1):
+            t = threading.Thread(target=work)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        work()
+        for t in threads:
+            t.join()
+        result = []
+        for ok, value in outcomes:
+            if not ok:
+                raise value
+            result.append(value)
+        return result
 
     def _get_project(self, name):
         result = {'urls': {}, 'digests': {}}
-        versions = self.client.package_releases(name, True)
-        for v in versions:
-            urls = self.client.release_urls(name, v)
-            data = self.client.release_data(name, v)
-            metadata = Metadata(scheme=self.scheme)
-            metadata.name = data['name']
-            metadata.version = data['version']
-            metadata.license = data.get('license')
-            metadata.keywords = data.get('keywords', [])
-            metadata.summary = data.get('summary')
-            dist = Distribution(metadata)
-            if urls:
-                info = urls[0]
-                metadata.source_url = info['url']
-                dist.digest = self._get_digest(info)
-                dist.locator = self
-                result[v] = dist
-                for info in urls:
-                    url = info['url']
-                    digest = self._get_digest(info)
-                    result['urls'].setdefault(v, set()).add(url)
-                    result['digests'][url] = digest
+        client = self._get_client()
+        try:
+            versions = client.package_releases(name, True)
+        finally:
+            self._release_client(client)
+        if not versions:
+            self._set_not_found()
+        n = self.chunk_size or 1
+        chunks = [versions[i:i + n] for i in range(0, len(versions), n)]
+        if self.workers > 1 and len(chunks) > 1:
+            fetched = self._fetch_concurrently(name, chunks)
+        else:
+            fetched = [self._fetch(name, chunk) for chunk in chunks]
+        for releases in fetched:
+            for v, urls, data in releases:
+                metadata = Metadata(scheme=self.scheme)
+                metadata.name = data['name']
+                metadata.version = data['version']
+                metadata.license = data.get('license')
+                metadata.keywords = data.get('keywords', [])
+                metadata.summary = data.get('summary')
+                dist = Distribution(metadata)
+                if urls:
+                    info = urls[0]
+                    metadata.source_url = info['url']
+                    dist.digest = self._get_digest(info)
+                    dist.locator = self
+                    result[v] = dist
+                    for info in urls:
+                        url = info['url']
+                        digest = self._get_digest(info)
+                        result['urls'].setdefault(v, set()).add(url)
+                        result['digests'][url] = digest
         return result
 
 class PyPIJSONLocator(Locator):
@@ -446,6 +1432,12 @@ class PyPIJSONLocator(Locator):
     This locator uses PyPI's JSON interface. It's very limited in functionality
     and probably not worth using.
     """
+    # The keys kept from the dictionaries describing the files of each
+    # release, which are all that's needed to build the result.
+    file_info_keys = ('url', 'sha256_digest', 'md5_digest')
+
+    cache_missing = True
+
     def __init__(self, url, **kwargs):
         super(PyPIJSONLocator, self).__init__(**kwargs)
         self.base_url = ensure_slash(url)
@@ -456,13 +1448,28 @@ class PyPIJSONLocator(Locator):
         """
         raise NotImplementedError('Not available from this locator')
 
+    def _reduce_file_info(self, d):
+        """
+        Called for each object decoded from a JSON response. The dictionaries
+        describing the files of each release, of which there are many for a
+        large project, are reduced to the keys which are used as soon as
+        they're decoded, so that the response needs much less memory.
+        """
+        if 'url' in d and 'filename' in d:
+            d = dict((k, d[k]) for k in self.file_info_keys if k in d)
+        return d
+
     def _get_project(self, name):
         result = {'urls': {}, 'digests': {}}
         url = urljoin(self.base_url, '%s/json' % quote(name))
         try:
             resp = self.opener.open(url)
-            data = resp.read().decode() # for now
-            d = json.loads(data)
+            try:
+                data = resp.read()
+            finally:
+                resp.close()
+            d = json.loads(data.decode('utf-8'),
+                           object_hook=self._reduce_file_info)
             md = Metadata(scheme=self.scheme)
             data = d['info']
             md.name = data['name']
@@ -480,14 +1487,13 @@ class PyPIJSONLocator(Locator):
                 dist.digests[url] = self._get_digest(info)
                 result['urls'].setdefault(md.version, set()).add(url)
                 result['digests'][url] = self._get_digest(info)
-            # Now get other releases
+            # Now get other releases. Their metadata is only created if
+            # they're used.
             for version, infos in d['releases'].items():
                 if version == md.version:
                     continue    # already done
-                omd = Metadata(scheme=self.scheme)
-                omd.name = md.name
-                omd.version = version
-                odist = Distribution(omd)
+                odist = make_dist(md.name, version, scheme=self.scheme,
+                                  lazy=True)
                 odist.locator = self
                 result[version] = odist
                 for info in infos:
@@ -504,40 +1510,224 @@ class PyPIJSONLocator(Locator):
 #                    url = info['url']
 #                    result['urls'].setdefault(md.version, set()).add(url)
 #                    result['digests'][url] = self._get_digest(info)
+        except HTTPError as e:
+            # A 404 means there's no such project, which isn't an error.
+            if e.code == 404:
+                self._set_not_found()
+            else:
+                self.errors.put(text_type(e))
+                logger.exception('JSON fetch failed: %s', e)
         except Exception as e:
             self.errors.put(text_type(e))
             logger.exception('JSON fetch failed: %s', e)
         return result
 
 
+class LinkExtractor(object):
+    """
+    An incremental extractor of links from HTML. Text is passed to
+    :meth:`feed` in chunks as it becomes available, and the links found in
+    each chunk are returned as ``(url, rel)`` tuples, where ``url`` has been
+    made absolute and ``rel`` is the value of the tag's "rel" attribute (or
+    an empty string). The first ``<base>`` tag seen sets the base URL for
+    the whole page: any links found before it (which is unusual) are
+    resolved again, and those which change are returned again along with
+    the links after it. All the links found so far are available in the
+    ``links`` attribute.
+
+    Links which declare that the core metadata of the file they link to is
+    available separately (see PEPs 658 and 714) are recorded in the
+    ``metadata`` attribute, which maps the link URL to the hashes of the
+    metadata file (a possibly empty dictionary mapping hash algorithm to
+    digest).
+    """
+    # A tag, whose attribute values can be declared with double quotes,
+    # single quotes or no quotes.
+    _tag = re.compile(r"""<([a-z][a-z0-9]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""",
+                      re.I | re.S)
+    _attr = re.compile(r"""(?:^|(?<=\s))"""
+                       r"""(href|rel|data-(?:core|dist-info)-metadata)"""
+                       r"""\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""",
+                       re.I)
+    _clean_re = re.compile(r'[^a-z0-9$&+,/:;=?@.#%_\\|-]', re.I)
+
+    # Index pages can have tens of thousands of links, and urljoin() is the
+    # most expensive part of dealing with each one. Most links take one of
+    # two simple forms, which can be resolved more cheaply: absolute URLs
+    # which urljoin() would return unchanged, and relative ones with dot
+    # segments only at the start (e.g. '../../packages/...'), which resolve
+    # to the leading part resolved against the base URL (cached), plus the
+    # rest.
+    _plain_absolute = re.compile(r'https?://[^/?#;\s]+[^?#;\s]*'
+                                 r'(?:\?[^#\s]+)?(?:#\S+)?$')
+    _plain_relative = re.compile(r'((?:\.\.?/)*)(?![./?#])'
+                                 r'([^?#;:\s]*(?:\?[^#\s]+)?(?:#\S+)?)$')
+
+    def __init__(self, url):
+        """
+        Initialise an instance with the URL of the page being read.
+        """
+        self.base_url = self.url = url
+        self._seen_base = False
+        self._pending = ''
+        self._joined = {}
+        # (position in links, URL as given) for the links found before any
+        # <base> tag, in case one follows
+        self._unbased = []
+        self.links = []
+        self.metadata = {}
+
+    def feed(self, data):
+        """
+        Extract links from the next chunk of a page.
+
+        :param data: The chunk of text.
+        :return: A list of ``(url, rel)`` tuples for the links found.
+        """
+        data = self._pending + data
+        # Anything from the last '<' on may be a tag which hasn't been
+        # completely received yet, so hold it back until the next chunk.
+        i = data.rfind('<')
+        if i < 0:
+            self._pending = ''
+            return []
+        self._pending = data[i:]
+        return self._extract(data, 0, i)
+
+    def close(self):
+        """
+        Extract links from any remaining text, at the end of a page.
+
+        :return: A list of ``(url, rel)`` tuples for the links found.
+        """
+        data, self._pending = self._pending, ''
+        result = self._extract(data, 0, len(data))
+        self._unbased = []
+        return result
+
+    def _extract(self, data, pos, endpos):
+        result = []
+        for m in self._tag.finditer(data, pos, endpos):
+            attrs = m.group(2)
+            if 'href' not in attrs.lower():
+                continue
+            url = rel = metadata = None
+            for am in self._attr.finditer(attrs):
+                value = am.group(2)
+                if value is None:
+                    value = am.group(3)
+                    if value is None:
+                        value = am.group(4)
+                name = am.group(1).lower()
+                if name == 'href':
+                    if url is None:
+                        url = value
+                elif name == 'rel':
+                    if rel is None:
+                        rel = value
+                elif metadata is None:
+                    metadata = value
+            if url is None:
+                continue
+            if m.group(1).lower() == 'base':
+                if not self._seen_base:
+                    self._seen_base = True
+                    self.base_url = url
+                    self._joined.clear()
+                    result.extend(self._rebase())
+                continue
+            if not self._seen_base:
+                self._unbased.append((len(self.links), url))
+            url = self._normalise(url)
+            if metadata and metadata.lower() != 'false':
+                hashes = {}
+                if '=' in metadata:
+                    algo, digest = metadata.split('=', 1)
+                    hashes[algo] = digest
+                self.metadata[url] = hashes
+            link = (url, rel or '')
+            self.links.append(link)
+            result.append(link)
+        return result
+
+    def _rebase(self):
+        """
+        Resolve the links found before the ``<base>`` tag against the new
+        base URL, returning those which have changed.
+        """
+        result = []
+        for i, url in self._unbased:
+            old, rel = self.links[i]
+            url = self._normalise(url)
+            if url != old:
+                link = self.links[i] = (url, rel)
+                hashes = self.metadata.pop(old, None)
+                if hashes is not None:
+                    self.metadata[url] = hashes
+                result.append(link)
+        self._unbased = []
+        return result
+
+    def _join(self, url):
+        """
+        Resolve a link URL against the base URL, as urljoin() does.
+        """
+        if self._plain_absolute.match(url):
+            return url
+        m = self._plain_relative.match(url)
+        if not m or not url:
+            return urljoin(self.base_url, url)
+        prefix, rest = m.groups()
+        if '/.' in rest or '//' in rest:
+            return urljoin(self.base_url, url)
+        base = self._joined.get(prefix)
+        if base is None:
+            base = self._joined[prefix] = urljoin(self.base_url,
+                                                  prefix or './')
+        return base + rest
+
+    def _normalise(self, url):
+        """
+        Make a link URL absolute and remove any HTML escaping or characters
+        which aren't allowed in it.
+        """
+        url = self._join(url)
+        if '&' in url:
+            url = unescape(url)
+        if self._clean_re.search(url):
+            url = self._clean_re.sub(lambda m: '%%%2x' % ord(m.group(0)), url)
+        return url
+
+
 class Page(object):
     """
     This class represents a scraped HTML page.
     """
-    # The following slightly hairy-looking regex just looks for the contents of
-    # an anchor link, which has an attribute "href" either immediately preceded
-    # or immediately followed by a "rel" attribute. The attribute values can be
-    # declared with double quotes, single quotes or no quotes - which leads to
-    # the length of the expression.
-    _href = re.compile("""
-(rel\s*=\s*(?:"(?P<rel1>[^"]*)"|'(?P<rel2>[^']*)'|(?P<rel3>[^>\s\n]*))\s+)?
-href\s*=\s*(?:"(?P<url1>[^"]*)"|'(?P<url2>[^']*)'|(?P<url3>[^>\s\n]*))
-(\s+rel\s*=\s*(?:"(?P<rel4>[^"]*)"|'(?P<rel5>[^']*)'|(?P<rel6>[^>\s\n]*)))?
-""", re.I | re.S | re.X)
-    _base = re.compile(r"""<base\s+href\s*=\s*['"]?([^'">]+)""", re.I | re.S)
-
-    def __init__(self, data, url):
+    def __init__(self, data, url, extractor=None):
         """
         Initialise an instance with the Unicode page contents and the URL they
-        came from.
+        came from. If the links have already been extracted from the contents
+        (e.g. while the page was being downloaded), the
+        :class:`LinkExtractor` which did so can be passed, to avoid doing it
+        again.
         """
         self.data = data
-        self.base_url = self.url = url
-        m = self._base.search(self.data)
-        if m:
-            self.base_url = m.group(1)
+        self.url = url
+        if extractor is None:
+            extractor = LinkExtractor(url)
+            extractor.feed(data)
+            extractor.close()
+        self._links = extractor.links
+        self.base_url = extractor.base_url
+        self.metadata = extractor.metadata
+        self.files = self.projects = None
 
-    _clean_re = re.compile(r'[^a-z0-9$&+,/:;=?@.#%_\\|-]', re.I)
+    def iter_links(self):
+        """
+        Return an iterator over the ``(url, rel)`` tuples for the links on the
+        page, in the order in which they appear (and including duplicates).
+        """
+        return iter(self._links)
 
     @cached_property
     def links(self):
@@ -546,27 +1736,401 @@ href\s*=\s*(?:"(?P<url1>[^"]*)"|'(?P<url2>[^']*)'|(?P<url3>[^>\s\n]*))
         about their "rel" attribute, for determining which ones to treat as
         downloads and which ones to queue for further scraping.
         """
-        def clean(url):
-            "Tidy up an URL."
-            scheme, netloc, path, params, query, frag = urlparse(url)
-            return urlunparse((scheme, netloc, quote(path),
-                               params, query, frag))
-
-        result = set()
-        for match in self._href.finditer(self.data):
-            d = match.groupdict('')
-            rel = (d['rel1'] or d['rel2'] or d['rel3'] or
-                   d['rel4'] or d['rel5'] or d['rel6'])
-            url = d['url1'] or d['url2'] or d['url3']
-            url = urljoin(self.base_url, url)
-            url = unescape(url)
-            url = self._clean_re.sub(lambda m: '%%%2x' % ord(m.group(0)), url)
-            result.add((url, rel))
         # We sort the result, hoping to bring the most recent versions
         # to the front
-        result = sorted(result, key=lambda t: t[0], reverse=True)
+        return sorted(set(self._links), key=lambda t: t[0], reverse=True)
+
+
+class JSONPage(Page):
+    """
+    This class represents a page from the JSON form of the "simple" index API
+    (see PEP 691). Rather than links, such pages have a ``files`` list of
+    dictionaries (with keys "filename" and "url", and optionally "hashes",
+    "requires-python" and "yanked"), or a ``projects`` list of names for the
+    root page of an index. File entries may also have a "core-metadata" (or
+    "dist-info-metadata") key, saying that the file's metadata is available
+    separately (see PEPs 658 and 714).
+    """
+    def __init__(self, data, url):
+        """
+        Initialise an instance with the Unicode page contents and the URL they
+        came from.
+        """
+        self.data = data
+        self.base_url = self.url = url
+        d = json.loads(data)
+        version = d.get('meta', {}).get('api-version', '1.0')
+        if version.split('.')[0] != '1':
+            raise ValueError('Unsupported API version %s: %s' % (version, url))
+        self.files = []
+        for entry in d.get('files', ()):
+            entry = dict(entry)
+            entry['url'] = urljoin(url, entry['url'])
+            self.files.append(entry)
+        self.projects = [p['name'] for p in d.get('projects', ())]
+        self._links = []
+        self.metadata = {}
+
+
+class _ValidatedCache(Cache):
+    """
+    The base of the persistent caches used by :class:`SimpleScrapingLocator`,
+    which keep pages (or what's been extracted from them) together with the
+    validators sent by the server, so that a page older than the freshness
+    TTL can be revalidated with a conditional request.
+    """
+
+    # The extension of the files holding the entries.
+    suffix = None
+
+    def __init__(self, base, ttl):
+        super(_ValidatedCache, self).__init__(base)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.base, key + self.suffix)
+
+    def is_fresh(self, entry):
+        """
+        Say whether an entry can be used without revalidation.
+        """
+        return (time.time() - entry['time']) < self.ttl
+
+    def add_validators(self, entry, headers):
+        """
+        Add conditional request headers for an entry to a header dictionary.
+        """
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+
+class PageCache(_ValidatedCache):
+    """
+    A persistent cache for pages fetched by :class:`SimpleScrapingLocator`.
+    Each entry holds the decoded page together with any validators (the
+    ``ETag`` and ``Last-Modified`` response headers) sent by the server, so
+    that once an entry is older than the freshness TTL it can be revalidated
+    with a conditional request rather than fetched again in full.
+    """
+
+    suffix = '.json'
+
+    def __init__(self, base=None, ttl=600):
+        """
+        Initialise an instance.
+
+        :param base: The directory to hold the cache. If not specified, a
+                     ``page-cache`` directory under :func:`get_cache_base` is
+                     used.
+        :param ttl: The number of seconds for which an entry is considered
+                    fresh, i.e. can be used without asking the server.
+        """
+        if base is None:
+            # Use native string to avoid issues on 2.x: see Python #20140.
+            base = os.path.join(get_cache_base(), str('page-cache'))
+        super(PageCache, self).__init__(base, ttl)
+        self.hits = 0           # served from the cache without a request
+        self.revalidated = 0    # served from the cache after a 304
+        self.misses = 0         # fetched from the server in full
+
+    @property
+    def stats(self):
+        """
+        Return a dictionary of counters describing cache effectiveness.
+        """
+        return {
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses,
+        }
+
+    def _record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, url):
+        """
+        Get the cache entry for an URL.
+
+        :param url: The URL of the page.
+        :return: A dictionary with keys ``url``, ``data``, ``content_type``,
+                 ``etag``, ``last_modified`` and ``time``, or ``None`` if
+                 there's no usable entry for the URL.
+        """
+        path = self._path(url)
+        result = None
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    result = json.loads(f.read().decode('utf-8'))
+            except Exception:  # pragma: no cover
+                logger.warning('Ignoring unreadable cache entry for %s', url,
+                               exc_info=True)
+        return result
+
+    def put(self, url, entry):
+        """
+        Store a cache entry for an URL, stamping it with the current time.
+
+        :param url: The URL of the page.
+        :param entry: The entry, as returned by :meth:`get`.
+        """
+        entry['time'] = time.time()
+        try:
+            _write_file(self._path(url), [json.dumps(entry).encode('utf-8')])
+        except Exception:  # pragma: no cover
+            logger.warning('Unable to cache %s', url, exc_info=True)
+
+
+class NameIndex(_ValidatedCache):
+    """
+    A persistent list of the project names on the root pages of indexes, for
+    use by :class:`SimpleScrapingLocator`. The names from each page are kept
+    in a file, sorted by their normalised form (see PEP 503) and preceded by
+    a header holding the page's validators and the keys and offsets of every
+    :attr:`stride`-th name. A name or prefix is found using a binary search
+    of these keys, after which only a few lines of the file need to be read,
+    so a list with hundreds of thousands of names needn't be loaded into
+    memory to look things up in it.
+    """
+
+    # One name in this many has its key and offset in the header.
+    stride = 64
+
+    suffix = '.names'
+
+    def __init__(self, base=None, ttl=3600):
+        """
+        Initialise an instance.
+
+        :param base: The directory to hold the lists. If not specified, a
+                     ``name-index`` directory under :func:`get_cache_base` is
+                     used.
+        :param ttl: The number of seconds for which a list is considered
+                    fresh, i.e. can be used without asking the server.
+        """
+        if base is None:
+            # Use native string to avoid issues on 2.x: see Python #20140.
+            base = os.path.join(get_cache_base(), str('name-index'))
+        super(NameIndex, self).__init__(base, ttl)
+        self._headers = {}  # path -> ((mtime, size), header, data offset)
+
+    def get(self, url):
+        """
+        Get the header of the list of names for an URL.
+
+        :param url: The URL of the index's root page.
+        :return: A dictionary with keys ``url``, ``etag``,
+                 ``last_modified``, ``count`` and ``time``, or ``None`` if
+                 there's no usable list for the URL.
+        """
+        result = self._load(url)
+        if result is not None:
+            result = dict((k, v) for k, v in result[0].items()
+                          if k not in ('keys', 'offsets'))
         return result
 
+    def _load(self, url):
+        """
+        Return the header of a list and the offset of its first name, reading
+        them from the file only if it's changed since it was last read.
+        """
+        path = self._path(url)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime, st.st_size)
+        with self._lock:
+            cached = self._headers.get(path)
+        if cached is not None and cached[0] == stamp:
+            header, offset = cached[1], cached[2]
+        else:
+            try:
+                with open(path, 'rb') as f:
+                    line = f.readline()
+                header = json.loads(line.decode('utf-8'))
+                offset = len(line)
+            except Exception:  # pragma: no cover
+                logger.warning('Ignoring unreadable name list for %s', url,
+                               exc_info=True)
+                return None
+            with self._lock:
+                self._headers[path] = (stamp, header, offset)
+        header = dict(header, time=stamp[0])
+        return header, offset
+
+    def put(self, url, names, etag=None, last_modified=None):
+        """
+        Store the list of names for an URL.
+
+        :param url: The URL of the index's root page.
+        :param names: The names on the page. Names which are the same when
+                      normalised are only kept once.
+        :param etag: The value of the page's ``ETag`` header, if any.
+        :param last_modified: The value of the page's ``Last-Modified``
+                              header, if any.
+        """
+        entries = {}
+        for name in names:
+            entries.setdefault(normalize_name(name), name)
+        keys = []
+        offsets = []
+        lines = []
+        pos = 0
+        for i, key in enumerate(sorted(entries)):
+            name = entries[key]
+            line = key if name == key else '%s\t%s' % (key, name)
+            line = (line + '\n').encode('utf-8')
+            if i % self.stride == 0:
+                keys.append(key)
+                offsets.append(pos)
+            lines.append(line)
+            pos += len(line)
+        header = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'count': len(lines),
+            'keys': keys,
+            'offsets': offsets,
+        }
+        lines.insert(0, json.dumps(header).encode('utf-8') + b'\n')
+        try:
+            _write_file(self._path(url), lines)
+        except Exception:  # pragma: no cover
+            logger.warning('Unable to save names for %s', url, exc_info=True)
+
+    def touch(self, url):
+        """
+        Mark the list for an URL as fresh, e.g. after the server has said
+        that the page hasn't changed.
+        """
+        os.utime(self._path(url), None)
+
+    def _iter_entries(self, url, start=None):
+        """
+        Yield ``(key, name)`` tuples from the list for an URL, in order,
+        starting with the block of names in which ``start`` would be.
+        """
+        loaded = self._load(url)
+        if loaded is None:
+            return
+        header, offset = loaded
+        if start is None:
+            i = 0
+        else:
+            i = max(bisect_right(header['keys'], start) - 1, 0)
+        if header['offsets']:
+            offset += header['offsets'][i]
+        with open(self._path(url), 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                line = line.decode('utf-8').rstrip('\n')
+                key, _, name = line.partition('\t')
+                yield key, name or key
+
+    def iter_names(self, url):
+        """
+        Yield the names in the list for an URL, in order of their normalised
+        forms.
+        """
+        for key, name in self._iter_entries(url):
+            yield name
+
+    def lookup(self, url, name):
+        """
+        Find a name in the list for an URL.
+
+        :param url: The URL of the index's root page.
+        :param name: The name to look for. It's normalised before looking.
+        :return: The name as it appears in the list, or ``None`` if it isn't
+                 there.
+        """
+        key = normalize_name(name)
+        for k, result in self._iter_entries(url, key):
+            if k == key:
+                return result
+            if k > key:
+                break
+        return None
+
+    def iter_prefix(self, url, prefix):
+        """
+        Yield the names in the list for an URL whose normalised forms start
+        with the normalised form of a prefix, in order of their normalised
+        forms.
+        """
+        prefix = normalize_name(prefix)
+        for key, name in self._iter_entries(url, prefix):
+            if key.startswith(prefix):
+                yield name
+            elif key > prefix:
+                break
+
+
+class _ScrapeJob(object):
+    """
+    The state for scraping a single project. Keeping this separate from the
+    locator allows the locator's worker threads to scrape several projects
+    at once.
+    """
+    def __init__(self, project_name):
+        self.project_name = project_name
+        self.result = {'urls': {}, 'digests': {}}
+        self.seen = set()
+        # Maps download URLs to the hashes of separately available metadata
+        self.metadata = {}
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.done = threading.Event()
+        # The errors which occurred while scraping, which the locator's
+        # worker threads record here (see _ErrorQueue).
+        self.errors = []
+
+    def task_done(self):
+        """
+        Note that an URL queued for this job has been dealt with. When there
+        are no more outstanding URLs, the job is done.
+        """
+        with self.lock:
+            self.pending -= 1
+            if self.pending == 0:
+                self.done.set()
+
+
+class _DeflateDecoder(object):
+    """
+    An incremental decoder for the "deflate" Content-Encoding. That should be
+    zlib-wrapped data, but some servers send raw deflate data instead, so we
+    fall back to that if the data doesn't start with a zlib header.
+    """
+    def __init__(self):
+        self._obj = zlib.decompressobj()
+        self._data = b''    # what we've seen, until we know the format
+
+    def decompress(self, data):
+        if self._data is None:
+            return self._obj.decompress(data)
+        self._data += data
+        try:
+            result = self._obj.decompress(data)
+            if result:
+                self._data = None
+            return result
+        except zlib.error:
+            data, self._data = self._data, None
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._obj.decompress(data)
+
+    def flush(self):
+        return self._obj.flush()
+
 
 class SimpleScrapingLocator(Locator):
     """
@@ -575,82 +2139,242 @@ class SimpleScrapingLocator(Locator):
     as pip's PackageFinder, which works in an analogous fashion.
     """
 
-    # These are used to deal with various Content-Encoding schemes.
+    # These are used to deal with various Content-Encoding schemes. Each maps
+    # to a callable returning an incremental decoder (with decompress() and
+    # flush() methods), or None if no decoding is needed.
     decoders = {
-        'deflate': zlib.decompress,
-        'gzip': lambda b: gzip.GzipFile(fileobj=BytesIO(d)).read(),
-        'none': lambda b: b,
+        'deflate': _DeflateDecoder,
+        'gzip': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+        'x-gzip': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+        'identity': None,
+        'none': None,
     }
 
-    def __init__(self, url, timeout=None, num_workers=10, **kwargs):
+    # Response bodies are read (and decompressed) in chunks of this size.
+    chunk_size = 16384
+
+    # The Accept header sent when the JSON index API is wanted. The HTML
+    # forms are acceptable, but less preferred.
+    json_accept = ('application/vnd.pypi.simple.v1+json, '
+                   'application/vnd.pypi.simple.v1+html;q=0.2, '
+                   'text/html;q=0.1')
+
+    cache_missing = True
+
+    # Worker threads which have had nothing to do for this many seconds exit.
+    # They are started again as needed, so that bursts of lookups (e.g. during
+    # dependency resolution) reuse the same threads, while idle locators don't
+    # hold on to them.
+    worker_idle_timeout = 5.0
+
+    def __init__(self, url, timeout=None, num_workers=10, page_cache=None,
+                 max_per_host=None, compress=False, json_api=True,
+                 wheel_metadata=False, mirrors=None, health=None,
+                 name_index=None, **kwargs):
         """
         Initialise an instance.
         :param url: The root URL to use for scraping.
         :param timeout: The timeout, in seconds, to be applied to requests.
                         This defaults to ``None`` (no timeout specified).
         :param num_workers: The number of worker threads you want to do I/O,
-                            This defaults to 10.
+                            This defaults to 10. The workers are shared by
+                            all projects being scraped at any one time.
+        :param page_cache: If specified, a :class:`PageCache` instance used
+                           to persist fetched pages across locator instances
+                           and processes. This defaults to ``None`` (pages
+                           are only cached in memory).
+        :param max_per_host: If specified, the maximum number of requests
+                             which may be in flight to any single host. This
+                             defaults to ``None`` (limited only by
+                             ``num_workers``).
+        :param compress: If ``True``, ask servers to send pages compressed
+                         (using gzip or deflate), and decompress them as
+                         they're received. This defaults to ``False``.
+        :param json_api: If ``True`` (the default), ask servers for the JSON
+                         form of the index API (see PEP 691), and use the
+                         file details from it directly. HTML pages are
+                         still handled, for servers which don't support it.
+        :param wheel_metadata: If ``True``, the metadata of wheels which
+                               isn't available separately from the index is
+                               read from the wheels when needed, using HTTP
+                               range requests rather than downloading them.
+                               This defaults to ``False``.
+        :param mirrors: If specified, a list of the root URLs of mirrors of
+                        the index at ``url``. Each page of the index is
+                        fetched from whichever of them is healthiest and
+                        fastest, failing over to the others.
+        :param health: The :class:`HostHealth` instance used to track the
+                       health of the hosts requests are made to, which can
+                       be shared with other locators. If not specified, a
+                       new one is used.
+        :param name_index: If specified, a :class:`NameIndex` instance used
+                           to keep the names of the projects on the index
+                           across locator instances and processes. This
+                           defaults to ``None`` (the names are fetched from
+                           the index whenever they're needed).
         :param kwargs: Passed to the superclass.
         """
         super(SimpleScrapingLocator, self).__init__(**kwargs)
         self.base_url = ensure_slash(url)
+        self.mirrors = [ensure_slash(u) for u in mirrors or ()]
+        if health is None:
+            health = HostHealth()
+        self.health = health
         self.timeout = timeout
+        self.page_cache = page_cache
+        self.name_index = name_index
         self._page_cache = {}
-        self._seen = set()
+        # The URLs in _page_cache which the server said don't exist, and
+        # those which couldn't be fetched.
+        self._not_found = set()
+        self._failed = set()
         self._to_fetch = queue.Queue()
-        self._bad_hosts = set()
         self.skip_externals = False
         self.num_workers = num_workers
+        self.max_per_host = max_per_host
+        self._host_slots = {}
+        self._threads = []
+        self._active_jobs = 0   # the number of scrapes in progress
+        self.compress = compress
+        self.json_api = json_api
+        self.wheel_metadata = wheel_metadata
+        # Counters for measuring the effect of compression: bytes received
+        # (the response bodies as sent), bytes after decoding, and the time
+        # spent decoding.
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.decode_time = 0.0
+        # This lock coordinates our internal threads - the ones created in
+        # _prepare_threads. The per-project state is held in _ScrapeJob
+        # instances, so several projects can be scraped at once (e.g. when
+        # the locator is used from several threads - see issue #45).
         self._lock = threading.RLock()
-        # See issue #45: we need to be resilient when the locator is used
-        # in a thread, e.g. with concurrent.futures. We can't use self._lock
-        # as it is for coordinating our internal threads - the ones created
-        # in _prepare_threads.
-        self._gplock = threading.RLock()
 
     def _prepare_threads(self):
         """
-        Threads are created only when get_project is called, and terminate
-        before it returns. They are there primarily to parallelise I/O (i.e.
-        fetching web pages).
+        Make sure the worker threads are running. Threads are created when
+        there's work to do and exit after being idle for a while. They are
+        there primarily to parallelise I/O (i.e. fetching web pages).
+
+        This must be called with ``self._lock`` held.
         """
-        self._threads = []
-        for i in range(self.num_workers):
+        while len(self._threads) < self.num_workers:
             t = threading.Thread(target=self._fetch)
-            t.setDaemon(True)
-            t.start()
+            t.daemon = True
             self._threads.append(t)
+            t.start()
 
-    def _wait_threads(self):
+    def _enqueue(self, url, job):
         """
-        Tell all the threads to terminate (by sending a sentinel value) and
-        wait for them to do so.
+        Queue an URL to be fetched on behalf of a project scrape.
         """
-        # Note that you need two loops, since you can't say which
-        # thread will get each sentinel
-        for t in self._threads:
-            self._to_fetch.put(None)    # sentinel
-        for t in self._threads:
-            t.join()
-        self._threads = []
+        with job.lock:
+            job.pending += 1
+        logger.debug('Queueing %s', url)
+        with self._lock:
+            # Done under the lock, so that a worker can't decide to exit
+            # (because the queue is empty) without a replacement being started.
+            self._to_fetch.put((url, job))
+            self._prepare_threads()
 
     def _get_project(self, name):
-        result = {'urls': {}, 'digests': {}}
-        with self._gplock:
-            self.result = result
-            self.project_name = name
-            url = urljoin(self.base_url, '%s/' % quote(name))
-            self._seen.clear()
-            self._page_cache.clear()
-            self._prepare_threads()
+        job = _ScrapeJob(name)
+        url = urljoin(self.base_url, '%s/' % quote(name))
+        with self._lock:
+            # The pages fetched are only kept while they may be of use to
+            # scrapes in progress, so they're discarded when a scrape starts
+            # while no others are running.
+            if not self._active_jobs:
+                self._page_cache.clear()
+                self._not_found.clear()
+                self._failed.clear()
+            self._active_jobs += 1
+        try:
+            self._enqueue(url, job)
+            job.done.wait()
+            # The errors recorded by the workers for the job count against
+            # the current thread's lookup, and the project is only taken
+            # not to exist if the index said its page doesn't.
+            lookup = getattr(self._local, 'lookup', None)
+            if lookup is not None:
+                lookup.errors.extend(job.errors)
+            if url in self._not_found:
+                self._set_not_found()
+        finally:
+            with self._lock:
+                self._active_jobs -= 1
+        if job.metadata or self.wheel_metadata:
+            self._add_metadata_loaders(job)
+        return job.result
+
+    def _add_metadata_loaders(self, job):
+        """
+        Arrange for the metadata of each distribution found by a job to be
+        fetched when needed, if it's available separately from the archives
+        (or, if ``wheel_metadata`` is set, from a wheel).
+        """
+        result = job.result
+        for version, dist in result.items():
+            if version in ('urls', 'digests'):
+                continue
+            urls = [dist.source_url]
+            urls.extend(sorted(result['urls'].get(version, ())))
+            for url in urls:
+                if url in job.metadata:
+                    dist.metadata_loader = self._make_metadata_loader(
+                        url, job.metadata[url])
+                    break
+            else:
+                wheels = [u for u in urls if u and u.endswith('.whl') and
+                          u.startswith(('http://', 'https://'))]
+                if self.wheel_metadata and wheels:
+                    dist.metadata_loader = self._make_wheel_metadata_loader(
+                        wheels[0])
+
+    def _make_wheel_metadata_loader(self, url):
+        """
+        Return a callable which completes a distribution's metadata from that
+        in the wheel at an URL, read using HTTP range requests.
+        """
+        def load_metadata(dist):
             try:
-                logger.debug('Queueing %s', url)
-                self._to_fetch.put(url)
-                self._to_fetch.join()
-            finally:
-                self._wait_threads()
-            del self.result
-        return result
+                logger.debug('Reading metadata from wheel: %s', url)
+                wheel = RemoteWheel(url, self.opener, self.timeout)
+                md = wheel.metadata
+            except Exception as e:
+                logger.warning('Unable to get metadata from %s: %s', url, e)
+            else:
+                _update_requirements(dist.metadata, md)
+        return load_metadata
+
+    def _make_metadata_loader(self, url, hashes):
+        """
+        Return a callable which completes a distribution's metadata from the
+        core metadata of the archive at an URL, which is fetched from
+        ``url + '.metadata'`` (see PEP 658).
+        """
+        def load_metadata(dist):
+            murl = url + '.metadata'
+            try:
+                logger.debug('Fetching metadata: %s', murl)
+                resp = self.opener.open(murl, timeout=self.timeout)
+                data = resp.read()
+                for algo, digest in hashes.items():
+                    try:
+                        hasher = hashlib.new(algo)
+                    except ValueError:  # pragma: no cover
+                        continue
+                    hasher.update(data)
+                    if hasher.hexdigest() != digest:
+                        raise DistlibException('%s digest mismatch for %s' %
+                                               (algo, murl))
+                md = Metadata(fileobj=StringIO(data.decode('utf-8')),
+                              scheme='legacy')
+            except Exception as e:
+                logger.warning('Unable to get metadata from %s: %s', murl, e)
+            else:
+                _update_requirements(dist.metadata, md)
+        return load_metadata
 
     platform_dependent = re.compile(r'\b(linux-(i\d86|x86_64|arm\w+)|'
                                     r'win(32|-amd64)|macosx-?\d+)\b', re.I)
@@ -661,12 +2385,12 @@ class SimpleScrapingLocator(Locator):
         """
         return self.platform_dependent.search(url)
 
-    def _process_download(self, url):
+    def _process_download(self, url, job):
         """
         See if an URL is a suitable download for a project.
 
-        If it is, register information in the result dictionary (for
-        _get_project) about the specific version it's for.
+        If it is, register information in the result dictionary of the
+        job (for _get_project) about the specific version it's for.
 
         Note that the return value isn't actually used other than as a boolean
         value.
@@ -674,13 +2398,58 @@ class SimpleScrapingLocator(Locator):
         if self._is_platform_dependent(url):
             info = None
         else:
-            info = self.convert_url_to_download_info(url, self.project_name)
+            info = self.convert_url_to_download_info(url, job.project_name)
         logger.debug('process_download: %s -> %s', url, info)
         if info:
-            with self._lock:    # needed because self.result is shared
-                self._update_version_data(self.result, info)
+            with job.lock:    # needed because job.result is shared
+                self._update_version_data(job.result, info)
+        return info
+
+    def _process_file(self, entry, job):
+        """
+        Register information about a file listed on a JSON page (see
+        :class:`JSONPage`) in the result dictionary of a job, if it's a
+        suitable download for the project.
+        """
+        url = entry['url']
+        if self._is_platform_dependent(url):
+            info = None
+        else:
+            info = self.convert_filename_to_download_info(entry['filename'],
+                                                          job.project_name)
+        if info:
+            spec = entry.get('requires-python')
+            if spec and not self._python_matches(spec):
+                logger.debug('process_file: %s needs Python %s', url, spec)
+                info = None
+        logger.debug('process_file: %s -> %s', url, info)
+        if info:
+            url = info['url'] = url.split('#', 1)[0]
+            for algo, digest in entry.get('hashes', {}).items():
+                info['%s_digest' % algo] = digest
+            metadata = entry.get('core-metadata',
+                                 entry.get('dist-info-metadata'))
+            with job.lock:    # needed because job.result is shared
+                self._update_version_data(job.result, info)
+                if metadata:
+                    if not isinstance(metadata, dict):
+                        metadata = {}
+                    job.metadata[url] = metadata
         return info
 
+    def _python_matches(self, spec):
+        """
+        See if the running Python satisfies a "requires-python" specifier.
+        Specifiers which can't be parsed are treated as satisfied.
+        """
+        try:
+            matcher = get_scheme('default').matcher('Python (%s)' % spec)
+            result = matcher.match(platform.python_version())
+        except Exception:
+            logger.debug('Unable to check Python against %r', spec)
+            result = True
+        return result
+
     def _should_queue(self, link, referrer, rel):
         """
         Determine whether a link URL from a referring page and with a
@@ -690,9 +2459,9 @@ class SimpleScrapingLocator(Locator):
         if path.endswith(self.source_extensions + self.binary_extensions +
                          self.excluded_extensions):
             result = False
-        elif self.skip_externals and not link.startswith(self.base_url):
+        elif self.skip_externals and not self._on_index(link):
             result = False
-        elif not referrer.startswith(self.base_url):
+        elif not self._on_index(referrer):
             result = False
         elif rel not in ('homepage', 'download'):
             result = False
@@ -710,6 +2479,69 @@ class SimpleScrapingLocator(Locator):
                      referrer, result)
         return result
 
+    def _on_index(self, url):
+        """
+        Say whether an URL is on the index or one of its mirrors.
+        """
+        return any(url.startswith(base)
+                   for base in [self.base_url] + self.mirrors)
+
+    def _get_candidates(self, url):
+        """
+        Get the URLs from which the page at an URL can be fetched. For a page
+        on the index, these are the URLs of the page on the index and each
+        of its mirrors, healthiest and fastest first.
+        """
+        bases = [self.base_url] + self.mirrors
+        result = [url]
+        if len(bases) > 1:
+            for base in bases:
+                if url.startswith(base):
+                    path = url[len(base):]
+                    hosts = [urlparse(b)[1].lower() for b in bases]
+                    ranked = self.health.rank(hosts)
+                    order = sorted(range(len(bases)),
+                                   key=lambda i: ranked.index(hosts[i]))
+                    result = [bases[i] + path for i in order]
+                    break
+        return result
+
+    def _get_host_slot(self, url):
+        """
+        Get the semaphore limiting concurrent requests to the host of an URL,
+        or ``None`` if there's no limit.
+        """
+        if not self.max_per_host:
+            result = None
+        else:
+            host = urlparse(url)[1].split(':', 1)[0].lower()
+            with self._lock:
+                result = self._host_slots.get(host)
+                if result is None:
+                    result = threading.BoundedSemaphore(self.max_per_host)
+                    self._host_slots[host] = result
+        return result
+
+    def _make_link_processor(self, url, job):
+        """
+        Return a callback for :meth:`get_page` which examines the links on
+        the page at an URL as they're found, recording downloads and queueing
+        further pages for scraping on behalf of a job.
+        """
+        def process_link(link, rel):
+            try:
+                with job.lock:
+                    if link in job.seen:
+                        return
+                    job.seen.add(link)
+                if (not self._process_download(link, job) and
+                    self._should_queue(link, url, rel)):
+                    logger.debug('Queueing %s from %s', link, url)
+                    self._enqueue(link, job)
+            except Exception as e:  # pragma: no cover
+                self.errors.put(text_type(e))
+        return process_link
+
     def _fetch(self):
         """
         Get a URL to fetch from the work queue, get the HTML page, examine its
@@ -717,107 +2549,550 @@ class SimpleScrapingLocator(Locator):
 
         This is a handy method to run in a thread.
         """
+        me = threading.current_thread()
         while True:
-            url = self._to_fetch.get()
             try:
-                if url:
-                    page = self.get_page(url)
-                    if page is None:    # e.g. after an error
+                item = self._to_fetch.get(True, self.worker_idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if not self._to_fetch.empty():
                         continue
-                    for link, rel in page.links:
-                        if link not in self._seen:
-                            self._seen.add(link)
-                            if (not self._process_download(link) and
-                                self._should_queue(link, url, rel)):
-                                logger.debug('Queueing %s from %s', link, url)
-                                self._to_fetch.put(link)
+                    self._threads.remove(me)
+                break
+            url, job = item
+            # Errors while working for the job are recorded against it.
+            self._local.lookup = job
+            try:
+                process_link = self._make_link_processor(url, job)
+                slot = self._get_host_slot(url)
+                if slot is None:
+                    page = self.get_page(url, process_link)
+                else:
+                    with slot:
+                        page = self.get_page(url, process_link)
+                if page is not None:
+                    if page.files:
+                        for entry in page.files:
+                            self._process_file(entry, job)
+                    if page.metadata:
+                        with job.lock:
+                            for link, hashes in page.metadata.items():
+                                link = link.split('#', 1)[0]
+                                job.metadata[link] = hashes
             except Exception as e:  # pragma: no cover
                 self.errors.put(text_type(e))
             finally:
+                self._local.lookup = None
                 # always do this, to avoid hangs :-)
-                self._to_fetch.task_done()
-            if not url:
-                #logger.debug('Sentinel seen, quitting.')
-                break
+                job.task_done()
+
+    @property
+    def transfer_stats(self):
+        """
+        Return a dictionary of counters describing the data transferred.
+        """
+        return {
+            'bytes_received': self.bytes_received,
+            'bytes_decoded': self.bytes_decoded,
+            'decode_time': self.decode_time,
+        }
 
-    def get_page(self, url):
+    def _iter_content(self, resp, encoding):
+        """
+        Read the body of a response in chunks, decoding each one according
+        to the Content-Encoding as it arrives, and yield the decoded bytes.
+        If fewer bytes than the Content-Length are received, an exception is
+        raised.
+        """
+        if encoding:
+            encoding = encoding.strip().lower()
+        decoder = self.decoders[encoding or 'identity']   # fail if not found
+        if decoder is not None:
+            decoder = decoder()
+        received = decoded = 0
+        elapsed = 0.0
+        try:
+            while True:
+                chunk = resp.read(self.chunk_size)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if decoder is not None:
+                    start = time.time()
+                    chunk = decoder.decompress(chunk)
+                    elapsed += time.time() - start
+                if chunk:
+                    decoded += len(chunk)
+                    yield chunk
+            length = resp.info().get('Content-Length')
+            if length and length.isdigit() and received < int(length):
+                raise DistlibException('retrieval incomplete: got only %d '
+                                       'out of %s bytes' % (received, length))
+            if decoder is not None:
+                start = time.time()
+                chunk = decoder.flush()
+                elapsed += time.time() - start
+                if chunk:
+                    decoded += len(chunk)
+                    yield chunk
+        finally:
+            with self._lock:
+                self.bytes_received += received
+                self.bytes_decoded += decoded
+                self.decode_time += elapsed
+
+    def _make_page(self, entry):
+        """
+        Make a page from a :class:`PageCache` entry.
+        """
+        if SIMPLE_JSON_CONTENT_TYPE.match(entry.get('content_type', '')):
+            cls = JSONPage
+        else:
+            cls = Page
+        return cls(entry['data'], entry['url'])
+
+    def _read_page(self, resp, url, charset, callback):
+        """
+        Read and decode the body of an HTML page, extracting links from it as
+        it arrives.
+
+        :param resp: The response to read.
+        :param url: The URL of the page.
+        :param charset: The character encoding of the page.
+        :param callback: If not ``None``, called with each link found as
+                         ``callback(url, rel)``.
+        :return: A tuple of the page text and the :class:`LinkExtractor`
+                 used.
+        """
+        extractor = LinkExtractor(url)
+        decoder = codecs.getincrementaldecoder(charset)()
+        chunks = self._iter_content(resp, resp.info().get('Content-Encoding'))
+        raw = []
+        parts = []
+        try:
+            for chunk in chunks:
+                raw.append(chunk)
+                text = decoder.decode(chunk)
+                parts.append(text)
+                links = extractor.feed(text)
+                if callback:
+                    for link, rel in links:
+                        callback(link, rel)
+            text = decoder.decode(b'', True)
+            parts.append(text)
+            links = extractor.feed(text) + extractor.close()
+            data = ''.join(parts)
+        except UnicodeError:  # pragma: no cover
+            # Start again, using a fallback encoding which always works.
+            # The callback will see the links it's already seen again.
+            raw.extend(chunks)
+            data = b''.join(raw).decode('latin-1')
+            extractor = LinkExtractor(url)
+            links = extractor.feed(data) + extractor.close()
+        if callback:
+            for link, rel in links:
+                callback(link, rel)
+        return data, extractor
+
+    def get_page(self, url, callback=None):
         """
         Get the HTML for an URL, possibly from an in-memory cache.
 
         XXX TODO Note: this cache is never actually cleared. It's assumed that
         the data won't get stale over the lifetime of a locator instance (not
         necessarily true for the default_locator).
+
+        If a persistent :class:`PageCache` was configured, it is consulted
+        when there's no in-memory entry. A fresh entry is used as is; a stale
+        one is revalidated with a conditional request, and reused if the
+        server responds with a 304 (Not Modified).
+
+        If a callback is specified, it's called as ``callback(url, rel)`` for
+        each link on the page. When the page is fetched from the server, this
+        happens while it's being read, so the links can be processed before
+        all of the page has been received.
         """
         # http://peak.telecommunity.com/DevCenter/EasyInstall#package-index-api
         scheme, netloc, path, _, _, _ = urlparse(url)
         if scheme == 'file' and os.path.isdir(url2pathname(path)):
             url = urljoin(ensure_slash(url), 'index.html')
 
+        streamed = False
         if url in self._page_cache:
             result = self._page_cache[url]
             logger.debug('Returning %s from cache: %s', url, result)
+            if url in self._failed:
+                # The failure counts against each lookup using the page.
+                self.errors.put('Unable to fetch %s' % url)
         else:
-            host = netloc.split(':', 1)[0]
             result = None
-            if host in self._bad_hosts:
-                logger.debug('Skipping %s due to bad host %s', url, host)
+            entry = None
+            page_cache = self.page_cache
+            cacheable = (page_cache is not None and
+                         scheme in ('http', 'https'))
+            if cacheable:
+                entry = page_cache.get(url)
+            if entry and page_cache.is_fresh(entry):
+                logger.debug('Returning %s from page cache', url)
+                page_cache._record('hits')
+                result = self._make_page(entry)
             else:
-                req = Request(url, headers={'Accept-encoding': 'identity'})
-                try:
-                    logger.debug('Fetching %s', url)
-                    resp = self.opener.open(req, timeout=self.timeout)
-                    logger.debug('Fetched %s', url)
-                    headers = resp.info()
-                    content_type = headers.get('Content-Type', '')
-                    if HTML_CONTENT_TYPE.match(content_type):
-                        final_url = resp.geturl()
-                        data = resp.read()
-                        encoding = headers.get('Content-Encoding')
-                        if encoding:
-                            decoder = self.decoders[encoding]   # fail if not found
-                            data = decoder(data)
-                        encoding = 'utf-8'
-                        m = CHARSET.search(content_type)
-                        if m:
-                            encoding = m.group(1)
-                        try:
-                            data = data.decode(encoding)
-                        except UnicodeError:  # pragma: no cover
-                            data = data.decode('latin-1')    # fallback
-                        result = Page(data, final_url)
-                        self._page_cache[final_url] = result
-                except HTTPError as e:
-                    if e.code != 404:
-                        logger.exception('Fetch failed: %s: %s', url, e)
-                except URLError as e:  # pragma: no cover
-                    logger.exception('Fetch failed: %s: %s', url, e)
-                    with self._lock:
-                        self._bad_hosts.add(host)
-                except Exception as e:  # pragma: no cover
-                    logger.exception('Fetch failed: %s: %s', url, e)
-                finally:
-                    self._page_cache[url] = result   # even if None (failure)
+                failed = True
+                not_found = False
+                for candidate in self._get_candidates(url):
+                    host = urlparse(candidate)[1].lower()
+                    if not self.health.allow(host):
+                        logger.debug('Skipping %s due to unhealthy host %s',
+                                     candidate, host)
+                        continue
+                    result, streamed, failed, not_found = self._fetch_page(
+                        candidate, url, entry, callback)
+                    if not failed:
+                        break
+                if failed:
+                    # Recorded so that an outage isn't taken to mean that
+                    # a project doesn't exist.
+                    self._failed.add(url)
+                    self.errors.put('Unable to fetch %s' % url)
+                elif not_found:
+                    self._not_found.add(url)
+            self._page_cache[url] = result   # even if None (failure)
+        if callback and result is not None and not streamed:
+            for link, rel in result.iter_links():
+                callback(link, rel)
         return result
 
+    def _get_request_headers(self):
+        """
+        Return the headers to send when fetching a page of the index.
+        """
+        if self.compress:
+            headers = {'Accept-encoding': 'gzip, deflate'}
+        else:
+            headers = {'Accept-encoding': 'identity'}
+        if self.json_api:
+            headers['Accept'] = self.json_accept
+        return headers
+
+    def _fetch_page(self, url, key, entry, callback):
+        """
+        Fetch a page for :meth:`get_page`, recording the health of the host
+        it's fetched from.
+
+        :param url: The URL to fetch the page from.
+        :param key: The URL under which the page is kept in the page cache,
+                    which differs from ``url`` if that's on a mirror.
+        :param entry: The page cache's entry for the page, if any.
+        :param callback: As for :meth:`get_page`.
+        :return: A tuple of the page (or ``None``), whether the page's links
+                 were passed to the callback as it was read, whether the
+                 page couldn't be fetched (for any reason other than not
+                 existing) and whether the server said it doesn't exist.
+        """
+        result = None
+        streamed = failed = not_found = False
+        page_cache = self.page_cache
+        host = urlparse(url)[1].lower()
+        headers = self._get_request_headers()
+        if entry:
+            page_cache.add_validators(entry, headers)
+        req = Request(url, headers=headers)
+        start = time.time()
+        # The outcome is recorded however the fetch ends, as a half-open
+        # host stays unusable until its probe's outcome is known.
+        ok = False
+        elapsed = None
+        try:
+            logger.debug('Fetching %s', url)
+            resp = self.opener.open(req, timeout=self.timeout)
+            elapsed = time.time() - start
+            logger.debug('Fetched %s', url)
+            headers = resp.info()
+            content_type = headers.get('Content-Type', '')
+            is_json = SIMPLE_JSON_CONTENT_TYPE.match(content_type)
+            if is_json or HTML_CONTENT_TYPE.match(content_type):
+                final_url = resp.geturl()
+                encoding = 'utf-8'
+                m = CHARSET.search(content_type)
+                if m:
+                    encoding = m.group(1)
+                if is_json:
+                    data = b''.join(self._iter_content(resp,
+                        headers.get('Content-Encoding')))
+                    data = data.decode(encoding)
+                    result = JSONPage(data, final_url)
+                else:
+                    streamed = True
+                    data, extractor = self._read_page(resp, final_url,
+                                                      encoding, callback)
+                    result = Page(data, final_url, extractor)
+                self._page_cache[final_url] = result
+                if (page_cache is not None and
+                    urlparse(key)[0] in ('http', 'https')):
+                    page_cache._record('misses')
+                    page_cache.put(key, {
+                        'url': final_url,
+                        'data': data,
+                        'content_type': content_type,
+                        'etag': headers.get('ETag'),
+                        'last_modified': headers.get('Last-Modified'),
+                    })
+            ok = True
+        except HTTPError as e:
+            # Only server errors count against the host's health.
+            ok = e.code < 500
+            if e.code == 304 and entry:
+                logger.debug('Not modified, using page cache: %s', url)
+                page_cache._record('revalidated')
+                result = self._make_page(entry)
+                self._page_cache[result.url] = result
+                page_cache.put(key, entry)
+            elif e.code == 404:
+                not_found = True
+            else:
+                logger.exception('Fetch failed: %s: %s', url, e)
+                failed = True
+        except (URLError, IOError, OSError) as e:
+            # Includes socket errors and timeouts, whether connecting or
+            # reading the response.
+            logger.exception('Fetch failed: %s: %s', url, e)
+            failed = True
+        except Exception as e:
+            # E.g. a truncated response, or an unsupported JSON API version.
+            logger.exception('Fetch failed: %s: %s', url, e)
+            failed = True
+        finally:
+            if elapsed is None:
+                elapsed = time.time() - start
+            self.health.record(host, ok, elapsed)
+        return result, streamed, failed, not_found
+
     _distname_re = re.compile('<a href=[^>]*>([^<]+)<')
 
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
-        result = set()
-        page = self.get_page(self.base_url)
-        if not page:
-            raise DistlibException('Unable to get %s' % self.base_url)
-        for match in self._distname_re.finditer(page.data):
-            result.add(match.group(1))
-        return result
+        return set(self.iter_distribution_names())
+
+    def iter_distribution_names(self):
+        """
+        Yield the distribution names known to this locator, from the root page
+        of the index. Names are yielded as the page is read, rather than once
+        all of it has been received.
+
+        If there's a :attr:`name_index`, the names are kept in it once all of
+        them have been read, and used from it while they're fresh. After
+        that, they're revalidated with a conditional request, and used from
+        it again if the page hasn't changed (or can't be fetched).
+        """
+        url = self.base_url
+        if urlparse(url)[0] not in ('http', 'https'):
+            # A local index: just use the page.
+            page = self.get_page(url)
+            if not page:
+                raise DistlibException('Unable to get %s' % url)
+            if page.projects is not None:
+                names = page.projects
+            else:
+                names = [m.group(1) for m in
+                         self._distname_re.finditer(page.data)]
+            for name in names:
+                yield name
+            return
+        index = self.name_index
+        header = None
+        if index is not None:
+            header = index.get(url)
+            if header is not None and index.is_fresh(header):
+                logger.debug('Using names of %s from name index', url)
+                for name in index.iter_names(url):
+                    yield name
+                return
+        try:
+            resp = self._open_root_page(url, header)
+        except DistlibException:
+            if header is None:
+                raise
+            logger.warning('Unable to get %s, using names from name index',
+                           url)
+            resp = None
+        if resp is None:
+            if header is not None:
+                index.touch(url)
+            for name in index.iter_names(url):
+                yield name
+            return
+        names = [] if index is not None else None
+        try:
+            for name in self._iter_page_names(resp):
+                if names is not None:
+                    names.append(name)
+                yield name
+        finally:
+            resp.close()
+        if index is not None:
+            headers = resp.info()
+            index.put(url, names, headers.get('ETag'),
+                      headers.get('Last-Modified'))
+
+    def _open_root_page(self, url, header):
+        """
+        Make a request for the root page of the index, from whichever of it
+        and its mirrors is healthiest.
+
+        :param url: The URL of the page.
+        :param header: The header of the page's list of names in the
+                       :attr:`name_index`, if there is one.
+        :return: The response, or ``None`` if the server says the page
+                 hasn't changed since the list was made.
+        """
+        headers = self._get_request_headers()
+        if header is not None:
+            self.name_index.add_validators(header, headers)
+        for candidate in self._get_candidates(url):
+            host = urlparse(candidate)[1].lower()
+            if not self.health.allow(host):
+                logger.debug('Skipping %s due to unhealthy host %s',
+                             candidate, host)
+                continue
+            start = time.time()
+            try:
+                resp = self.opener.open(Request(candidate, headers=headers),
+                                        timeout=self.timeout)
+                self.health.record(host, True, time.time() - start)
+                return resp
+            except HTTPError as e:
+                failed = e.code >= 500
+                self.health.record(host, not failed, time.time() - start)
+                if e.code == 304 and header is not None:
+                    logger.debug('Not modified, using name index: %s', url)
+                    return None
+                logger.warning('Fetch failed: %s: %s', candidate, e)
+                if not failed:
+                    break
+            except (URLError, IOError, OSError) as e:
+                logger.warning('Fetch failed: %s: %s', candidate, e)
+                self.health.record(host, False, time.time() - start)
+            except Exception:
+                # E.g. a bad status line: still record an outcome, so that
+                # a half-open host isn't left waiting for its probe's.
+                self.health.record(host, False, time.time() - start)
+                raise
+        raise DistlibException('Unable to get %s' % url)
+
+    def _iter_page_names(self, resp):
+        """
+        Yield the project names on the root page of the index, as they're
+        read from a response. The JSON form of the page is parsed once it's
+        all been received, as it can't be parsed incrementally.
+        """
+        headers = resp.info()
+        content_type = headers.get('Content-Type', '')
+        encoding = 'utf-8'
+        m = CHARSET.search(content_type)
+        if m:
+            encoding = m.group(1)
+        chunks = self._iter_content(resp, headers.get('Content-Encoding'))
+        if SIMPLE_JSON_CONTENT_TYPE.match(content_type):
+            data = b''.join(chunks).decode(encoding)
+            for name in JSONPage(data, resp.geturl()).projects:
+                yield name
+            return
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+        pending = ''
+        for chunk in chunks:
+            pending += decoder.decode(chunk)
+            pos = 0
+            for m in self._distname_re.finditer(pending):
+                yield m.group(1)
+                pos = m.end()
+            # Only the text from the last '<' on can be part of a match.
+            pending = pending[pos:]
+            i = pending.rfind('<')
+            pending = pending[i:] if i >= 0 else ''
+        pending += decoder.decode(b'', True)
+        for m in self._distname_re.finditer(pending):
+            yield m.group(1)
+
+    def find_distribution_names(self, prefix):
+        """
+        Yield the distribution names known to this locator whose normalised
+        forms (see PEP 503) start with that of a prefix, in order of their
+        normalised forms. If there's a :attr:`name_index`, it's searched
+        without reading all of the names.
+        """
+        index = self._refresh_name_index()
+        if index is not None:
+            for name in index.iter_prefix(self.base_url, prefix):
+                yield name
+        else:
+            prefix = normalize_name(prefix)
+            matches = {}
+            for name in self.iter_distribution_names():
+                key = normalize_name(name)
+                if key.startswith(prefix):
+                    matches.setdefault(key, name)
+            for key in sorted(matches):
+                yield matches[key]
+
+    def lookup_distribution_name(self, name):
+        """
+        Return the distribution name known to this locator which is the same
+        as ``name`` when both are normalised (see PEP 503), or ``None`` if
+        there isn't one. If there's a :attr:`name_index`, it's searched
+        without reading all of the names.
+        """
+        index = self._refresh_name_index()
+        if index is not None:
+            return index.lookup(self.base_url, name)
+        key = normalize_name(name)
+        for name in self.iter_distribution_names():
+            if normalize_name(name) == key:
+                return name
+        return None
+
+    def _refresh_name_index(self):
+        """
+        Make sure the name index has a fresh list of the names known to this
+        locator, and return it, or ``None`` if it isn't being used.
+        """
+        index = self.name_index
+        if index is None or urlparse(self.base_url)[0] not in ('http',
+                                                               'https'):
+            return None
+        header = index.get(self.base_url)
+        if header is None or not index.is_fresh(header):
+            for name in self.iter_distribution_names():
+                pass
+        return index
+
 
 class DirectoryLocator(Locator):
     """
     This class locates distributions in a directory tree.
+
+    The tree is scanned once, when first needed, to build an index which maps
+    (normalised) project names to the archives which might belong to them.
+    Later lookups just consult the index. Call :meth:`refresh` to rescan the
+    tree, or pass ``auto_refresh=True`` to have it rescanned whenever a
+    directory in it is seen to have been modified. The index can also be
+    saved to a file, so that other processes only need to rescan the
+    directories which have changed since it was written.
     """
 
+    # Used to find the places where a project name might end in the filename
+    # of an archive which isn't a wheel.
+    _name_boundary = re.compile(r'\W')
+
+    # The version of the format of index files.
+    index_version = 2
+
+    # Directories modified less than this many seconds before they were
+    # scanned are always rescanned when an index file is loaded, as they
+    # may have changed again without their modification time changing.
+    racy_interval = 2.0
+
     def __init__(self, path, **kwargs):
         """
         Initialise an instance.
@@ -827,13 +3102,38 @@ class DirectoryLocator(Locator):
                        * recursive - if True (the default), subdirectories are
                          recursed into. If False, only the top-level directory
                          is searched,
+                       * auto_refresh - if True, the modification times of
+                         the directories searched are checked on each lookup,
+                         and those which have changed are rescanned. If False
+                         (the default), the tree is only rescanned when
+                         refresh() is called.
+                       * index_file - the pathname of a file in which to keep
+                         the index between processes, or True to keep it in
+                         the distlib cache. If not specified, the index is
+                         only held in memory.
         """
         self.recursive = kwargs.pop('recursive', True)
+        self.auto_refresh = kwargs.pop('auto_refresh', False)
+        index_file = kwargs.pop('index_file', None)
         super(DirectoryLocator, self).__init__(**kwargs)
         path = os.path.abspath(path)
         if not os.path.isdir(path):  # pragma: no cover
             raise DistlibException('Not a directory: %r' % path)
         self.base_dir = path
+        if index_file is True:
+            key = hashlib.sha256(path.encode('utf-8')).hexdigest()
+            # Use native string to avoid issues on 2.x: see Python #20140.
+            index_file = os.path.join(get_cache_base(), str('dir-index'),
+                                      key + '.json')
+        self.index_file = index_file
+        self._lock = threading.RLock()
+        # normalised name -> list of (directory, filename) tuples
+        self._index = None
+        self._paths = []        # all candidate (directory, filename) tuples
+        self._names = None      # distribution names, computed when needed
+        # directory -> (mtime, [(filename, index keys)], [subdirectory names])
+        self._dirs = {}
+        self.rescanned = 0      # directories listed by the last index update
 
     def should_include(self, filename, parent):
         """
@@ -843,47 +3143,247 @@ class DirectoryLocator(Locator):
         """
         return filename.endswith(self.downloadable_extensions)
 
+    def refresh(self):
+        """
+        Discard the index of the directory tree (and any cached results), so
+        that the tree is scanned again when next needed.
+        """
+        with self._lock:
+            self._index = None
+            self._paths = []
+            self._names = None
+            self._dirs = {}
+            self.clear_cache()
+
+    def _scan_dir(self, parent):
+        """
+        List a directory, returning the files which should be included and
+        the subdirectories to recurse into. As with ``os.walk``, symbolic
+        links to directories aren't followed.
+        """
+        if scandir is not None:
+            entries = [(e.name, e.is_dir(), e.is_symlink())
+                       for e in scandir(parent)]
+        else:  # pragma: no cover
+            entries = []
+            for fn in os.listdir(parent):
+                p = os.path.join(parent, fn)
+                entries.append((fn, os.path.isdir(p), os.path.islink(p)))
+        files = []
+        subdirs = []
+        for fn, is_dir, is_link in entries:
+            if is_dir:
+                if self.recursive and not is_link:
+                    subdirs.append(fn)
+            elif self.should_include(fn, parent):
+                files.append((fn, sorted(self._index_keys(fn))))
+        return files, sorted(subdirs)
+
+    def _scan(self, previous):
+        """
+        Scan the directory tree, returning a dictionary which maps each
+        directory in it to a tuple of its modification time, included files
+        and subdirectories. Directories whose modification times match those
+        in ``previous`` (a dictionary of the same form) aren't listed again.
+        Directories which can't be read are skipped.
+        """
+        result = {}
+        dirs = [self.base_dir]
+        rescanned = 0
+        while dirs:
+            parent = dirs.pop(0)
+            try:
+                mtime = os.stat(parent).st_mtime
+                entry = previous.get(parent)
+                if entry is None or entry[0] != mtime:
+                    files, subdirs = self._scan_dir(parent)
+                    entry = (mtime, files, subdirs)
+                    rescanned += 1
+            except OSError:  # pragma: no cover
+                continue
+            result[parent] = entry
+            if self.recursive:
+                dirs[:0] = [os.path.join(parent, d) for d in entry[2]]
+        self.rescanned = rescanned
+        return result
+
+    def _index_keys(self, filename):
+        """
+        Return the normalised names of the projects which an archive might
+        belong to. For a wheel, there's only one; otherwise, the name could
+        end at any non-word character in the filename before its extension,
+        as parts of a name can look like versions, so there's a key for each
+        of those positions. (For example, the archive
+        ``py-3-thing-1.0.tar.gz`` is indexed under ``py``, ``py-3``,
+        ``py-3-thing`` and ``py-3-thing-1``.) The filenames found for a
+        project are parsed using :meth:`convert_url_to_download_info`.
+        """
+        if filename.endswith('.whl'):
+            result = set([normalize_name(filename.split('-', 1)[0])])
+        else:
+            stem = filename
+            for ext in self.downloadable_extensions:
+                if stem.endswith(ext):
+                    stem = stem[:-len(ext)]
+                    break
+            result = set()
+            for m in self._name_boundary.finditer(stem):
+                n = m.start()
+                if n:
+                    result.add(normalize_name(stem[:n]))
+        return result
+
+    def _build_index(self, previous):
+        """
+        Scan the directory tree (apart from directories unchanged since
+        ``previous`` was made) and build the index of project names.
+        """
+        dirs = self._scan(previous)
+        index = {}
+        paths = []
+        for parent in sorted(dirs):
+            for fn, keys in dirs[parent][1]:
+                path = parent, fn
+                paths.append(path)
+                for key in keys:
+                    index.setdefault(key, []).append(path)
+        logger.debug('Indexed %d files in %d directories under %s '
+                     '(%d rescanned)', len(paths), len(dirs), self.base_dir,
+                     self.rescanned)
+        self._index = index
+        self._paths = paths
+        self._names = None
+        self._dirs = dirs
+        if self.index_file and (self.rescanned or
+                                set(dirs) != set(previous)):
+            self._write_index_file()
+
+    def _read_index_file(self):
+        """
+        Read the directory information saved in the index file, returning an
+        empty dictionary if there's no usable file.
+        """
+        result = {}
+        path = self.index_file
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = json.loads(f.read().decode('utf-8'))
+                if (data.get('version') == self.index_version and
+                    data.get('base_dir') == self.base_dir and
+                    data.get('recursive') == self.recursive):
+                    for rel, (mtime, files, subdirs) in data['dirs'].items():
+                        if rel == os.curdir:
+                            parent = self.base_dir
+                        else:
+                            parent = os.path.join(self.base_dir, rel)
+                        result[parent] = (mtime, files, subdirs)
+            except Exception:  # pragma: no cover
+                logger.warning('Ignoring unreadable index file %s', path,
+                               exc_info=True)
+        return result
+
+    def _write_index_file(self):
+        """
+        Save the directory information to the index file.
+        """
+        path = self.index_file
+        threshold = time.time() - self.racy_interval
+        dirs = {}
+        for parent, (mtime, files, subdirs) in self._dirs.items():
+            if mtime >= threshold:
+                mtime = None
+            dirs[os.path.relpath(parent, self.base_dir)] = (mtime, files,
+                                                            subdirs)
+        data = json.dumps({
+            'version': self.index_version,
+            'base_dir': self.base_dir,
+            'recursive': self.recursive,
+            'dirs': dirs,
+        }).encode('utf-8')
+        path = os.path.abspath(path)
+        dirname = os.path.dirname(path)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            _write_file(path, [data])
+        except Exception:  # pragma: no cover
+            logger.warning('Unable to write index file %s', path,
+                           exc_info=True)
+
+    def _is_stale(self):
+        """
+        See if any of the directories scanned have been modified (or removed)
+        since the index was built.
+        """
+        for path, entry in self._dirs.items():
+            try:
+                if os.stat(path).st_mtime != entry[0]:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _check_index(self):
+        """
+        Make sure the index is built and, if ``auto_refresh`` is set, up to
+        date.
+        """
+        with self._lock:
+            if self._index is None:
+                previous = {}
+                if self.index_file:
+                    previous = self._read_index_file()
+                self._build_index(previous)
+            elif self.auto_refresh and self._is_stale():
+                logger.debug('Directory tree changed: %s', self.base_dir)
+                self.clear_cache()
+                self._build_index(self._dirs)
+            return self._index
+
+    def get_project(self, name):
+        # The index is checked here, rather than in _get_project, so that
+        # cached results are discarded if the directory tree has changed.
+        self._check_index()
+        return super(DirectoryLocator, self).get_project(name)
+
+    def _path_to_url(self, path):
+        path = os.path.join(*path)
+        return urlunparse(('file', '', pathname2url(path), '', '', ''))
+
     def _get_project(self, name):
         result = {'urls': {}, 'digests': {}}
-        for root, dirs, files in os.walk(self.base_dir):
-            for fn in files:
-                if self.should_include(fn, root):
-                    fn = os.path.join(root, fn)
-                    url = urlunparse(('file', '',
-                                      pathname2url(os.path.abspath(fn)),
-                                      '', '', ''))
-                    info = self.convert_url_to_download_info(url, name)
-                    if info:
-                        self._update_version_data(result, info)
-            if not self.recursive:
-                break
+        index = self._check_index()
+        for path in index.get(normalize_name(name), ()):
+            url = self._path_to_url(path)
+            info = self.convert_url_to_download_info(url, name)
+            if info:
+                self._update_version_data(result, info)
         return result
 
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
-        result = set()
-        for root, dirs, files in os.walk(self.base_dir):
-            for fn in files:
-                if self.should_include(fn, root):
-                    fn = os.path.join(root, fn)
-                    url = urlunparse(('file', '',
-                                      pathname2url(os.path.abspath(fn)),
-                                      '', '', ''))
+        with self._lock:
+            self._check_index()
+            if self._names is None:
+                names = set()
+                for path in self._paths:
+                    url = self._path_to_url(path)
                     info = self.convert_url_to_download_info(url, None)
                     if info:
-                        result.add(info['name'])
-            if not self.recursive:
-                break
-        return result
+                        names.add(info['name'])
+                self._names = names
+            return set(self._names)
 
 class JSONLocator(Locator):
     """
     This locator uses special extended metadata (not available on PyPI) and is
     the basis of performant dependency resolution in distlib. Other locators
     require archive downloads before dependencies can be determined! As you
-    might imagine, that can be slow.
+    might imagine, that can be slow. (The exception is SimpleScrapingLocator
+    with an index which serves metadata files separately, as per PEP 658.)
     """
     def get_distribution_names(self):
         """
@@ -948,6 +3448,11 @@ class AggregatingLocator(Locator):
     """
     This class allows you to chain and/or merge a list of locators.
     """
+
+    # When searching concurrently, worker threads which have had nothing to
+    # do for this many seconds exit, as the scraping locator's do.
+    worker_idle_timeout = 5.0
+
     def __init__(self, *locators, **kwargs):
         """
         Initialise an instance.
@@ -959,10 +3464,30 @@ class AggregatingLocator(Locator):
                          search from any of the locators is returned. If True,
                          the results from all locators are merged (this can be
                          slow).
+                       * concurrent - if True, all the locators are searched
+                         at once, rather than one after the other. Results
+                         are still used in the order of the locators, but a
+                         slow locator doesn't hold up the others. If False
+                         (the default), each locator is only searched if
+                         those before it weren't successful (or if merging).
+                       * num_workers - the maximum number of worker threads
+                         used for concurrent searches (default 10). They're
+                         shared by all lookups, started when needed and exit
+                         after being idle for a while.
         """
         self.merge = kwargs.pop('merge', False)
+        self.concurrent = kwargs.pop('concurrent', False)
+        self.num_workers = kwargs.pop('num_workers', 10)
         self.locators = locators
         super(AggregatingLocator, self).__init__(**kwargs)
+        self._to_search = queue.Queue()
+        self._threads = []
+        self._idle = 0      # the number of workers waiting for searches
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = [{'calls': 0, 'errors': 0, 'skipped': 0,
+                        'total_time': 0.0, 'max_time': 0.0}
+                       for locator in locators]
 
     def clear_cache(self):
         super(AggregatingLocator, self).clear_cache()
@@ -976,50 +3501,199 @@ class AggregatingLocator(Locator):
 
     scheme = property(Locator.scheme.fget, _set_scheme)
 
+    @property
+    def store_key(self):
+        parts = [type(self).__name__, self.scheme, 'merge=%s' % self.merge]
+        parts.extend('(%s)' % locator.store_key for locator in self.locators)
+        return ' '.join(parts)
+
+    @property
+    def locator_stats(self):
+        """
+        Return a list with a dictionary for each locator (in the same order
+        as the locators), giving the number of ``calls`` made to it, how many
+        raised ``errors``, and the ``total_time`` and ``max_time`` (in
+        seconds) taken. In concurrent mode, calls whose results weren't
+        needed are included once they finish. The number of lookups which
+        were ``skipped``, because the locator's store recorded that it
+        doesn't have the project, is also given.
+        """
+        with self._stats_lock:
+            return [dict(d) for d in self._stats]
+
+    def _query(self, index, name):
+        """
+        Get a project from one of the locators, recording how long it took.
+        A locator isn't asked for a project which its store says it doesn't
+        have.
+        """
+        locator = self.locators[index]
+        stats = self._stats[index]
+        store = locator.store if locator.cache_missing else None
+        if store is not None and store.is_missing(locator.store_key, name):
+            logger.debug('Skipping %s for %s, known not to exist', locator,
+                         name)
+            with self._stats_lock:
+                stats['skipped'] += 1
+            return {}
+        start = time.time()
+        error = True
+        try:
+            result = locator.get_project(name)
+            error = False
+        finally:
+            elapsed = time.time() - start
+            with self._stats_lock:
+                stats['calls'] += 1
+                stats['total_time'] += elapsed
+                if elapsed > stats['max_time']:
+                    stats['max_time'] = elapsed
+                if error:
+                    stats['errors'] += 1
+        return result
+
+    def _merge(self, result, d):
+        """
+        Merge the result from one locator into the aggregated result.
+        """
+        files = result.get('urls', {})
+        digests = result.get('digests', {})
+        # next line could overwrite result['urls'], result['digests']
+        result.update(d)
+        df = result.get('urls')
+        if files and df:
+            for k, v in files.items():
+                if k in df:
+                    df[k] |= v
+                else:
+                    df[k] = v
+        dd = result.get('digests')
+        if digests and dd:
+            dd.update(digests)
+
+    def _is_wanted(self, d, matcher):
+        """
+        Say whether a non-empty result from a locator should be used when not
+        merging.
+        """
+        # See issue #18. If any dists are found and we're looking
+        # for specific constraints, we only return something if
+        # a match is found. For example, if a DirectoryLocator
+        # returns just foo (1.0) while we're looking for
+        # foo (>= 2.0), we'll pretend there was nothing there so
+        # that subsequent locators can be queried. Otherwise we
+        # would just return foo (1.0) which would then lead to a
+        # failure to find foo (>= 2.0), because other locators
+        # weren't searched. Note that this only matters when
+        # merge=False.
+        if matcher is None:
+            found = True
+        else:
+            found = False
+            for k in d:
+                if k in ('urls', 'digests'):
+                    continue
+                if matcher.match(k):
+                    found = True
+                    break
+        return found
+
     def _get_project(self, name):
+        if self.concurrent and len(self.locators) > 1:
+            return self._get_project_concurrently(name)
         result = {}
-        for locator in self.locators:
-            d = locator.get_project(name)
+        for i in range(len(self.locators)):
+            d = self._query(i, name)
             if d:
                 if self.merge:
-                    files = result.get('urls', {})
-                    digests = result.get('digests', {})
-                    # next line could overwrite result['urls'], result['digests']
-                    result.update(d)
-                    df = result.get('urls')
-                    if files and df:
-                        for k, v in files.items():
-                            if k in df:
-                                df[k] |= v
-                            else:
-                                df[k] = v
-                    dd = result.get('digests')
-                    if digests and dd:
-                        dd.update(digests)
-                else:
-                    # See issue #18. If any dists are found and we're looking
-                    # for specific constraints, we only return something if
-                    # a match is found. For example, if a DirectoryLocator
-                    # returns just foo (1.0) while we're looking for
-                    # foo (>= 2.0), we'll pretend there was nothing there so
-                    # that subsequent locators can be queried. Otherwise we
-                    # would just return foo (1.0) which would then lead to a
-                    # failure to find foo (>= 2.0), because other locators
-                    # weren't searched. Note that this only matters when
-                    # merge=False.
-                    if self.matcher is None:
-                        found = True
-                    else:
-                        found = False
-                        for k in d:
-                            if self.matcher.match(k):
-                                found = True
-                                break
-                    if found:
-                        result = d
-                        break
+                    self._merge(result, d)
+                elif self._is_wanted(d, self.matcher):
+                    result = d
+                    break
         return result
 
+    def _get_project_concurrently(self, name):
+        """
+        Search all the locators at once, using the results in the order of
+        the locators as they become available. The first locator is searched
+        in the calling thread, as its result is always needed. When not
+        merging, the result is returned as soon as the first wanted result
+        is available from a locator whose predecessors have all finished;
+        the results of any locators still being searched are ignored.
+        """
+        # The matcher is held per thread, so get it here.
+        matcher = self.matcher
+        n = len(self.locators)
+        outcomes = [None] * n
+        cond = threading.Condition()
+
+        def search(i):
+            try:
+                outcome = (True, self._query(i, name))
+            except Exception as e:
+                outcome = (False, e)
+            with cond:
+                outcomes[i] = outcome
+                cond.notify_all()
+
+        for i in range(1, n):
+            self._submit(search, i)
+        search(0)
+        result = {}
+        for i in range(n):
+            with cond:
+                while outcomes[i] is None:
+                    cond.wait()
+                ok, d = outcomes[i]
+            if not ok:
+                raise d
+            if d:
+                if self.merge:
+                    self._merge(result, d)
+                elif self._is_wanted(d, matcher):
+                    result = d
+                    break
+        return result
+
+    def _submit(self, func, *args):
+        """
+        Queue a search to be run by a worker thread, starting a worker if
+        none is free and there are fewer than :attr:`num_workers`.
+        """
+        with self._lock:
+            # Done under the lock, so that a worker can't decide to exit
+            # (because the queue is empty) without a replacement being started.
+            self._to_search.put((func, args))
+            if (self._idle < self._to_search.qsize() and
+                len(self._threads) < self.num_workers):
+                t = threading.Thread(target=self._search)
+                t.daemon = True
+                self._threads.append(t)
+                t.start()
+
+    def _search(self):
+        """
+        Run queued searches until there have been none for
+        :attr:`worker_idle_timeout` seconds.
+        """
+        me = threading.current_thread()
+        while True:
+            with self._lock:
+                self._idle += 1
+            try:
+                func, args = self._to_search.get(True,
+                                                 self.worker_idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._idle -= 1
+                    if not self._to_search.empty():
+                        continue
+                    self._threads.remove(me)
+                break
+            with self._lock:
+                self._idle -= 1
+            func(*args)
+
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
@@ -1242,11 +3916,23 @@ class DependencyFinder(object):
                     if e in meta_extras:
                         ereqts |= getattr(dist, '%s_requires' % key)
             all_reqts = ireqts | sreqts | ereqts
+            # Look up everything we don't already have a provider for in one
+            # go, so that the lookups can proceed concurrently.
+            missing = [r for r in all_reqts if not self.find_providers(r)]
+            if len(missing) > 1:
+                located = self.locator.locate_many(missing,
+                                                   prereleases=prereleases)
+            else:
+                located = {}
             for r in all_reqts:
                 providers = self.find_providers(r)
                 if not providers:
                     logger.debug('No providers found for %r', r)
-                    provider = self.locator.locate(r, prereleases=prereleases)
+                    if r in located:
+                        provider = located[r]
+                    else:
+                        provider = self.locator.locate(r,
+                                                       prereleases=prereleases)
                     # If no provider is found and we didn't consider
                     # prereleases, consider them now.
                     if provider is None and not prereleases:
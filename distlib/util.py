@@ -33,9 +33,10 @@ import time
 
 from . import DistlibException
 from .compat import (string_types, text_type, shutil, raw_input, StringIO,
-                     cache_from_source, urlopen, urljoin, httplib, xmlrpclib,
+                     cache_from_source, urljoin, httplib, xmlrpclib,
                      splittype, HTTPHandler, BaseConfigurator, valid_ident,
-                     Container, configparser, URLError, ZipFile, fsdecode)
+                     Container, configparser, URLError, ZipFile, fsdecode,
+                     build_opener, urllib2, Request, HTTPError)
 
 logger = logging.getLogger(__name__)
 
@@ -762,7 +763,7 @@ def _get_external_data(url):
         # urlopen might fail if it runs into redirections,
         # because of Python issue #13696. Fixed in locators
         # using a custom redirect handler.
-        resp = urlopen(url)
+        resp = build_pooled_opener().open(url)
         headers = resp.info()
         ct = headers.get('Content-Type')
         if not ct.startswith('application/json'):
@@ -1164,7 +1165,8 @@ class Progress(object):
     def percentage(self):
         if self.done:
             result = '100 %'
-        elif self.max is None:
+        elif self.max is None or self.max == self.min:
+            # An empty range, e.g. a total which isn't known yet
             result = ' ?? %'
         else:
             v = 100.0 * (self.cur - self.min) / (self.max - self.min)
@@ -1355,6 +1357,469 @@ if ssl:
             raise URLError('Unexpected HTTP request on what should be a secure '
                            'connection: %s' % req)
 
+#
+# HTTP connection pooling. The standard library handlers open a new connection
+# (and, for HTTPS, do a new TLS handshake) for every request. The handlers
+# below keep connections open after a response has been read, so that later
+# requests to the same host - from any opener sharing the pool - can reuse
+# them.
+#
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of idle, persistent HTTP connections, keyed by scheme
+    and host.
+    """
+    def __init__(self, maxsize=10, idle_timeout=30.0):
+        """
+        Initialise an instance.
+
+        :param maxsize: The maximum number of idle connections kept for each
+                        host. Connections released when this many are already
+                        being kept are closed.
+        :param idle_timeout: The number of seconds for which an idle
+                             connection is kept. Older connections are closed
+                             rather than reused, as servers are likely to have
+                             closed them.
+        """
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def get(self, key):
+        """
+        Get an idle connection for a key, or ``None`` if there isn't one.
+        """
+        result = None
+        stale = []
+        now = time.time()
+        with self._lock:
+            conns = self._idle.get(key)
+            while conns:
+                conn, when = conns.pop()
+                if (now - when) < self.idle_timeout and conn.sock is not None:
+                    self.reused += 1
+                    result = conn
+                    break
+                stale.append(conn)
+        for conn in stale:
+            conn.close()
+        return result
+
+    def put(self, key, conn):
+        """
+        Return a connection, whose last response has been read completely,
+        to the pool.
+        """
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.maxsize:
+                conns.append((conn, time.time()))
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, when in conns:
+                conn.close()
+
+
+class PooledHTTPResponse(httplib.HTTPResponse):
+    """
+    A response which returns its connection to a pool once the body has been
+    read completely.
+    """
+    _pool = None
+    _pool_key = None
+    _pool_conn = None
+    _pool_closing = False
+
+    def _pool_release(self, complete):
+        conn = self._pool_conn
+        if conn is not None:
+            self._pool_conn = None
+            if complete and not self.will_close:
+                self._pool.put(self._pool_key, conn)
+            else:
+                conn.close()
+
+    if sys.version_info[0] < 3:  # pragma: no cover
+        def close(self):
+            fp = self.fp
+            httplib.HTTPResponse.close(self)
+            if fp is not None:
+                self._pool_release(self.length == 0)
+    else:
+        # The connection is "closed" when the end of the body is reached,
+        # or when the response is closed - we can only reuse it in the
+        # former case (or if there was no body).
+        def _close_conn(self):
+            fp = self.fp
+            httplib.HTTPResponse._close_conn(self)
+            if fp is not None:
+                self._pool_release(self.length == 0 or
+                                   not self._pool_closing)
+
+        def close(self):
+            self._pool_closing = True
+            httplib.HTTPResponse.close(self)
+
+
+class PooledHandlerMixin(object):
+    """
+    Provides a ``do_open`` for HTTP(S) handlers which takes connections from,
+    and returns them to, a :class:`ConnectionPool`.
+    """
+    scheme = None   # set in subclasses
+
+    # The most bytes of an error response's body which are kept. Larger
+    # bodies are cut short, and the connection closed rather than reused.
+    max_error_body = 65536
+
+    def do_open(self, http_class, req, **kwargs):
+        if getattr(req, '_tunnel_host', None):  # pragma: no cover
+            # Not worth pooling connections through proxy tunnels
+            return self._base_do_open(http_class, req, **kwargs)
+        if hasattr(req, 'get_host'):
+            host = req.get_host()
+            selector = req.get_selector()
+        else:
+            host = req.host
+            selector = req.selector
+        if not host:
+            raise URLError('no host given')
+        method = req.get_method()
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((k.title(), v) for k, v in headers.items())
+        key = (self.scheme, host)
+        timeout = req.timeout
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = socket.getdefaulttimeout()
+        while True:
+            conn = self.pool.get(key)
+            reused = conn is not None
+            if reused:
+                conn.timeout = timeout
+                conn.sock.settimeout(timeout)
+            else:
+                conn = http_class(host, timeout=req.timeout, **kwargs)
+                conn.response_class = PooledHTTPResponse
+                # Counted under the lock, as in get(), since the pool may be
+                # shared by several threads.
+                with self.pool._lock:
+                    self.pool.created += 1
+            try:
+                try:
+                    conn.request(method, selector, req.data, headers)
+                except socket.error as e:
+                    raise URLError(e)
+                r = conn.getresponse()
+                break
+            except (URLError, socket.error, httplib.HTTPException) as e:
+                conn.close()
+                # The server may have closed an idle connection just as we
+                # reused it. It's safe to retry idempotent requests when this
+                # happens; otherwise, or on a new connection, give up.
+                if not reused or method not in ('GET', 'HEAD'):
+                    raise
+                logger.debug('Retrying on new connection to %s: %s', host, e)
+        r._pool = self.pool
+        r._pool_key = key
+        r._pool_conn = conn
+        if r.length == 0:
+            # There's no body (e.g. a 304 response), so reading it releases
+            # the connection straight away.
+            r.read()
+        url = req.get_full_url()
+        if r.status >= 300:
+            # Error responses (including redirects) are raised as HTTPError,
+            # which callers often don't read or close, so read the body now.
+            # This returns the connection to the pool (or, if the body is
+            # too big, closes it) rather than leaving it held by the error.
+            headers = r.msg
+            body = r.read(self.max_error_body)
+            r.close()
+            result = urllib2.addinfourl(io.BytesIO(body), headers, url)
+            result.code = r.status
+            result.msg = r.reason
+        elif sys.version_info[0] < 3:  # pragma: no cover
+            r.recv = r.read
+            fp = socket._fileobject(r, close=True)
+            result = urllib2.addinfourl(fp, r.msg, url)
+            result.code = r.status
+            result.msg = r.reason
+        else:
+            r.url = url
+            r.msg = r.reason
+            result = r
+        return result
+
+
+class PooledHTTPHandler(PooledHandlerMixin, HTTPHandler):
+    """
+    An HTTP handler which reuses connections from a :class:`ConnectionPool`.
+    """
+    scheme = 'http'
+    _base_do_open = HTTPHandler.do_open
+
+    def __init__(self, pool=None):
+        HTTPHandler.__init__(self)
+        self.pool = pool or default_connection_pool
+
+if ssl:
+    class PooledHTTPSHandler(PooledHandlerMixin, BaseHTTPSHandler):
+        """
+        An HTTPS handler which reuses connections from a
+        :class:`ConnectionPool`.
+        """
+        scheme = 'https'
+        _base_do_open = BaseHTTPSHandler.do_open
+
+        def __init__(self, pool=None):
+            BaseHTTPSHandler.__init__(self)
+            self.pool = pool or default_connection_pool
+
+# The pool used by default, so that connections are shared between openers
+# (and hence between locators and threads).
+default_connection_pool = ConnectionPool()
+
+def build_pooled_opener(*handlers, **kwargs):
+    """
+    Build an opener, as :func:`build_opener` does, but with handlers for HTTP
+    and HTTPS which reuse persistent connections.
+
+    :param handlers: Any additional handlers for the opener.
+    :param pool: The :class:`ConnectionPool` to use. If not specified, the
+                 default (shared) pool is used.
+    :return: The opener.
+    """
+    pool = kwargs.pop('pool', None)
+    handlers = list(handlers)
+    handlers.append(PooledHTTPHandler(pool))
+    if ssl:
+        handlers.append(PooledHTTPSHandler(pool))
+    return build_opener(*handlers)
+
+
+class HTTPRangeFile(object):
+    """
+    A read-only, seekable file-like object for a resource at an HTTP(S) URL,
+    which fetches only the parts of the resource which are actually read,
+    using HTTP range requests. This allows e.g. a :class:`ZipFile` to read
+    the directory and selected members of a remote archive without the whole
+    archive being downloaded.
+
+    If the server doesn't support range requests, the whole resource is
+    fetched by the first request.
+    """
+
+    # The minimum number of bytes to ask for in each request. Archive readers
+    # tend to make lots of small reads, which would otherwise each need a
+    # request. The first request fetches this many bytes from the end of the
+    # resource, which is where a zip file's directory is.
+    min_fetch = 65536
+
+    _content_range = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+    def __init__(self, url, opener=None, timeout=None):
+        """
+        Initialise an instance.
+
+        :param url: The URL of the resource.
+        :param opener: The opener to use for requests. If not specified, one
+                       using pooled connections is built.
+        :param timeout: The timeout, in seconds, to apply to requests.
+        """
+        self.url = url
+        self.opener = opener or build_pooled_opener()
+        self.timeout = timeout
+        self.requests = 0           # number of requests made
+        self.bytes_fetched = 0      # number of bytes received
+        self._ranges = []           # sorted, non-overlapping (start, data)
+        self._pos = 0
+        self.size = None
+        self._fetch('-%d' % self.min_fetch)
+
+    def _fetch(self, spec, length=None):
+        """
+        Fetch a range of bytes, given by a byte range specifier. If the
+        number of bytes asked for is given and fewer are returned, and the
+        server didn't say how big the resource is, it must end there.
+        """
+        req = Request(self.url, headers={'Range': 'bytes=%s' % spec,
+                                         'Accept-Encoding': 'identity'})
+        resp = self.opener.open(req, timeout=self.timeout)
+        try:
+            data = resp.read()
+            content_range = resp.info().get('Content-Range')
+        finally:
+            resp.close()
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        m = None
+        if content_range:
+            m = self._content_range.match(content_range)
+        if not m:
+            # We got the whole thing
+            logger.debug('Range requests not supported for %s', self.url)
+            self.size = len(data)
+            self._ranges = [(0, data)]
+        else:
+            start = int(m.group(1))
+            if m.group(3) != '*':
+                self.size = int(m.group(3))
+            elif self.size is None:
+                # The size is unknown ("bytes a-b/*"), but a suffix range
+                # ends with the resource, and so does a short one.
+                if spec.startswith('-'):
+                    self.size = int(m.group(2)) + 1
+                elif length is not None and len(data) < length:
+                    self.size = start + len(data)
+            self._add(start, data)
+
+    def _fetch_range(self, start, end):
+        """
+        Fetch the bytes from start up to (but not including) end, which may
+        be past the end of the resource if its size isn't known.
+        """
+        if self.size is not None:
+            end = min(self.size, end)
+        if start >= end:
+            return
+        try:
+            self._fetch('%d-%d' % (start, end - 1), end - start)
+        except HTTPError as e:
+            if e.code != 416 or self.size is not None:
+                raise
+            # Range Not Satisfiable: start is past the end of the resource.
+            self.requests += 1
+            m = re.match(r'bytes\s+\*/(\d+)',
+                         e.info().get('Content-Range', ''))
+            e.close()
+            if m:
+                self.size = int(m.group(1))
+            elif start == self._fetched_end():
+                self.size = start
+
+    def _fetched_end(self):
+        """
+        Return the offset just past the furthest byte fetched.
+        """
+        if not self._ranges:
+            return 0
+        s, d = self._ranges[-1]
+        return s + len(d)
+
+    def _find_size(self):
+        """
+        Return the size of the resource. If the server hasn't said, read on
+        from the furthest byte fetched until the end is found.
+        """
+        while self.size is None:
+            start = self._fetched_end()
+            self._fetch_range(start, start + self.min_fetch)
+        return self.size
+
+    def _add(self, start, data):
+        """
+        Add a fetched range, merging it with any which overlap or adjoin it.
+        """
+        ranges = sorted(self._ranges + [(start, data)], key=lambda t: t[0])
+        merged = []
+        for s, d in ranges:
+            if merged:
+                ms, md = merged[-1]
+                me = ms + len(md)
+                if s <= me:
+                    if s + len(d) > me:
+                        merged[-1] = (ms, md + d[me - s:])
+                    continue
+            merged.append((s, d))
+        self._ranges = merged
+
+    def _missing(self, start, end):
+        """
+        Return the gaps in what's been fetched between two offsets, as a list
+        of (start, end) tuples.
+        """
+        result = []
+        pos = start
+        for s, d in self._ranges:
+            e = s + len(d)
+            if e <= pos:
+                continue
+            if s >= end:
+                break
+            if s > pos:
+                result.append((pos, s))
+            pos = e
+            if pos >= end:
+                break
+        if pos < end:
+            result.append((pos, end))
+        return result
+
+    def read(self, size=-1):
+        start = self._pos
+        if size is None or size < 0:
+            end = self._find_size()
+        elif self.size is None:
+            end = start + size
+        else:
+            end = min(self.size, start + size)
+        for s, e in self._missing(start, end):
+            self._fetch_range(s, max(e, s + self.min_fetch))
+        if self.size is not None:
+            end = min(self.size, end)
+        if start >= end:
+            return b''
+        for s, d in self._ranges:
+            if s <= start < s + len(d):
+                result = d[start - s:end - s]
+                break
+        else:
+            if self.size is None:
+                # Nothing there: we're past the end of the resource
+                return b''
+            raise IOError('Unable to read %s at offset %d' % (self.url,
+                                                              start))
+        self._pos += len(result)
+        return result
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._find_size()
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self._ranges = []
+
 #
 # XML-RPC with timeouts
 #
@@ -1389,7 +1854,8 @@ class Transport(xmlrpclib.Transport):
         else:
             if not self._connection or host != self._connection[0]:
                 self._extra_headers = eh
-                self._connection = host, httplib.HTTPConnection(h)
+                self._connection = host, httplib.HTTPConnection(
+                    h, timeout=self.timeout)
             result = self._connection[1]
         return result
 
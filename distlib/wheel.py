@@ -24,11 +24,13 @@ import tempfile
 import zipfile
 
 from . import __version__, DistlibException
-from .compat import sysconfig, ZipFile, fsdecode, text_type, filter
+from .compat import (sysconfig, ZipFile, fsdecode, text_type, filter,
+                     unquote, urlparse)
 from .database import InstalledDistribution
 from .metadata import Metadata, METADATA_FILENAME
 from .util import (FileOperator, convert_path, CSVReader, CSVWriter, Cache,
-                   cached_property, get_cache_base, read_exports, tempdir)
+                   cached_property, get_cache_base, read_exports, tempdir,
+                   HTTPRangeFile)
 from .version import NormalizedVersion, UnsupportedVersionError
 
 logger = logging.getLogger(__name__)
@@ -211,13 +213,19 @@ class Wheel(object):
                 for arch in self.arch:
                     yield pyver, abi, arch
 
+    def _get_archive(self):
+        """
+        Return what to read the wheel's metadata from: the pathname of the
+        wheel, or a file-like object.
+        """
+        return os.path.join(self.dirname, self.filename)
+
     @cached_property
     def metadata(self):
-        pathname = os.path.join(self.dirname, self.filename)
         name_ver = '%s-%s' % (self.name, self.version)
         info_dir = '%s.dist-info' % name_ver
         wrapper = codecs.getreader('utf-8')
-        with ZipFile(pathname, 'r') as zf:
+        with ZipFile(self._get_archive(), 'r') as zf:
             wheel_metadata = self.get_wheel_metadata(zf)
             wv = wheel_metadata['Wheel-Version'].split('.', 1)
             file_version = tuple([int(i) for i in wv])
@@ -246,8 +254,7 @@ class Wheel(object):
 
     @cached_property
     def info(self):
-        pathname = os.path.join(self.dirname, self.filename)
-        with ZipFile(pathname, 'r') as zf:
+        with ZipFile(self._get_archive(), 'r') as zf:
             result = self.get_wheel_metadata(zf)
         return result
 
@@ -898,6 +905,40 @@ class Wheel(object):
                     shutil.copyfile(newpath, pathname)
         return modified
 
+
+class RemoteWheel(Wheel):
+    """
+    A wheel at an HTTP(S) URL, whose metadata and information can be read
+    without downloading it. Only the directory of the archive and the members
+    needed are fetched, using HTTP range requests.
+    """
+
+    def __init__(self, url, opener=None, timeout=None, **kwargs):
+        """
+        Initialise an instance.
+
+        :param url: The URL of the wheel.
+        :param opener: The opener to use for requests.
+        :param timeout: The timeout, in seconds, to apply to requests.
+        :param kwargs: Passed to the superclass constructor.
+        """
+        filename = posixpath.basename(unquote(urlparse(url).path))
+        super(RemoteWheel, self).__init__(filename, **kwargs)
+        self.url = url
+        self.opener = opener
+        self.timeout = timeout
+
+    @cached_property
+    def archive(self):
+        """
+        The :class:`~distlib.util.HTTPRangeFile` used to read the wheel.
+        """
+        return HTTPRangeFile(self.url, self.opener, self.timeout)
+
+    def _get_archive(self):
+        return self.archive
+
+
 def compatible_tags():
     """
     Return (pyver, abi, arch) tuples compatible with this Python.
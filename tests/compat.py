@@ -17,17 +17,20 @@ else:
 
 if _ver[0] < 3:
     import Queue as queue
-    from SimpleXMLRPCServer import SimpleXMLRPCServer
+    from SimpleXMLRPCServer import (SimpleXMLRPCServer,
+                                    SimpleXMLRPCRequestHandler)
     from SimpleHTTPServer import SimpleHTTPRequestHandler
     from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
     text_type = unicode
     from urllib import unquote
     from urllib2 import Request
     from urlparse import urlparse
 else:
     import queue
-    from xmlrpc.server import SimpleXMLRPCServer
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
     from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
     text_type = str
     from urllib.parse import urlparse, unquote
     from urllib.request import Request
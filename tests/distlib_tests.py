@@ -9,7 +9,8 @@ _ver = sys.version_info[:2]
 
 from test_database import (DataFilesTestCase, TestDatabase, TestDistribution,
                            TestEggInfoDistribution, DepGraphTestCase)
-from test_index import PackageIndexTestCase
+from test_index import (PackageIndexTestCase, DownloadFileTestCase,
+                        DownloadManagerTestCase, MirrorTestCase)
 from test_locators import LocatorTestCase
 from test_manifest import ManifestTestCase
 from test_markers import MarkersTestCase
@@ -5,6 +5,7 @@
 #
 import codecs
 import os
+import re
 import logging
 import logging.handlers
 import shutil
@@ -22,7 +23,7 @@ except ImportError:
 import weakref
 
 from compat import (unittest, HTTPServer as BaseHTTPServer,
-                    SimpleHTTPRequestHandler, urlparse)
+                    SimpleHTTPRequestHandler, ThreadingMixIn, urlparse)
 
 from distlib import logger
 
@@ -257,6 +258,146 @@ class HTTPSServerThread(threading.Thread):
     def stop(self):
         self.server.shutdown()
 
+class IndexRequestHandler(SimpleHTTPRequestHandler):
+    """
+    A handler which serves canned responses from the server's ``routes``
+    dictionary, keyed by path. Each route is a dictionary with a ``body``
+    (bytes) and optionally ``content_type``, ``etag``, ``last_modified`` and
+    ``encoding`` (a function to compress the body with, keyed by the
+    Content-Encoding it implements, used if the client accepts it) and
+    ``json`` (a body to send instead, as JSON per PEP 691, if the client
+    accepts that). Single byte ranges are supported, unless the route has
+    ``ranges`` set to ``False``, and ``If-Range`` is checked against the
+    ETag. If the route has ``size_unknown`` set, the total size isn't given
+    in Content-Range headers (``bytes a-b/*``). A route can also give a
+    ``status`` other than 200, to be sent with its body, and a ``truncate``
+    list of byte counts: for each request, one is taken from the list and
+    only that many bytes of the response are sent before the connection is
+    closed, to simulate an unreliable network.
+    Requests are recorded in the server's ``requests`` list as (path, headers)
+    tuples, so tests can check what was asked for.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+    # Responses are written in several pieces, so without this, Nagle's
+    # algorithm and delayed ACKs hold up each response on a kept-alive
+    # connection (by 40ms on Linux).
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        headers = dict((k.lower(), v) for k, v in self.headers.items())
+        server.requests.append((self.path, headers))
+        server.client_ports.append(self.client_address[1])
+        route = server.routes.get(self.path)
+        if route is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = route.get('etag')
+        if etag and headers.get('if-none-match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = route['body']
+        content_type = route.get('content_type', 'text/html; charset=utf-8')
+        if ('json' in route and 'application/vnd.pypi.simple.v1+json' in
+            headers.get('accept', '')):
+            body = route['json']
+            content_type = 'application/vnd.pypi.simple.v1+json'
+        status = route.get('status', 200)
+        content_range = None
+        m = re.match(r'bytes=(\d*)-(\d*)$', headers.get('range', ''))
+        if_range = headers.get('if-range')
+        if (m and route.get('ranges', True) and
+            (not if_range or if_range == etag)):
+            size = len(body)
+            start, end = m.groups()
+            if not start:
+                start = max(0, size - int(end))
+                end = size - 1
+            else:
+                start = int(start)
+                end = min(size - 1, int(end or size - 1))
+            total = '*' if route.get('size_unknown') else str(size)
+            if start >= size:
+                self.send_response(416)
+                if not route.get('size_unknown'):
+                    self.send_header('Content-Range', 'bytes */%d' % size)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            content_range = 'bytes %d-%d/%s' % (start, end, total)
+            body = body[start:end + 1]
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        if etag:
+            self.send_header('ETag', etag)
+        if route.get('last_modified'):
+            self.send_header('Last-Modified', route['last_modified'])
+        accepted = headers.get('accept-encoding', '')
+        for name, compress in route.get('encoding', {}).items():
+            if name in accepted:
+                body = compress(body)
+                self.send_header('Content-Encoding', name)
+                break
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if route.get('truncate'):
+            body = body[:route['truncate'].pop(0)]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingHTTPServer(ThreadingMixIn, BaseHTTPServer):
+    daemon_threads = True
+
+class IndexServerThread(threading.Thread):
+    """
+    A thread running an HTTP server on a random local port, to stand in for
+    a package index. Connections are handled in separate threads, as clients
+    may keep them open.
+    """
+    def __init__(self, routes=None):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          IndexRequestHandler)
+        self.server.routes = routes or {}
+        self.server.requests = []
+        self.server.client_ports = []
+        self.port = self.server.server_port
+        self.url = 'http://127.0.0.1:%d/' % self.port
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    @property
+    def routes(self):
+        return self.server.routes
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def client_ports(self):
+        return self.server.client_ports
+
+    def run(self):
+        try:
+            self.server.serve_forever(0.05)
+        finally:
+            self.server.server_close()
+
+    def stop(self):
+        self.server.shutdown()
+
 try:
     import zlib
 except ImportError:
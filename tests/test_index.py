@@ -5,6 +5,7 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 import codecs
+import hashlib
 import json
 import logging
 import os
@@ -23,12 +24,15 @@ except ImportError:
     import dummy_threading as threading
 
 from compat import unittest, Request
+from support import IndexServerThread
 if ssl:
     from support import HTTPSServerThread
 
 from distlib import DistlibException
-from distlib.compat import urlopen, HTTPError, URLError
-from distlib.index import PackageIndex
+from distlib.compat import (urlopen, urlparse, HTTPError, URLError,
+                            pathname2url, url2pathname)
+from distlib.index import PackageIndex, Mirror, DownloadManager, FileStore
+from distlib.locators import SimpleScrapingLocator, DirectoryLocator
 from distlib.metadata import Metadata, MetadataMissingError, METADATA_FILENAME
 from distlib.util import zip_dir
 
@@ -312,5 +316,335 @@ class PackageIndexTestCase(unittest.TestCase):
         self.assertEqual(len(result), 0)
 
 
+class DownloadFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(3 << 20)
+        self.digest = ('sha256', hashlib.sha256(self.data).hexdigest())
+        self.server = IndexServerThread({'/foo.tar.gz': {'body': self.data,
+                                                         'etag': '"1"'}})
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.url = self.server.url + 'foo.tar.gz'
+        self.route = self.server.routes['/foo.tar.gz']
+        self.index = PackageIndex(self.server.url)
+        base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base)
+        self.destfile = os.path.join(base, 'foo.tar.gz')
+
+    def check_file(self):
+        with open(self.destfile, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(os.path.dirname(self.destfile)),
+                         ['foo.tar.gz'])
+
+    def test_resume(self):
+        self.route['truncate'] = [1000000, 500000]
+        self.index.download_file(self.url, self.destfile, self.digest)
+        self.check_file()
+        ranges = [h.get('range') for p, h in self.server.requests]
+        self.assertEqual(ranges, [None, 'bytes=1000000-', 'bytes=1500000-'])
+        self.assertEqual(self.server.requests[1][1]['if-range'], '"1"')
+
+        # A failed download is resumed by the next call
+        os.remove(self.destfile)
+        del self.server.requests[:]
+        self.route['truncate'] = [1000, 1000]
+        self.assertRaises(DistlibException, self.index.download_file,
+                          self.url, self.destfile, self.digest, retries=1)
+        self.assertTrue(os.path.exists(self.destfile + '.part.json'))
+        self.index.download_file(self.url, self.destfile, self.digest)
+        self.check_file()
+        self.assertEqual(self.server.requests[-1][1]['range'], 'bytes=2000-')
+
+        # If the file changes, it's downloaded again from the start
+        os.remove(self.destfile)
+        self.route['truncate'] = [1000]
+        self.assertRaises(DistlibException, self.index.download_file,
+                          self.url, self.destfile, self.digest, retries=0)
+        self.data = self.data[::-1]
+        self.route.update(body=self.data, etag='"2"')
+        digest = ('sha256', hashlib.sha256(self.data).hexdigest())
+        self.index.download_file(self.url, self.destfile, digest)
+        self.check_file()
+
+    def test_resume_after_kill(self):
+        # KeyboardInterrupt isn't handled by download_file, so the files it
+        # leaves are as they would be if the process had been killed.
+        def interrupt(blocknum, blocksize, size):
+            if blocknum * blocksize >= 1000000:
+                raise KeyboardInterrupt
+
+        partfile = self.destfile + '.part'
+        self.assertRaises(KeyboardInterrupt, self.index.download_file,
+                          self.url, self.destfile, self.digest, interrupt)
+        with open(partfile + '.json') as f:
+            state = json.load(f)
+        self.assertEqual(state['size'], len(self.data))
+        self.assertEqual(state['etag'], '"1"')
+        size = os.path.getsize(partfile)
+        self.assertTrue(0 < size < len(self.data))
+        del self.server.requests[:]
+        self.index.download_file(self.url, self.destfile, self.digest)
+        self.check_file()
+        headers = self.server.requests[0][1]
+        self.assertEqual(headers['range'], 'bytes=%d-' % size)
+        self.assertEqual(headers['if-range'], '"1"')
+
+        # The progress of segments is saved as they're downloaded
+        os.remove(self.destfile)
+        self.index.state_interval = 65536
+        saved = []
+
+        def check_state(blocknum, blocksize, size):
+            if blocknum * blocksize >= 2000000 and not saved:
+                with open(partfile + '.json') as f:
+                    saved.append(json.load(f))
+
+        self.index.download_file(self.url, self.destfile, self.digest,
+                                 check_state, segments=3)
+        self.check_file()
+        done = [d for s, e, d in saved[0]['segments']]
+        self.assertTrue(sum(done) > 0)
+        self.assertTrue(all(d % 65536 == 0 for d in done))
+
+    def test_stale_part(self):
+        # A .part file without a saved state isn't resumed, even though the
+        # size of the file is found when deciding whether to use segments
+        partfile = self.destfile + '.part'
+        with open(partfile, 'wb') as f:
+            f.write(b'x' * 1000)
+        self.index.min_segment_size = len(self.data)
+        self.index.download_file(self.url, self.destfile, self.digest,
+                                 segments=4)
+        self.check_file()
+        ranges = [h.get('range') for p, h in self.server.requests]
+        self.assertEqual(ranges, ['bytes=0-0', None])
+
+        # If the .part file is too long to resume, it's downloaded again
+        os.remove(self.destfile)
+        del self.server.requests[:]
+        with open(partfile, 'wb') as f:
+            f.write(b'x' * (len(self.data) + 10))
+        with open(partfile + '.json', 'w') as f:
+            json.dump({'url': self.url, 'size': len(self.data) + 100,
+                       'etag': '"1"'}, f)
+        self.index.download_file(self.url, self.destfile, self.digest)
+        self.check_file()
+        ranges = [h.get('range') for p, h in self.server.requests]
+        self.assertEqual(ranges, ['bytes=%d-' % (len(self.data) + 10), None])
+
+    def test_segments(self):
+        self.route['truncate'] = [None, 100000]
+        progress = []
+
+        def reporthook(*args):
+            progress.append(args)
+
+        self.index.download_file(self.url, self.destfile, self.digest,
+                                 reporthook, segments=4)
+        self.check_file()
+        ranges = [h['range'] for p, h in self.server.requests]
+        # A probe, three segments, and the rest of the interrupted one
+        self.assertEqual(len(ranges), 5)
+        self.assertEqual(ranges[0], 'bytes=0-0')
+        segments = ['bytes=%d-%d' % (i << 20, ((i + 1) << 20) - 1)
+                    for i in range(3)]
+        self.assertEqual(sorted(ranges[1:4]), segments)
+        resumed = ['bytes=%d-%d' % ((i << 20) + 100000, ((i + 1) << 20) - 1)
+                   for i in range(3)]
+        self.assertIn(ranges[4], resumed)
+        self.assertEqual(progress[-1][2], len(self.data))
+
+        # Without range support, it's downloaded in one go
+        os.remove(self.destfile)
+        del self.server.requests[:]
+        self.route['ranges'] = False
+        self.index.download_file(self.url, self.destfile, self.digest,
+                                 segments=4)
+        self.check_file()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_digest_mismatch(self):
+        self.assertRaises(DistlibException, self.index.download_file,
+                          self.url, self.destfile, ('sha256', 'ab' * 32))
+        self.assertEqual(os.listdir(os.path.dirname(self.destfile)), [])
+        # Client errors aren't retried
+        self.assertRaises(HTTPError, self.index.download_file,
+                          self.server.url + 'missing', self.destfile)
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class DownloadManagerTestCase(unittest.TestCase):
+    def test_download(self):
+        data = {'a': b'a' * 100000, 'b': b'b' * 1000, 'c': b'c' * 10}
+        routes = dict(('/%s.tar.gz' % k, {'body': v}) for k, v in data.items())
+        routes['/bad.tar.gz'] = {'body': data['c']}
+        server = IndexServerThread(routes)
+        server.start()
+        self.addCleanup(server.stop)
+        base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base)
+        sha256 = dict((k, hashlib.sha256(v).hexdigest())
+                      for k, v in data.items())
+        url = server.url + '%s.tar.gz'
+        files = [
+            (url % 'a', ('sha256', sha256['a'])),
+            # The same file at another URL, and a URL which doesn't work
+            (url % 'missing', ('sha256', sha256['a'])),
+            (url % 'a', ('sha256', sha256['a'])),
+            (url % 'b', hashlib.md5(data['b']).hexdigest()),
+            (url % 'c', None),
+            (url % 'bad', ('sha256', 'ab' * 32)),
+        ]
+        manager = DownloadManager(FileStore(base), num_workers=3)
+        progress = []
+        paths, failed = manager.download(files, lambda p: progress.append(
+                                                    (p.cur, p.max)))
+        self.assertEqual(set(paths), set([url % 'a', url % 'missing',
+                                          url % 'b', url % 'c']))
+        self.assertEqual(paths[url % 'missing'], paths[url % 'a'])
+        for k, v in data.items():
+            with open(paths[url % k], 'rb') as f:
+                self.assertEqual(f.read(), v)
+            self.assertEqual(os.path.basename(paths[url % k]), sha256[k])
+        self.assertEqual(list(failed), [url % 'bad'])
+        self.assertIn('digest mismatch', str(failed[url % 'bad']))
+        requested = sorted(p for p, h in server.requests)
+        self.assertEqual(requested.count('/a.tar.gz'), 1)
+        self.assertEqual(requested.count('/b.tar.gz'), 1)
+        stats = manager.stats
+        self.assertEqual(stats['downloaded'], 3)
+        self.assertEqual(stats['bytes'], 101020)
+        self.assertIsInstance(stats['rate'], float)
+        # The total expected grows with the sizes of the downloads started
+        self.assertEqual(max(progress), (101020, 101020))
+        self.assertTrue(all(cur <= total for cur, total in progress))
+        self.assertEqual(manager.progress.max, 101020)
+        self.assertTrue(manager.progress.done)
+        # Nothing left over from failed downloads
+        self.assertFalse([fn for fn in os.listdir(base)
+                          if fn.startswith('.part')])
+        # Files in the store aren't downloaded again, even if only their
+        # MD5 digests are given
+        n = len(server.requests)
+        manager = DownloadManager(FileStore(base))
+        paths2, failed = manager.download(files[:4])
+        self.assertEqual(failed, {})
+        self.assertEqual(paths2[url % 'b'], paths[url % 'b'])
+        self.assertEqual(len(server.requests), n)
+        self.assertEqual(manager.stats['reused'], 3)
+        # Downloads which end early don't count towards the total
+        server.routes['/short.tar.gz'] = {'body': b'x' * 100,
+                                          'truncate': [40]}
+        manager = DownloadManager(FileStore(base))
+        paths, failed = manager.download([(url % 'short', None)])
+        self.assertEqual(list(failed), [url % 'short'])
+        self.assertEqual(manager.progress.max, 40)
+        self.assertEqual(manager.stats['bytes'], 40)
+
+
+class MirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.files = {}
+        self.server = IndexServerThread({})
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.locator = SimpleScrapingLocator(self.server.url + 'simple/',
+                                             timeout=5)
+
+    def add_file(self, filename, data, digest=None):
+        """
+        Add a file for project 'foo' to the index served by the test server.
+        """
+        self.files[filename] = digest or hashlib.sha256(data).hexdigest()
+        self.server.routes['/files/' + filename] = {'body': data}
+        links = ['<a href="/files/%s#sha256=%s">%s</a>' % (fn, d, fn)
+                 for fn, d in sorted(self.files.items())]
+        body = ('<html><body>%s</body></html>' % ''.join(links))
+        self.server.routes['/simple/foo/'] = {'body': body.encode('utf-8')}
+        self.locator.clear_cache()
+
+    def downloads(self):
+        return [p for p, h in self.server.requests if p.startswith('/files/')]
+
+    def test_sync(self):
+        self.add_file('foo-1.0.tar.gz', b'foo 1.0')
+        self.add_file('foo-1.1.tar.gz', b'foo 1.1')
+        self.add_file('foo-2.0b1.tar.gz', b'foo 2.0b1')
+        index = PackageIndex()
+        mirror = Mirror(self.root, self.locator, index, num_workers=2)
+        files = mirror.find_files(['foo (< 2.0)'], latest_only=True)
+        self.assertEqual([f['path'] for f in files], ['foo/foo-1.1.tar.gz'])
+        result = mirror.sync(['foo'])
+        self.assertEqual(result['downloaded'], ['foo/foo-1.0.tar.gz',
+                                                'foo/foo-1.1.tar.gz'])
+        self.assertEqual((result['skipped'], result['failed']), (0, {}))
+        with open(os.path.join(self.root, 'foo', 'foo-1.0.tar.gz'),
+                  'rb') as f:
+            self.assertEqual(f.read(), b'foo 1.0')
+        self.assertEqual(
+            mirror.manifest['files']['foo/foo-1.1.tar.gz']['sha256'],
+            self.files['foo-1.1.tar.gz'])
+        # The mirror can be served by a DirectoryLocator, or using its
+        # static index
+        locator = DirectoryLocator(self.root)
+        self.assertEqual(set(locator.get_project('foo')['urls']),
+                         set(['1.0', '1.1']))
+        url = 'file:' + pathname2url(os.path.join(self.root, 'simple'))
+        locator = SimpleScrapingLocator(url)
+        result = locator.get_project('foo')
+        self.assertEqual(set(result['urls']), set(['1.0', '1.1']))
+        dist = result['1.0']
+        self.assertEqual(dist.digest,
+                         ('sha256', self.files['foo-1.0.tar.gz']))
+        self.assertTrue(os.path.exists(url2pathname(
+            urlparse(dist.source_url).path)))
+        self.assertEqual(len(self.downloads()), 2)
+
+        # Later runs only download new files
+        self.add_file('foo-1.2.tar.gz', b'foo 1.2')
+        mirror = Mirror(self.root, self.locator, index)
+        result = mirror.sync(['foo', 'foo (1.2)'])
+        self.assertEqual(result['downloaded'], ['foo/foo-1.2.tar.gz'])
+        self.assertEqual(result['skipped'], 2)
+        self.assertEqual(len(self.downloads()), 3)
+
+        # Files with the wrong digest aren't mirrored
+        self.add_file('foo-1.3.tar.gz', b'foo 1.3', digest='ab' * 32)
+        result = mirror.sync(['foo'])
+        self.assertEqual(list(result['failed']),
+                         [self.server.url + 'files/foo-1.3.tar.gz'])
+        self.assertIsInstance(result['failed'].popitem()[1],
+                              DistlibException)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'foo'))),
+                         ['foo-1.0.tar.gz', 'foo-1.1.tar.gz',
+                          'foo-1.2.tar.gz'])
+        self.assertNotIn('foo/foo-1.3.tar.gz', mirror.manifest['files'])
+
+        # Complete files missing from the manifest (say, if a run was
+        # interrupted) are added to it without being downloaded again
+        os.remove(mirror.manifest_path)
+        mirror = Mirror(self.root, self.locator, index)
+        result = mirror.sync(['foo (< 1.3)'])
+        self.assertEqual((result['downloaded'], result['skipped']), ([], 3))
+        self.assertEqual(len(mirror.manifest['files']), 3)
+        self.assertEqual(len(self.downloads()), 4)
+
+    def test_lazy_locator_import(self):
+        # Importing distlib.index shouldn't import distlib.locators: the
+        # default locator is only looked up when a Mirror needs it
+        code = ('import sys; import distlib.index; '
+                'sys.exit("distlib.locators" in sys.modules)')
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(HERE)
+        self.assertEqual(subprocess.call([sys.executable, '-c', code],
+                                         env=env), 0)
+        mirror = Mirror(self.root)
+        from distlib.locators import default_locator
+        self.assertIs(mirror.locator, default_locator)
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
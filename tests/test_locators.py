@@ -5,27 +5,136 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 from __future__ import unicode_literals
+import hashlib
+import io
+import json
 import os
+import shutil
+import socket
 try:
     import ssl
 except ImportError:
     ssl = None
 import sys
+import tempfile
+import time
+import zlib
+try:
+    import threading
+except ImportError:
+    import dummy_threading as threading
 
-from compat import unittest
+from compat import (unittest, SimpleXMLRPCServer, SimpleXMLRPCRequestHandler,
+                    ThreadingMixIn)
+from support import IndexServerThread
 
-from distlib.compat import url2pathname, urlparse, urljoin
+from distlib import DistlibException
+from distlib.compat import (url2pathname, urlparse, urljoin, ZipFile,
+                            HTTPError)
+from distlib.util import (ConnectionPool, PooledHTTPHandler,
+                          build_pooled_opener)
 from distlib.database import (Distribution, DistributionPath, make_graph,
                               make_dist)
-from distlib.locators import (SimpleScrapingLocator, PyPIRPCLocator,
+from distlib.metadata import MetadataInvalidError
+from distlib.version import get_scheme
+from distlib.locators import (Locator, SimpleScrapingLocator, PyPIRPCLocator,
                               PyPIJSONLocator, DirectoryLocator,
                               DistPathLocator, AggregatingLocator,
                               JSONLocator, DistPathLocator,
-                              DependencyFinder, locate,
+                              DependencyFinder, locate, PageCache,
+                              LocatorCache, ProjectStore, HostHealth,
+                              NameIndex, Page, LinkExtractor,
                               get_all_distribution_names, default_locator)
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 
+
+class CountingLocator(Locator):
+    """
+    A locator which finds version 1.0 of any project except 'missing', and
+    counts how many times it's asked to.
+    """
+    calls = 0
+
+    def _get_project(self, name):
+        self.calls += 1
+        result = {'urls': {}, 'digests': {}}
+        if name != 'missing':
+            url = 'http://example.com/%s-1.0.tar.gz' % name
+            dist = make_dist(name, '1.0', scheme=self.scheme)
+            dist.metadata.source_url = url
+            dist.digest = ('sha256', 'ab' * 32)
+            dist.locator = self
+            result['1.0'] = dist
+            result['urls']['1.0'] = set([url])
+            result['digests'][url] = dist.digest
+        return result
+
+
+class RPCRequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        SimpleXMLRPCRequestHandler.setup(self)
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    A stand-in for the PyPI XML-RPC interface, serving a project with a
+    number of releases and counting the calls made to it.
+    """
+    daemon_threads = True
+
+    def __init__(self, releases, multicall=True):
+        SimpleXMLRPCServer.__init__(self, ('localhost', 0),
+                                    requestHandler=RPCRequestHandler,
+                                    logRequests=False)
+        self.releases = releases
+        self.counts = dict.fromkeys(('connections', 'package_releases',
+                                     'release_urls', 'release_data'), 0)
+        self.lock = threading.Lock()
+        for name in ('package_releases', 'release_urls', 'release_data'):
+            self.register_function(getattr(self, name))
+        if multicall:
+            self.register_multicall_functions()
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://localhost:%d/' % self.server_address[1]
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def package_releases(self, name, show_hidden):
+        self.count('package_releases')
+        return self.releases if name == 'foo' else []
+
+    def release_urls(self, name, version):
+        self.count('release_urls')
+        url = 'http://example.com/foo-%s.tar.gz' % version
+        return [{'url': url, 'md5_digest': 'ab' * 16}]
+
+    def release_data(self, name, version):
+        self.count('release_data')
+        return {'name': name, 'version': version, 'summary': 'Foo'}
+
+
+SARGE_PAGE = b'''<html><body>
+<a href="/files/sarge-0.1.tar.gz#md5=961ddd9bc085fdd8b248c6dd96ceb1c8">sarge-0.1.tar.gz</a>
+<a href="/files/sarge-0.1.1.tar.gz">sarge-0.1.1.tar.gz</a>
+</body></html>
+'''
+
 PYPI_RPC_HOST = 'http://python.org/pypi'
 
 PYPI_WEB_HOST = os.environ.get('PYPI_WEB_HOST', 'https://pypi.python.org/simple/')
@@ -57,6 +166,87 @@ class LocatorTestCase(unittest.TestCase):
             raise unittest.SkipTest('PyPI XML-RPC not available')
         self.assertGreater(len(names), 25000)
 
+    def test_json_local(self):
+        def file_info(version, ext):
+            fn = 'foo-%s%s' % (version, ext)
+            return {'filename': fn, 'url': 'http://example.com/' + fn,
+                    'md5_digest': 'ab' * 16, 'packagetype': 'sdist',
+                    'digests': {'md5': 'ab' * 16, 'sha256': 'cd' * 32},
+                    'size': 1000, 'comment_text': '', 'has_sig': False}
+
+        releases = dict((v, [file_info(v, '.tar.gz'), file_info(v, '.zip')])
+                        for v in ('0.9', '1.0', '1.1'))
+        releases['1.2'] = []
+        doc = {'info': {'name': 'foo', 'version': '1.1', 'summary': 'Foo',
+                        'license': 'BSD', 'description': 'x' * 1000},
+               'urls': releases['1.1'], 'releases': releases}
+        server = IndexServerThread({
+            '/pypi/foo/json': {'body': json.dumps(doc).encode('utf-8')},
+        })
+        server.start()
+        try:
+            locator = PyPIJSONLocator(server.url + 'pypi/')
+            result = locator.get_project('foo')
+        finally:
+            server.stop()
+        self.assertEqual(set(result), set(['urls', 'digests', '0.9', '1.0',
+                                           '1.1', '1.2']))
+        self.assertEqual(len(result['digests']), 6)
+        self.assertEqual(result['digests']['http://example.com/foo-1.0.zip'],
+                         ('md5', 'ab' * 16))
+        dist = result['1.1']
+        self.assertEqual(dist.metadata.summary, 'Foo')
+        self.assertEqual(dist.metadata.license, 'BSD')
+        self.assertEqual(len(dist.download_urls), 2)
+        # Metadata for other releases is only created when needed
+        dist = result['1.0']
+        self.assertIsNone(dist._metadata)
+        self.assertIs(dist.locator, locator)
+        self.assertEqual(dist.download_urls,
+                         set(['http://example.com/foo-1.0.tar.gz',
+                              'http://example.com/foo-1.0.zip']))
+        self.assertEqual(dist.metadata.version, '1.0')
+        dist = locator.locate('foo (< 1.1)')
+        self.assertEqual(dist.version, '1.0')
+        # File information is reduced to what's used as it's decoded
+        info = locator._reduce_file_info(file_info('1.0', '.zip'))
+        self.assertEqual(info, {'url': 'http://example.com/foo-1.0.zip',
+                                'md5_digest': 'ab' * 16})
+        self.assertEqual(locator._reduce_file_info({'url': 'x'}),
+                         {'url': 'x'})
+
+    def test_xmlrpc_multicall(self):
+        releases = ['1.%d' % i for i in range(25)]
+        for multicall in (True, False):
+            server = RPCServer(releases, multicall=multicall)
+            try:
+                for chunk_size, workers in ((10, 1), (None, 1), (7, 3),
+                                            (100, 4)):
+                    locator = PyPIRPCLocator(server.url,
+                                             chunk_size=chunk_size,
+                                             workers=workers)
+                    result = locator.get_project('foo')
+                    self.assertEqual(len(result), 27)
+                    dist = result['1.7']
+                    self.assertEqual(dist.source_url,
+                                     'http://example.com/foo-1.7.tar.gz')
+                    self.assertEqual(dist.digest, ('md5', 'ab' * 16))
+                    self.assertEqual(dist.metadata.summary, 'Foo')
+                    self.assertEqual(len(result['digests']), 25)
+                    self.assertEqual(len(locator.get_project('bar')), 2)
+                self.assertEqual(server.counts['package_releases'], 8)
+                self.assertEqual(server.counts['release_urls'], 100)
+                self.assertEqual(server.counts['release_data'], 100)
+                # Calls are made over a single connection unless concurrent
+                server.counts['connections'] = 0
+                locator = PyPIRPCLocator(server.url, chunk_size=5)
+                locator.get_project('foo')
+                locator.get_project('bar')
+                self.assertEqual(server.counts['connections'], 1)
+                self.assertEqual(locator._multicall, multicall)
+            finally:
+                server.stop()
+
     @unittest.skipIf('SKIP_ONLINE' in os.environ, 'Skipping online test')
     @unittest.skipUnless(ssl, 'SSL required for this test.')
     def test_json(self):
@@ -144,6 +334,108 @@ class LocatorTestCase(unittest.TestCase):
         expected = set(['coverage'])
         self.assertEqual(names, expected)
 
+    def test_dir_index(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        sub = os.path.join(d, 'sub')
+        os.mkdir(sub)
+
+        def touch(*parts):
+            with open(os.path.join(d, *parts), 'wb'):
+                pass
+
+        touch('foo-1.0.tar.gz')
+        touch('sub', 'foo-1.1.zip')
+        touch('foo_bar-0.1-py2.py3-none-any.whl')
+        touch('python-3parclient-4.0.tar.gz')
+        touch('py-3-thing-1.0.tar.gz')
+        touch('README.txt')
+        locator = DirectoryLocator(d)
+        scans = []
+        original = locator._scan
+
+        def scan(mtimes):
+            scans.append(1)
+            return original(mtimes)
+
+        locator._scan = scan
+        self.assertEqual(set(locator.get_project('foo')) - set(['urls',
+                                                                 'digests']),
+                         set(['1.0', '1.1']))
+        self.assertIn('0.1', locator.get_project('Foo.Bar'))
+        # Names which the filename regex can't split are still found
+        self.assertIn('4.0', locator.get_project('python-3parclient'))
+        # including those with parts which look like versions
+        self.assertIn('1.0', locator.get_project('py-3-thing'))
+        self.assertEqual(locator.get_project('bar'),
+                         {'urls': {}, 'digests': {}})
+        self.assertEqual(locator.get_distribution_names(),
+                         set(['foo', 'foo_bar', 'python', 'py']))
+        self.assertEqual(len(scans), 1)
+        # Changes aren't seen until the locator is refreshed ...
+        touch('sub', 'bar-2.0.tar.gz')
+        self.assertNotIn('2.0', locator.get_project('bar'))
+        locator.refresh()
+        self.assertIn('2.0', locator.get_project('bar'))
+        self.assertEqual(len(scans), 2)
+        # ... unless automatic refreshing is enabled.
+        locator.auto_refresh = True
+        self.assertIn('2.0', locator.get_project('bar'))
+        self.assertEqual(len(scans), 2)
+        touch('sub', 'bar-2.1.tar.gz')
+        os.utime(sub, (0, 0))
+        self.assertIn('2.1', locator.get_project('bar'))
+        self.assertEqual(len(scans), 3)
+
+    def test_dir_index_file(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        sub = os.path.join(d, 'sub')
+        os.mkdir(sub)
+        for fn in ('foo-1.0.tar.gz', 'sub/foo-1.1.zip', 'sub/bar-0.1.zip'):
+            with open(os.path.join(d, fn), 'wb'):
+                pass
+        os.utime(d, (1000, 1000))
+        os.utime(sub, (1000, 1000))
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir)
+        index_file = os.path.join(index_dir, 'index', 'dirs.json')
+
+        def versions(locator, name):
+            return set(locator.get_project(name)) - set(['urls', 'digests'])
+
+        locator = DirectoryLocator(d, index_file=index_file)
+        self.assertEqual(versions(locator, 'foo'), set(['1.0', '1.1']))
+        self.assertEqual(locator.rescanned, 2)
+        self.assertTrue(os.path.exists(index_file))
+        # A new locator uses the saved index without listing directories
+        locator = DirectoryLocator(d, index_file=index_file)
+        self.assertEqual(versions(locator, 'foo'), set(['1.0', '1.1']))
+        self.assertEqual(locator.get_distribution_names(),
+                         set(['foo', 'bar']))
+        self.assertEqual(locator.rescanned, 0)
+        # Only directories which have changed are listed again
+        with open(os.path.join(sub, 'foo-1.2.tar.gz'), 'wb'):
+            pass
+        os.utime(sub, (2000, 2000))
+        locator = DirectoryLocator(d, index_file=index_file)
+        self.assertEqual(versions(locator, 'foo'), set(['1.0', '1.1', '1.2']))
+        self.assertEqual(locator.rescanned, 1)
+        # Recently modified directories aren't trusted in saved indexes
+        os.utime(sub, None)
+        locator = DirectoryLocator(d, index_file=index_file)
+        locator.get_project('foo')
+        self.assertEqual(locator.rescanned, 1)
+        locator = DirectoryLocator(d, index_file=index_file)
+        locator.get_project('foo')
+        self.assertEqual(locator.rescanned, 1)
+        # Indexes for other directories, or in other formats, are ignored
+        other = os.path.join(d, 'other')
+        os.mkdir(other)
+        locator = DirectoryLocator(other, index_file=index_file)
+        self.assertEqual(locator.get_distribution_names(), set())
+        self.assertEqual(locator.rescanned, 1)
+
     def test_path(self):
         fakes = os.path.join(HERE, 'fake_dists')
         sys.path.insert(0, fakes)
@@ -302,6 +594,548 @@ class LocatorTestCase(unittest.TestCase):
         for url1, url2 in cases:
             self.assertEqual(default_locator.prefer_url(url1, url2), url1)
 
+    def test_concurrent_aggregation(self):
+        class FakeLocator(Locator):
+            def __init__(self, versions, wait_for=None, called=None,
+                         error=False):
+                super(FakeLocator, self).__init__()
+                self.versions = versions
+                self.wait_for = wait_for
+                self.called = called
+                self.error = error
+
+            def _get_project(self, name):
+                if self.called:
+                    self.called.set()
+                if self.wait_for:
+                    self.wait_for.wait(5.0)
+                if self.error:
+                    raise ValueError('locator failed')
+                result = {'urls': {}, 'digests': {}}
+                for v in self.versions:
+                    url = 'http://%s/%s-%s.tar.gz' % (id(self), name, v)
+                    result[v] = make_dist(name, v)
+                    result['urls'][v] = set([url])
+                    result['digests'][url] = None
+                return result
+
+        # A slow first locator doesn't stop the second being searched
+        called = threading.Event()
+        loc1 = FakeLocator([], wait_for=called)
+        loc2 = FakeLocator(['1.0'], called=called)
+        locator = AggregatingLocator(loc1, loc2, concurrent=True)
+        start = time.time()
+        self.assertEqual(locator.locate('foo').version, '1.0')
+        self.assertLess(time.time() - start, 4.0)
+        # The first wanted result is used, without waiting for later ones
+        release = threading.Event()
+        self.addCleanup(release.set)
+        loc1 = FakeLocator(['0.9'])
+        loc2 = FakeLocator(['1.0'])
+        loc3 = FakeLocator(['1.1'], wait_for=release)
+        locator = AggregatingLocator(loc1, loc2, loc3, concurrent=True)
+        start = time.time()
+        self.assertEqual(locator.locate('foo (>= 1.0)').version, '1.0')
+        self.assertLess(time.time() - start, 4.0)
+        release.set()
+        # Merged results are the same as when searching sequentially
+        sequential = AggregatingLocator(loc1, loc2, loc3, merge=True)
+        locator = AggregatingLocator(loc1, loc2, loc3, merge=True,
+                                     concurrent=True)
+        expected = sequential.get_project('bar')
+        self.assertEqual(locator.get_project('bar'), expected)
+        self.assertEqual(set(expected['urls']), set(['0.9', '1.0', '1.1']))
+        stats = locator.locator_stats
+        self.assertEqual([d['calls'] for d in stats], [1, 1, 1])
+        self.assertTrue(all(d['max_time'] <= d['total_time'] for d in stats))
+        # Errors are raised if the result from the failing locator is needed
+        locator = AggregatingLocator(FakeLocator([]), FakeLocator([],
+                                                                  error=True),
+                                     concurrent=True)
+        self.assertRaises(ValueError, locator.locate, 'foo')
+        self.assertEqual(locator.locator_stats[1]['errors'], 1)
+        locator = AggregatingLocator(FakeLocator(['1.0']),
+                                     FakeLocator([], error=True),
+                                     concurrent=True)
+        self.assertIn('1.0', locator.get_project('foo'))
+        # Lookups share a bounded number of worker threads, which exit when
+        # they've been idle for a while
+        locators = [FakeLocator([v]) for v in ('1.0', '1.1', '1.2', '1.3')]
+        locator = AggregatingLocator(merge=True, concurrent=True,
+                                     num_workers=2, *locators)
+        locator.worker_idle_timeout = 1.0
+        for name in ('foo', 'bar', 'baz'):
+            result = locator.get_project(name)
+            self.assertEqual(len(result['urls']), 4)
+        threads = list(locator._threads)
+        self.assertTrue(1 <= len(threads) <= 2)
+        self.assertEqual(len(locator.get_project('quux')['urls']), 4)
+        self.assertTrue(set(locator._threads) <= set(threads))
+        for i in range(40):
+            if not locator._threads:
+                break
+            time.sleep(0.1)
+        self.assertEqual(locator._threads, [])
+        self.assertEqual(len(locator.get_project('quuux')['urls']), 4)
+
+    def test_locator_cache(self):
+        # The default cache is unbounded
+        locator = CountingLocator()
+        for i in range(2):
+            for name in ('foo', 'bar', 'missing'):
+                locator.get_project(name)
+        self.assertEqual(locator.calls, 3)
+        self.assertEqual(locator._cache.stats['hits'], 3)
+        locator.clear_cache()
+        locator.get_project('foo')
+        self.assertEqual(locator.calls, 4)
+        # Least recently used entries are evicted to stay within limits
+        cache = LocatorCache(max_entries=2)
+        locator = CountingLocator(cache=cache)
+        for name in ('foo', 'bar', 'foo', 'baz', 'foo', 'bar'):
+            locator.get_project(name)
+        self.assertEqual(locator.calls, 4)
+        self.assertEqual(len(cache), 2)
+        stats = cache.stats
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']),
+                         (2, 4, 2))
+        size = cache.estimate_size(locator.get_project('foo'))
+        self.assertGreater(size, 0)
+        cache = LocatorCache(max_size=size * 2)
+        locator = CountingLocator(cache=cache)
+        for name in ('foo', 'bar', 'baz'):
+            locator.get_project(name)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.size, size * 2)
+        # Entries expire, with a separate TTL for results with no versions
+        cache = LocatorCache(ttl=60, negative_ttl=0)
+        locator = CountingLocator(cache=cache)
+        for i in range(2):
+            locator.get_project('foo')
+            locator.get_project('missing')
+        self.assertEqual(locator.calls, 3)
+        cache.ttl = -1
+        locator.clear_cache()
+        locator.get_project('foo')
+        locator.get_project('foo')
+        self.assertEqual(locator.calls, 5)
+        cache = LocatorCache(ttl=0.2)
+        locator = CountingLocator(cache=cache)
+        locator.get_project('foo')
+        locator.get_project('foo')
+        time.sleep(0.3)
+        locator.get_project('foo')
+        self.assertEqual(locator.calls, 2)
+        self.assertEqual(cache.stats['expirations'], 1)
+        # Aggregating locators clear their locators' caches too
+        child = CountingLocator()
+        locator = AggregatingLocator(child, cache=LocatorCache(max_entries=1))
+        locator.get_project('foo')
+        locator.clear_cache()
+        self.assertEqual(len(child._cache), 0)
+
+    def test_project_store(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        path = os.path.join(d, 'store.db')
+        locator = CountingLocator(store=ProjectStore(path))
+        expected = locator.get_project('foo')
+        locator.get_project('missing')
+        self.assertEqual(locator.calls, 2)
+        # Another locator (e.g. in another process) gets the stored results
+        store = ProjectStore(path)
+        locator = CountingLocator(store=store)
+        result = locator.get_project('Foo')
+        self.assertEqual(locator.calls, 0)
+        self.assertEqual(result, expected)
+        dist = result['1.0']
+        self.assertEqual(dist.digest, ('sha256', 'ab' * 32))
+        self.assertEqual(dist.source_url, expected['1.0'].source_url)
+        self.assertIs(dist.locator, locator)
+        self.assertEqual(locator.get_project('missing'),
+                         {'urls': {}, 'digests': {}})
+        self.assertEqual(locator.calls, 0)
+        # Results from other kinds of locator aren't shared
+        other = CountingLocator(store=store, scheme='legacy')
+        other.get_project('foo')
+        self.assertEqual(other.calls, 1)
+        # Entries can be invalidated, recording a serial number
+        self.assertIsNone(store.serial)
+        store.invalidate(['FOO'], serial=1234)
+        self.assertEqual(store.serial, 1234)
+        locator.clear_cache()
+        locator.get_project('foo')
+        locator.get_project('missing')
+        self.assertEqual(locator.calls, 1)
+        # or expire
+        store.ttl = 0
+        locator.clear_cache()
+        locator.get_project('foo')
+        self.assertEqual(locator.calls, 2)
+        store.ttl = None
+        # Results whose metadata isn't complete aren't stored
+        class LazyLocator(CountingLocator):
+            def _get_project(self, name):
+                result = super(LazyLocator, self)._get_project(name)
+                for k, v in result.items():
+                    if k not in ('urls', 'digests'):
+                        v.metadata_loader = lambda dist: None
+                return result
+
+        store.invalidate()
+        locator = LazyLocator(store=store)
+        locator.get_project('foo')
+        locator = LazyLocator(store=store)
+        locator.get_project('foo')
+        self.assertEqual(locator.calls, 1)
+        # Readers and writers in different threads don't interfere
+        errors = []
+
+        def work(i):
+            try:
+                locator = CountingLocator(store=ProjectStore(path))
+                for j in range(20):
+                    locator.get_project('p%d' % ((i + j) % 10))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(i,))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_missing_projects(self):
+        class IndexLocator(CountingLocator):
+            cache_missing = True
+
+            def __init__(self, url, **kwargs):
+                super(IndexLocator, self).__init__(**kwargs)
+                self.base_url = url
+                self.fail = False
+
+            def _get_project(self, name):
+                if self.fail:
+                    self.errors.put('index unavailable')
+                elif name == 'missing':
+                    self._set_not_found()
+                return super(IndexLocator, self)._get_project(name)
+
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        store = ProjectStore(os.path.join(d, 'store.db'), negative_ttl=60)
+        # Projects which weren't found are recorded for each index, but not
+        # if there were errors
+        locator = IndexLocator('http://a/', store=store)
+        locator.fail = True
+        locator.get_project('missing')
+        self.assertFalse(store.is_missing(locator.store_key, 'missing'))
+        locator.fail = False
+        locator.clear_cache()
+        locator.get_project('missing')
+        self.assertTrue(store.is_missing(locator.store_key, 'Missing'))
+        other = IndexLocator('http://b/', store=store)
+        self.assertFalse(store.is_missing(other.store_key, 'missing'))
+        locator = IndexLocator('http://a/', store=store)
+        self.assertEqual(locator.get_project('missing'),
+                         {'urls': {}, 'digests': {}})
+        self.assertEqual(locator.calls, 0)
+        # Aggregating locators skip locators known not to have a project
+        locator = AggregatingLocator(locator, other)
+        self.assertIn('1.0', locator.get_project('foo'))
+        locator.get_project('missing')
+        locator.clear_cache()
+        locator.get_project('missing')
+        stats = locator.locator_stats
+        self.assertEqual([d['skipped'] for d in stats], [2, 1])
+        self.assertEqual([d['calls'] for d in stats], [1, 1])
+        self.assertEqual(other.calls, 1)
+        # Records expire, and are removed when a project is invalidated or
+        # found
+        store.negative_ttl = 0
+        self.assertFalse(store.is_missing(other.store_key, 'missing'))
+        store.negative_ttl = 60
+        store.invalidate(['missing'])
+        self.assertFalse(store.is_missing(other.store_key, 'missing'))
+        store.put_missing(other.store_key, 'foo')
+        store.put(other.store_key, 'foo', {})
+        self.assertFalse(store.is_missing(other.store_key, 'foo'))
+
+    def test_concurrent_lookup_errors(self):
+        # Whether a result is stored (or a project recorded as missing)
+        # depends only on the errors in its own lookup, even if another
+        # lookup clears the locator's errors meanwhile
+        started = threading.Event()
+        release = threading.Event()
+
+        class FlakyLocator(CountingLocator):
+            cache_missing = True
+            base_url = 'http://flaky/'
+
+            def _get_project(self, name):
+                result = super(FlakyLocator, self)._get_project(name)
+                if name in ('bad', 'missing'):
+                    self.errors.put('%s failed' % name)
+                    started.set()
+                    release.wait(5.0)
+                if name in ('bad', 'missing'):
+                    # incomplete, as if part of the lookup failed
+                    result = {'urls': {}, 'digests': {}}
+                return result
+
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        store = ProjectStore(os.path.join(d, 'store.db'), negative_ttl=60)
+        locator = FlakyLocator(store=store)
+        key = locator.store_key
+        for name in ('bad', 'missing'):
+            started.clear()
+            release.clear()
+            t = threading.Thread(target=locator.get_project, args=(name,))
+            t.start()
+            self.assertTrue(started.wait(5.0))
+            self.assertIn('1.0', locator.get_project('good'))
+            release.set()
+            t.join()
+            self.assertIsNone(store.get(key, name))
+            self.assertFalse(store.is_missing(key, name))
+            locator.clear_cache()
+        self.assertIsNotNone(store.get(key, 'good'))
+        # A result without versions isn't taken to mean that the project
+        # doesn't exist unless the source said so
+        locator = CountingLocator(store=store)
+        locator.cache_missing = True
+        locator.get_project('missing')
+        self.assertFalse(store.is_missing(locator.store_key, 'missing'))
+
+    def test_missing_pages(self):
+        page = b'<html><body>nothing here</body></html>'
+        server = IndexServerThread({
+            '/simple/forbidden/': {'body': page, 'status': 403},
+            '/simple/truncated/': {'body': page, 'truncate': [10]},
+            '/simple/no-files/': {'body': page},
+        })
+        server.start()
+        self.addCleanup(server.stop)
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        store = ProjectStore(os.path.join(d, 'store.db'))
+        locator = SimpleScrapingLocator(server.url + 'simple/', store=store,
+                                        json_api=False)
+        key = locator.store_key
+        # Only a project whose page doesn't exist is recorded as missing
+        for name in ('forbidden', 'truncated', 'no-files', 'missing'):
+            self.assertEqual(locator.get_project(name),
+                             {'urls': {}, 'digests': {}})
+        self.assertFalse(store.is_missing(key, 'forbidden'))
+        self.assertIsNone(store.get(key, 'forbidden'))
+        self.assertFalse(store.is_missing(key, 'truncated'))
+        self.assertIsNone(store.get(key, 'truncated'))
+        self.assertFalse(store.is_missing(key, 'no-files'))
+        self.assertIsNotNone(store.get(key, 'no-files'))
+        self.assertTrue(store.is_missing(key, 'missing'))
+
+    def test_name_index(self):
+        names = ['Django', 'zope.interface', 'Zope_Event', 'foo']
+        names.extend('p%03d' % i for i in range(200, 0, -1))
+        body = '<html><body>\n%s</body></html>' % ''.join(
+            '<a href="/simple/%s/">%s</a>\n' % (n.lower(), n) for n in names)
+        body = body.encode('utf-8')
+        server = IndexServerThread({'/simple/': {'body': body,
+                                                 'etag': '"1"'}})
+        server.start()
+        self.addCleanup(server.stop)
+        route = server.routes['/simple/']
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        index = NameIndex(d)
+        index.stride = 8
+
+        def make_locator():
+            locator = SimpleScrapingLocator(server.url + 'simple/',
+                                            json_api=False, name_index=index)
+            locator.chunk_size = 50     # names are split across chunks
+            return locator
+
+        # Names are yielded as the page is read; the list is only kept once
+        # it's all been read
+        route['truncate'] = [len(body) // 2]
+        it = make_locator().iter_distribution_names()
+        self.assertEqual(next(it), 'Django')
+        self.assertRaises(Exception, list, it)
+        self.assertIsNone(index.get(server.url + 'simple/'))
+        locator = make_locator()
+        self.assertEqual(list(locator.iter_distribution_names()), names)
+        header = index.get(locator.base_url)
+        self.assertEqual(header['count'], len(names))
+        self.assertEqual(header['etag'], '"1"')
+        # A fresh list is used without a request
+        n = len(server.requests)
+        locator = make_locator()
+        self.assertEqual(locator.get_distribution_names(), set(names))
+        self.assertEqual(locator.lookup_distribution_name('ZOPE-event'),
+                         'Zope_Event')
+        self.assertEqual(locator.lookup_distribution_name('p123'), 'p123')
+        self.assertIsNone(locator.lookup_distribution_name('p1234'))
+        self.assertIsNone(locator.lookup_distribution_name('a'))
+        self.assertEqual(list(locator.find_distribution_names('zope_')),
+                         ['Zope_Event', 'zope.interface'])
+        self.assertEqual(list(locator.find_distribution_names('p19')),
+                         ['p%03d' % i for i in range(190, 200)])
+        self.assertEqual(list(locator.find_distribution_names('q')), [])
+        self.assertEqual(len(server.requests), n)
+        # A stale list is revalidated, and used if the page hasn't changed
+        # or can't be fetched
+        index.ttl = 0
+        self.assertEqual(set(make_locator().iter_distribution_names()),
+                         set(names))
+        self.assertEqual(server.requests[-1][1]['if-none-match'], '"1"')
+        route['status'] = 404
+        route['etag'] = '"2"'
+        self.assertEqual(set(make_locator().iter_distribution_names()),
+                         set(names))
+        self.assertEqual(len(server.requests), n + 2)
+        # Without a name index, lookups read the names from the page
+        del route['status']
+        locator = SimpleScrapingLocator(server.url + 'simple/',
+                                        json_api=False)
+        self.assertEqual(list(locator.find_distribution_names('ZOPE')),
+                         ['Zope_Event', 'zope.interface'])
+        self.assertEqual(locator.lookup_distribution_name('Foo'), 'foo')
+
+    def test_coalescing(self):
+        class GatedLocator(CountingLocator):
+            def __init__(self, **kwargs):
+                super(GatedLocator, self).__init__(**kwargs)
+                self.gate = threading.Event()
+                self.entered = threading.Event()
+                self.fail = False
+
+            def _get_project(self, name):
+                if name == 'foo':
+                    self.entered.set()
+                    self.gate.wait(5.0)
+                    if self.fail:
+                        raise ValueError('lookup failed')
+                return super(GatedLocator, self)._get_project(name)
+
+        for make_cache in (LocatorCache, lambda: None):
+            locator = GatedLocator(cache=make_cache())
+            results = []
+            errors = []
+
+            def lookup(name):
+                try:
+                    results.append(locator.get_project(name))
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=lookup, args=('foo',))
+                       for i in range(5)]
+            for t in threads:
+                t.start()
+            self.assertTrue(locator.entered.wait(5.0))
+            # Other projects can be looked up while foo is in progress
+            self.assertIn('1.0', locator.get_project('bar'))
+            self.assertEqual(locator.calls, 1)
+            locator.gate.set()
+            for t in threads:
+                t.join()
+            self.assertEqual(locator.calls, 2)
+            self.assertEqual(len(results), 5)
+            self.assertTrue(all(r is results[0] for r in results))
+            # Errors are passed to all the callers waiting for a lookup
+            locator = GatedLocator(cache=make_cache())
+            locator.fail = True
+            threads = [threading.Thread(target=lookup, args=('foo',))
+                       for i in range(3)]
+            for t in threads:
+                t.start()
+            self.assertTrue(locator.entered.wait(5.0))
+            time.sleep(0.1)
+            locator.gate.set()
+            for t in threads:
+                t.join()
+            self.assertEqual(len(errors), 3)
+            del errors[:]
+
+    def test_lazy_metadata(self):
+        locator = Locator()
+        result = {'urls': {}, 'digests': {}}
+        for v in ('1.0', '1.1', '2.0'):
+            for ext in ('.zip', '.tar.gz'):
+                url = 'http://example.com/foo-%s%s' % (v, ext)
+                locator._update_version_data(result, {'name': 'foo',
+                                                      'version': v,
+                                                      'url': url})
+        dists = [result[v] for v in ('1.0', '1.1', '2.0')]
+        # Metadata isn't created until it's needed
+        self.assertTrue(all(d._metadata is None for d in dists))
+        dist = dists[0]
+        self.assertEqual(dist.source_url, 'http://example.com/foo-1.0.zip')
+        expected = make_dist('foo', '1.0')
+        expected.metadata.source_url = dist.source_url
+        self.assertEqual(dist, expected)
+        self.assertEqual(hash(dist), hash(expected))
+        self.assertTrue(all(d._metadata is None for d in dists))
+        md = dist.metadata
+        self.assertEqual((md.name, md.version, md.source_url),
+                         ('foo', '1.0', dist.source_url))
+        self.assertEqual(md.summary, 'Placeholder for summary')
+        self.assertIs(dist.metadata, md)
+        dist.source_url = 'http://example.com/other'
+        self.assertEqual(md.source_url, 'http://example.com/other')
+        self.assertEqual(dist.run_requires, set())
+        # Only the located version's metadata is created
+        locator._get_project = lambda name: result
+        dist = locator.locate('foo (< 2.0)')
+        self.assertEqual(dist.version, '1.1')
+        self.assertIsNone(result['2.0']._metadata)
+        # Invalid names and versions are still rejected
+        self.assertRaises(MetadataInvalidError, make_dist, 'foo', 'bad one',
+                          lazy=True)
+        self.assertRaises(MetadataInvalidError, make_dist, 'foo!', '1.0',
+                          lazy=True)
+        dist = make_dist('foo', 'bad one', scheme='legacy', lazy=True)
+        self.assertEqual(dist.metadata.version, 'bad one')
+
+    def test_sorted_versions(self):
+        cache = LocatorCache(max_entries=1)
+        locator = Locator(cache=cache)
+        result = {'urls': {}, 'digests': {}}
+        for v in ('1.0', '1.10', '1.2', '2.0b1', '1.2.0', 'bad one'):
+            result[v] = make_dist('foo', v, scheme='legacy', lazy=True)
+        locator._get_project = lambda name: result
+        matcher = get_scheme('default').matcher('foo')
+        self.assertEqual(locator.locate('foo').version, '1.10')
+        self.assertEqual(locator.locate('foo (< 1.10)').version, '1.2.0')
+        self.assertEqual(locator.locate('foo', prereleases=True).version,
+                         '2.0b1')
+        self.assertIsNone(locator.locate('foo (> 2.0)'))
+        # The versions are only parsed once, and kept with the cached result
+        slist = locator._get_sorted_versions('foo', result, matcher)
+        self.assertEqual([k for v, k in slist],
+                         ['1.0', '1.2', '1.2.0', '1.10', '2.0b1'])
+        self.assertIs(locator._get_sorted_versions('foo', result, matcher),
+                      slist)
+        self.assertEqual(list(cache.get_extra('foo', result).values()),
+                         [(len(result), slist)])
+        # but are parsed again if the result changes
+        result['3.0'] = make_dist('foo', '3.0', lazy=True)
+        self.assertEqual(locator.locate('foo').version, '3.0')
+        # and are discarded with the result
+        locator.get_project('bar')
+        self.assertIsNone(cache.get_extra('foo', result))
+        self.assertIsNot(locator._get_sorted_versions('foo', result, matcher),
+                         slist)
+        # Locators without somewhere to keep them still work
+        locator = Locator()
+        locator._cache = None
+        locator._get_project = lambda name: result
+        self.assertEqual(locator.locate('foo').version, '3.0')
+
     @unittest.skipIf('SKIP_ONLINE' in os.environ, 'Skipping online test')
     @unittest.skipUnless(ssl, 'SSL required for this test.')
     def test_prereleases(self):
@@ -508,6 +1342,644 @@ class LocatorTestCase(unittest.TestCase):
         d = locate('foobarbazbishboshboo')
         self.assertTrue(d is None or isinstance(d, Distribution))
 
+    def test_page_cache(self):
+        server = IndexServerThread({
+            '/simple/sarge/': {
+                'body': SARGE_PAGE,
+                'etag': '"v1"',
+            },
+        })
+        server.start()
+        cache_dir = tempfile.mkdtemp()
+        try:
+            url = server.url + 'simple/'
+            cache = PageCache(cache_dir, ttl=3600)
+            locator = SimpleScrapingLocator(url, page_cache=cache)
+            result = locator.get_project('sarge')
+            self.assertEqual(set(result['urls']), set(['0.1', '0.1.1']))
+            self.assertEqual(cache.stats,
+                             {'hits': 0, 'revalidated': 0, 'misses': 1})
+            self.assertEqual(len(server.requests), 1)
+            # A new locator should use the fresh entry without a request
+            locator = SimpleScrapingLocator(url, page_cache=cache)
+            self.assertEqual(locator.get_project('sarge'), result)
+            self.assertEqual(cache.hits, 1)
+            self.assertEqual(len(server.requests), 1)
+            # Once stale, the entry is revalidated with a conditional request
+            cache.ttl = 0
+            locator = SimpleScrapingLocator(url, page_cache=cache)
+            self.assertEqual(set(locator.get_project('sarge')['urls']),
+                             set(['0.1', '0.1.1']))
+            self.assertEqual(cache.revalidated, 1)
+            self.assertEqual(len(server.requests), 2)
+            path, headers = server.requests[-1]
+            self.assertEqual(headers.get('if-none-match'), '"v1"')
+            # A revalidated page is kept in memory under its own URL, as a
+            # fetched one is (e.g. if it was redirected to)
+            moved = server.url + 'moved/sarge/'
+            cache.put(url + 'sarge/', dict(cache.get(url + 'sarge/'),
+                                           url=moved))
+            locator = SimpleScrapingLocator(url, page_cache=cache)
+            locator.get_project('sarge')
+            self.assertEqual(cache.revalidated, 2)
+            self.assertEqual(locator._page_cache[moved].url, moved)
+            self.assertIs(locator.get_page(moved),
+                          locator._page_cache[url + 'sarge/'])
+            self.assertEqual(len(server.requests), 3)
+            # A changed page is fetched in full and replaces the entry
+            server.routes['/simple/sarge/'] = {
+                'body': SARGE_PAGE.replace(b'0.1.1', b'0.1.2'),
+                'etag': '"v2"',
+            }
+            locator = SimpleScrapingLocator(url, page_cache=cache)
+            self.assertEqual(set(locator.get_project('sarge')['urls']),
+                             set(['0.1', '0.1.2']))
+            self.assertEqual(cache.misses, 2)
+            self.assertEqual(cache.get(url + 'sarge/')['etag'], '"v2"')
+        finally:
+            server.stop()
+            shutil.rmtree(cache_dir)
+
+    def test_concurrent_scraping(self):
+        names = ['project%d' % i for i in range(20)]
+        routes = {}
+        for name in names:
+            routes['/simple/%s/' % name] = {
+                'body': ('<a href="/files/%s-1.0.tar.gz">x</a>\n'
+                         '<a href="/files/%s-1.1.zip">y</a>\n' %
+                         (name, name)).encode('ascii'),
+            }
+        server = IndexServerThread(routes)
+        server.start()
+        try:
+            locator = SimpleScrapingLocator(server.url + 'simple/',
+                                            num_workers=4, max_per_host=2)
+            locator.worker_idle_timeout = 0.5
+            results = {}
+
+            def get(name):
+                results[name] = locator.get_project(name)
+
+            threads = [threading.Thread(target=get, args=(name,))
+                       for name in names]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(sorted(results), sorted(names))
+            for name, result in results.items():
+                self.assertEqual(set(result['urls']), set(['1.0', '1.1']))
+                self.assertEqual(result['1.0'].name, name)
+            # The worker threads are shared by all the projects scraped, and
+            # reused for subsequent lookups.
+            workers = set(locator._threads)
+            self.assertLessEqual(len(workers), 4)
+            locator.get_project('project0')
+            self.assertTrue(set(locator._threads) <= workers)
+            # Pages aren't discarded while another scrape is in progress
+            locator._page_cache.clear()
+            locator._active_jobs += 1
+            n = len(server.requests)
+            locator.get_project('project1')
+            locator.clear_cache()
+            locator.get_project('project1')
+            self.assertEqual(len(server.requests), n + 1)
+            locator._active_jobs -= 1
+            # Idle workers exit
+            for i in range(40):
+                if not locator._threads:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(locator._threads, [])
+        finally:
+            server.stop()
+
+    def test_locate_many(self):
+        routes = {}
+        for name in ('alpha', 'beta', 'gamma'):
+            routes['/simple/%s/' % name] = {
+                'body': ('<a href="/files/%s-1.0.tar.gz">x</a>\n'
+                         '<a href="/files/%s-2.0.tar.gz">y</a>\n' %
+                         (name, name)).encode('ascii'),
+            }
+        server = IndexServerThread(routes)
+        server.start()
+        try:
+            locator = SimpleScrapingLocator(server.url + 'simple/')
+            reqts = ['alpha', 'alpha (< 2.0)', 'beta (>= 2.0)',
+                     'gamma (> 2.0)', 'delta']
+            result = locator.locate_many(reqts)
+            self.assertEqual(set(result), set(reqts))
+            self.assertEqual(result['alpha'].version, '2.0')
+            self.assertEqual(result['alpha (< 2.0)'].version, '1.0')
+            self.assertEqual(result['beta (>= 2.0)'].version, '2.0')
+            self.assertIsNone(result['gamma (> 2.0)'])
+            self.assertIsNone(result['delta'])
+            # each project is only fetched once
+            paths = [path for path, headers in server.requests]
+            self.assertEqual(sorted(paths), ['/simple/alpha/', '/simple/beta/',
+                                             '/simple/delta/',
+                                             '/simple/gamma/'])
+            self.assertRaises(DistlibException, locator.locate_many,
+                              ['alpha', 'foo ('])
+        finally:
+            server.stop()
+
+    def test_dependency_finder_batch(self):
+        class TestLocator(Locator):
+            def __init__(self, dists, **kwargs):
+                super(TestLocator, self).__init__(**kwargs)
+                self.dists = dists
+                self.batches = []
+
+            def _get_project(self, name):
+                result = {'urls': {}, 'digests': {}}
+                for (n, v), reqts in self.dists.items():
+                    if n == name:
+                        dist = make_dist(n, v)
+                        dist.metadata.run_requires = [{'requires': reqts}]
+                        result[v] = dist
+                return result
+
+            def locate_many(self, requirements, prereleases=False):
+                self.batches.append(sorted(requirements))
+                return super(TestLocator, self).locate_many(requirements,
+                                                            prereleases)
+
+        locator = TestLocator({
+            ('top', '1.0'): ['left (>= 1.0)', 'right', 'middle'],
+            ('left', '1.0'): ['bottom'],
+            ('middle', '1.0'): [],
+            ('right', '1.0'): ['bottom'],
+            ('bottom', '1.0'): [],
+        })
+        finder = DependencyFinder(locator)
+        dists, problems = finder.find('top')
+        self.assertFalse(problems)
+        self.assertEqual(sorted(d.name for d in dists),
+                         ['bottom', 'left', 'middle', 'right', 'top'])
+        self.assertEqual(locator.batches[0], ['left (>= 1.0)', 'middle',
+                                              'right'])
+
+    def test_connection_pooling(self):
+        routes = {}
+        for name in ('alpha', 'beta', 'gamma'):
+            routes['/simple/%s/' % name] = {
+                'body': ('<a href="/files/%s-1.0.tar.gz">x</a>\n' %
+                         name).encode('ascii'),
+            }
+        server = IndexServerThread(routes)
+        server.start()
+        pool = ConnectionPool()
+        try:
+            url = server.url + 'simple/'
+            for name in ('alpha', 'beta'):
+                locator = SimpleScrapingLocator(url, num_workers=1, pool=pool)
+                self.assertIn('1.0', locator.get_project(name))
+            # a nonexistent project, to check that error responses don't
+            # stop the connection being reused
+            self.assertEqual(locator.get_project('delta'),
+                             {'urls': {}, 'digests': {}})
+            self.assertIn('1.0', locator.get_project('gamma'))
+            # All requests, from both locators, used the same connection
+            self.assertEqual(len(server.requests), 4)
+            self.assertEqual(len(set(server.client_ports)), 1)
+            self.assertEqual((pool.created, pool.reused), (1, 3))
+            for path, headers in server.requests:
+                self.assertEqual(headers['connection'], 'keep-alive')
+            # If a pooled connection has been closed by the server, a new one
+            # is made transparently.
+            for conns in pool._idle.values():
+                for conn, when in conns:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+            locator.clear_cache()
+            self.assertIn('1.0', locator.get_project('alpha'))
+            self.assertEqual(pool.created, 2)
+            # Connections idle for too long aren't reused.
+            pool.idle_timeout = 0
+            locator.clear_cache()
+            self.assertIn('1.0', locator.get_project('alpha'))
+            self.assertEqual(pool.created, 3)
+            # Error responses with bodies release their connections, even if
+            # the errors aren't closed, and their bodies can still be read.
+            pool.idle_timeout = 30.0
+            server.routes['/gone'] = {'body': b'not here', 'status': 404}
+            opener = build_pooled_opener(pool=pool)
+            errors = []
+            for i in range(3):
+                try:
+                    opener.open(server.url + 'gone')
+                except HTTPError as e:
+                    errors.append(e)
+            self.assertEqual([e.code for e in errors], [404] * 3)
+            self.assertEqual(errors[-1].read(), b'not here')
+            self.assertEqual(pool.created, 3)
+            # Large bodies are cut short and their connections closed
+            server.routes['/gone']['body'] = b'x' * 100
+            for handler in opener.handlers:
+                if isinstance(handler, PooledHTTPHandler):
+                    handler.max_error_body = 10
+            try:
+                opener.open(server.url + 'gone')
+            except HTTPError as e:
+                errors.append(e)
+            self.assertEqual(errors[-1].read(), b'x' * 10)
+            self.assertEqual(sum(len(v) for v in pool._idle.values()), 0)
+        finally:
+            pool.clear()
+            server.stop()
+
+    def test_compression(self):
+        def compressor(wbits):
+            def compress(data):
+                c = zlib.compressobj(9, zlib.DEFLATED, wbits)
+                return c.compress(data) + c.flush()
+            return compress
+
+        # Make the page big enough to be read in several chunks
+        page = SARGE_PAGE.replace(b'</body>', b'<p>padding</p>\n' * 5000 +
+                                  b'</body>')
+        server = IndexServerThread({
+            '/simple/sarge/': {
+                'body': page,
+                'encoding': {'gzip': compressor(16 + zlib.MAX_WBITS)},
+            },
+            '/simple/zlibd/': {
+                'body': page.replace(b'sarge', b'zlibd'),
+                'encoding': {'deflate': compressor(zlib.MAX_WBITS)},
+            },
+            '/simple/rawdf/': {
+                'body': page.replace(b'sarge', b'rawdf'),
+                'encoding': {'deflate': compressor(-zlib.MAX_WBITS)},
+            },
+        })
+        server.start()
+        try:
+            url = server.url + 'simple/'
+            # By default, compression isn't asked for
+            locator = SimpleScrapingLocator(url)
+            result = locator.get_project('sarge')
+            self.assertEqual(set(result['urls']), set(['0.1', '0.1.1']))
+            path, headers = server.requests[-1]
+            self.assertEqual(headers['accept-encoding'], 'identity')
+            self.assertEqual(locator.transfer_stats['bytes_received'],
+                             len(page))
+            self.assertEqual(locator.bytes_decoded, len(page))
+            for name in ('sarge', 'zlibd', 'rawdf'):
+                locator = SimpleScrapingLocator(url, compress=True)
+                result = locator.get_project(name)
+                self.assertEqual(set(result['urls']), set(['0.1', '0.1.1']))
+                path, headers = server.requests[-1]
+                self.assertEqual(headers['accept-encoding'], 'gzip, deflate')
+                stats = locator.transfer_stats
+                self.assertLess(stats['bytes_received'], len(page) // 10)
+                self.assertEqual(stats['bytes_decoded'], len(page))
+                self.assertGreater(stats['decode_time'], 0)
+        finally:
+            server.stop()
+
+    def test_link_extraction(self):
+        html = (
+            '<html><head><base href="http://example.com/base/">'
+            '<link rel="stylesheet" href="/style.css"></head><body>\n'
+            '<a href="foo-1.0.tar.gz#md5=abcd">foo-1.0.tar.gz</a><br/>\n'
+            "<a rel='download' HREF='http://example.com/foo-1.1.zip'>x</a>\n"
+            '<a href=../foo-1.2.tar.gz rel=homepage>x</a>\n'
+            '<A class="x" href="foo-2.0.tar.gz?a=1&amp;b=2" rel="download">'
+            'x</A>\n'
+            '<a href="foo 3.0.tar.gz" title="a > b">x</a>\n'
+            '<a name="nohref">x</a>\n'
+            '</body></html>\n')
+        url = 'http://example.com/simple/foo/'
+        expected = [
+            ('http://example.com/style.css', 'stylesheet'),
+            ('http://example.com/base/foo-1.0.tar.gz#md5=abcd', ''),
+            ('http://example.com/foo-1.1.zip', 'download'),
+            ('http://example.com/foo-1.2.tar.gz', 'homepage'),
+            ('http://example.com/base/foo-2.0.tar.gz?a=1&b=2', 'download'),
+            ('http://example.com/base/foo%203.0.tar.gz', ''),
+        ]
+        # Links should be found however the page is split into chunks
+        for size in (1, 7, 64, len(html)):
+            extractor = LinkExtractor(url)
+            links = []
+            for i in range(0, len(html), size):
+                links.extend(extractor.feed(html[i:i + size]))
+            links.extend(extractor.close())
+            self.assertEqual(links, expected)
+            self.assertEqual(extractor.links, expected)
+            self.assertEqual(extractor.base_url, 'http://example.com/base/')
+        page = Page(html, url)
+        self.assertEqual(page.base_url, 'http://example.com/base/')
+        self.assertEqual(list(page.iter_links()), expected)
+        self.assertEqual(page.links, sorted(expected, reverse=True))
+        # The shortcuts for resolving common forms of link must give the
+        # same results as urljoin
+        extractor = LinkExtractor(url)
+        for link in ('../../packages/ab/cd/foo-1.0.tar.gz#sha256=00',
+                     './foo/', '../', 'foo?', 'foo#', 'a/../b', 'a//b',
+                     '?x=1', '#frag', 'foo;p', 'https://h/a/../b?q#f',
+                     'http://h', 'https://', '', 'mailto:x@y'):
+            self.assertEqual(extractor._join(link), urljoin(url, link))
+        # A <base> tag applies to the whole page, even links before it
+        html = ('<a href="a-1.0.tar.gz" data-dist-info-metadata="true">x</a>'
+                '<a href="/b-1.0.tar.gz">x</a>'
+                '<base href="http://example.com/base/">'
+                '<a href="c-1.0.tar.gz">x</a>')
+        expected = [('http://example.com/base/a-1.0.tar.gz', ''),
+                    ('http://example.com/b-1.0.tar.gz', ''),
+                    ('http://example.com/base/c-1.0.tar.gz', '')]
+        extractor = LinkExtractor(url)
+        links = extractor.feed(html[:60])
+        self.assertEqual(links, [(url + 'a-1.0.tar.gz', '')])
+        links = extractor.feed(html[60:]) + extractor.close()
+        self.assertEqual(links, [expected[1], expected[0], expected[2]])
+        self.assertEqual(extractor.links, expected)
+        self.assertEqual(extractor.metadata, {expected[0][0]: {}})
+        self.assertEqual(list(Page(html, url).iter_links()), expected)
+
+    def test_streaming_links(self):
+        # Links are processed as a page arrives, and the page is still
+        # cached for later use
+        server = IndexServerThread({'/simple/sarge/': {'body': SARGE_PAGE}})
+        server.start()
+        try:
+            url = server.url + 'simple/'
+            locator = SimpleScrapingLocator(url)
+            locator.chunk_size = 16
+            seen = []
+            page = locator.get_page(url + 'sarge/',
+                                    lambda link, rel: seen.append(link))
+            expected = [server.url + 'files/sarge-0.1.tar.gz'
+                        '#md5=961ddd9bc085fdd8b248c6dd96ceb1c8',
+                        server.url + 'files/sarge-0.1.1.tar.gz']
+            self.assertEqual(seen, expected)
+            self.assertEqual(page.data, SARGE_PAGE.decode('utf-8'))
+            del seen[:]
+            self.assertIs(locator.get_page(url + 'sarge/',
+                                           lambda l, r: seen.append(l)), page)
+            self.assertEqual(seen, expected)
+            self.assertEqual(len(server.requests), 1)
+        finally:
+            server.stop()
+
+    def test_host_health(self):
+        health = HostHealth(failure_threshold=2, reset_timeout=0.2, window=4)
+        self.assertTrue(health.allow('a'))
+        health.record('a', True, 0.5)
+        health.record('b', True, 0.1)
+        self.assertEqual(health.rank(['a', 'b', 'c']), ['c', 'b', 'a'])
+        # The circuit opens after enough consecutive failures
+        health.record('b', False)
+        self.assertTrue(health.allow('b'))
+        health.record('b', False)
+        self.assertFalse(health.allow('b'))
+        self.assertEqual(health.rank(['b', 'a']), ['a', 'b'])
+        stats = health.stats['b']
+        self.assertEqual(stats['state'], 'open')
+        self.assertEqual((stats['requests'], stats['errors']), (3, 2))
+        self.assertAlmostEqual(stats['error_rate'], 2 / 3.0)
+        self.assertAlmostEqual(stats['latency'], 0.1)
+        # After a while, a single probe is allowed
+        time.sleep(0.25)
+        self.assertTrue(health.allow('b'))
+        self.assertEqual(health.stats['b']['state'], 'half-open')
+        self.assertFalse(health.allow('b'))
+        # and a failed probe opens the circuit again
+        health.record('b', False)
+        self.assertFalse(health.allow('b'))
+        time.sleep(0.25)
+        self.assertTrue(health.allow('b'))
+        health.record('b', True, 0.2)
+        self.assertEqual(health.stats['b']['state'], 'closed')
+        self.assertTrue(health.allow('b'))
+        self.assertTrue(health.allow('b'))
+        # Only the most recent requests count
+        self.assertAlmostEqual(health.stats['b']['latency'], 0.2)
+        self.assertEqual(health.stats['a']['error_rate'], 0.0)
+
+    def test_truncated_probe(self):
+        # A probe of a half-open host which fails in any way (here, with a
+        # truncated response) opens the circuit again, rather than leaving
+        # the host waiting for the probe's outcome for good
+        server = IndexServerThread({
+            '/simple/sarge/': {'body': SARGE_PAGE, 'truncate': [10, 10]},
+        })
+        server.start()
+        try:
+            host = urlparse(server.url)[1].lower()
+            health = HostHealth(failure_threshold=1, reset_timeout=0.2)
+            locator = SimpleScrapingLocator(server.url + 'simple/',
+                                            health=health, timeout=5)
+            self.assertEqual(locator.get_project('sarge'),
+                             {'urls': {}, 'digests': {}})
+            self.assertEqual(health.stats[host]['state'], 'open')
+            time.sleep(0.25)
+            locator.clear_cache()
+            locator.get_project('sarge')
+            self.assertEqual(len(server.requests), 2)
+            self.assertEqual(health.stats[host]['state'], 'open')
+            time.sleep(0.25)
+            locator.clear_cache()
+            self.assertIn('0.1', locator.get_project('sarge'))
+            self.assertEqual(health.stats[host]['state'], 'closed')
+        finally:
+            server.stop()
+
+    def test_mirrors(self):
+        sock = socket.socket()
+        sock.bind(('localhost', 0))
+        dead_url = 'http://localhost:%d/simple/' % sock.getsockname()[1]
+        sock.close()    # so connections to it are refused
+        broken = IndexServerThread({
+            '/simple/sarge/': {'body': b'Oops', 'status': 503},
+        })
+        good = IndexServerThread({
+            '/simple/sarge/': {'body': SARGE_PAGE},
+        })
+        broken.start()
+        good.start()
+        try:
+            health = HostHealth(failure_threshold=1)
+            locator = SimpleScrapingLocator(
+                dead_url, mirrors=[broken.url + 'simple/',
+                                   good.url + 'simple/'], health=health,
+                timeout=5)
+            result = locator.get_project('sarge')
+            self.assertEqual(result['urls']['0.1'],
+                             set([good.url + 'files/sarge-0.1.tar.gz']))
+            self.assertEqual(len(broken.requests), 1)
+            stats = health.stats
+            self.assertEqual(stats[urlparse(dead_url)[1]]['state'], 'open')
+            self.assertEqual(stats[urlparse(broken.url)[1]]['state'], 'open')
+            self.assertEqual(stats[urlparse(good.url)[1]]['state'], 'closed')
+            # The failed hosts aren't tried again while their circuits are
+            # open; the shared health is used by another locator
+            locator = SimpleScrapingLocator(
+                dead_url, mirrors=[broken.url + 'simple/',
+                                   good.url + 'simple/'], health=health,
+                timeout=5)
+            self.assertIn('0.1', locator.get_project('sarge'))
+            self.assertEqual(len(broken.requests), 1)
+            self.assertEqual(len(good.requests), 2)
+        finally:
+            broken.stop()
+            good.stop()
+
+    def test_json_api(self):
+        files = [
+            {'filename': 'sarge-0.1.tar.gz',
+             'url': '/files/sarge-0.1.tar.gz',
+             'hashes': {'sha256': 'ab' * 32}},
+            {'filename': 'sarge-0.1.1-py2.py3-none-any.whl',
+             'url': 'https://example.com/sarge-0.1.1-py2.py3-none-any.whl',
+             'hashes': {}, 'requires-python': '>=2.6'},
+            {'filename': 'sarge-0.2.tar.gz',
+             'url': '/files/sarge-0.2.tar.gz',
+             'hashes': {}, 'requires-python': '<2'},
+            {'filename': 'other-0.3.tar.gz',
+             'url': '/files/other-0.3.tar.gz', 'hashes': {}},
+        ]
+        project = {'meta': {'api-version': '1.0'}, 'name': 'sarge',
+                   'files': files}
+        root = {'meta': {'api-version': '1.0'},
+                'projects': [{'name': 'sarge'}, {'name': 'other'}]}
+        server = IndexServerThread({
+            '/simple/': {
+                'body': b'<a href="sarge/">sarge</a>',
+                'json': json.dumps(root).encode('utf-8'),
+            },
+            '/simple/sarge/': {
+                'body': SARGE_PAGE,
+                'json': json.dumps(project).encode('utf-8'),
+            },
+        })
+        server.start()
+        cache_dir = tempfile.mkdtemp()
+        try:
+            url = server.url + 'simple/'
+            cache = PageCache(cache_dir)
+            locator = SimpleScrapingLocator(url, page_cache=cache)
+            result = locator.get_project('sarge')
+            path, headers = server.requests[-1]
+            self.assertTrue(headers['accept'].startswith(
+                'application/vnd.pypi.simple.v1+json'))
+            # Only suitable files were used, with their hashes
+            self.assertEqual(set(result['urls']), set(['0.1', '0.1.1']))
+            self.assertEqual(result['urls']['0.1'],
+                             set([server.url + 'files/sarge-0.1.tar.gz']))
+            self.assertEqual(result['0.1'].digest, ('sha256', 'ab' * 32))
+            self.assertIsNone(result['0.1.1'].digest)
+            self.assertEqual(locator.get_distribution_names(),
+                             set(['sarge', 'other']))
+            # JSON pages are restored from the page cache
+            locator = SimpleScrapingLocator(url, page_cache=cache)
+            self.assertEqual(set(locator.get_project('sarge')['urls']),
+                             set(['0.1', '0.1.1']))
+            self.assertEqual(cache.hits, 1)
+            # Without the JSON API, the HTML page is used
+            locator = SimpleScrapingLocator(url, json_api=False)
+            result = locator.get_project('sarge')
+            path, headers = server.requests[-1]
+            self.assertNotIn('accept', headers)
+            self.assertEqual(result['0.1'].digest,
+                             ('md5', '961ddd9bc085fdd8b248c6dd96ceb1c8'))
+        finally:
+            server.stop()
+            shutil.rmtree(cache_dir)
+
+    def test_metadata_files(self):
+        metadata = (b'Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n'
+                    b'Summary: The foo project\nProvides-Extra: test\n'
+                    b'Requires-Dist: bar (>=0.5)\n'
+                    b'Requires-Dist: baz; extra == "test"\n')
+        digest = hashlib.sha256(metadata).hexdigest()
+        server = IndexServerThread({
+            '/simple/foo/': {
+                'body': ('<a href="/files/foo-1.0.tar.gz" '
+                         'data-core-metadata="sha256=%s">x</a>\n'
+                         '<a href="/files/foo-0.9.tar.gz" '
+                         'data-dist-info-metadata="sha256=%s">x</a>\n' %
+                         (digest, 'ab' * 32)).encode('ascii'),
+            },
+            '/simple/bar/': {
+                'body': b'<a href="/files/bar-0.6.tar.gz">x</a>',
+                'json': json.dumps({'files': [{
+                    'filename': 'bar-0.6.tar.gz',
+                    'url': '/files/bar-0.6.tar.gz',
+                    'hashes': {}, 'core-metadata': True}]}).encode('ascii'),
+            },
+            '/files/foo-1.0.tar.gz.metadata': {'body': metadata},
+            '/files/foo-0.9.tar.gz.metadata': {'body': metadata},
+            '/files/bar-0.6.tar.gz.metadata': {
+                'body': b'Metadata-Version: 2.1\nName: bar\nVersion: 0.6\n',
+            },
+        })
+        server.start()
+        try:
+            locator = SimpleScrapingLocator(server.url + 'simple/')
+            result = locator.get_project('foo')
+            self.assertEqual(len(server.requests), 1)
+            # Metadata is only fetched when requirements are asked for
+            dist = result['1.0']
+            self.assertEqual(dist.run_requires, set(['bar (>=0.5)']))
+            self.assertEqual(server.requests[-1][0],
+                             '/files/foo-1.0.tar.gz.metadata')
+            self.assertEqual(dist.metadata.summary, 'The foo project')
+            dist.extras = ['test']
+            self.assertEqual(dist.run_requires, set(['bar (>=0.5)', 'baz']))
+            self.assertEqual(len(server.requests), 2)
+            # Metadata which doesn't match its hash isn't used
+            self.assertEqual(result['0.9'].run_requires, set())
+            self.assertEqual(len(server.requests), 3)
+            # Dependencies can be found without fetching any archives
+            locator = SimpleScrapingLocator(server.url + 'simple/')
+            finder = DependencyFinder(locator)
+            dists, problems = finder.find('foo (1.0)')
+            self.assertFalse(problems)
+            self.assertEqual(set(d.name_and_version for d in dists),
+                             set(['foo (1.0)', 'bar (0.6)']))
+            self.assertFalse([p for p, h in server.requests
+                              if not p.startswith('/simple/') and
+                              not p.endswith('.metadata')])
+        finally:
+            server.stop()
+
+    def test_wheel_metadata(self):
+        bio = io.BytesIO()
+        with ZipFile(bio, 'w') as zf:
+            zf.writestr('foo/data.bin', os.urandom(500000))
+            zf.writestr('foo-1.0.dist-info/METADATA',
+                        'Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n'
+                        'Requires-Dist: bar (>=0.5)\n')
+            zf.writestr('foo-1.0.dist-info/WHEEL', 'Wheel-Version: 1.0\n')
+        data = bio.getvalue()
+        server = IndexServerThread({
+            '/simple/foo/': {
+                'body': b'<a href="/files/foo-1.0-py2.py3-none-any.whl">x</a>',
+            },
+            '/files/foo-1.0-py2.py3-none-any.whl': {
+                'body': data,
+                'content_type': 'application/octet-stream',
+            },
+        })
+        server.start()
+        try:
+            locator = SimpleScrapingLocator(server.url + 'simple/')
+            dist = locator.get_project('foo')['1.0']
+            self.assertEqual(dist.run_requires, set())
+            self.assertEqual(len(server.requests), 1)
+            locator = SimpleScrapingLocator(server.url + 'simple/',
+                                            wheel_metadata=True)
+            dist = locator.get_project('foo')['1.0']
+            self.assertEqual(dist.run_requires, set(['bar (>=0.5)']))
+            fetched = [h for p, h in server.requests if p.endswith('.whl')]
+            self.assertTrue(fetched)
+            for headers in fetched:
+                self.assertIn('range', headers)
+        finally:
+            server.stop()
+
 if __name__ == '__main__':  # pragma: no cover
     import logging
     logging.basicConfig(level=logging.DEBUG, filename='test_locators.log',
@@ -638,6 +638,13 @@ class ProgressTestCase(unittest.TestCase):
         self.assertEqual(bar.ETA, e)
         self.assertIn(bar.speed, s)
 
+    def test_empty(self):
+        bar = Progress(maxval=0).start()
+        self.assertEqual(bar.percentage, ' ?? %')
+        bar.stop()
+        self.assertEqual(bar.percentage, '100 %')
+
+
 class FileOpsTestCase(unittest.TestCase):
 
     def setUp(self):
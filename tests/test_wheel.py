@@ -8,6 +8,7 @@ from __future__ import unicode_literals
 
 import codecs
 import hashlib
+import io
 import os
 import re
 import shutil
@@ -16,6 +17,7 @@ import sys
 import tempfile
 
 from compat import unittest
+from support import IndexServerThread
 
 from distlib import DistlibException
 from distlib.compat import ZipFile, sysconfig, fsencode
@@ -23,9 +25,9 @@ from distlib.database import DistributionPath, InstalledDistribution
 from distlib.manifest import Manifest
 from distlib.metadata import Metadata, METADATA_FILENAME
 from distlib.scripts import ScriptMaker
-from distlib.util import get_executable
-from distlib.wheel import (Wheel, PYVER, IMPVER, ARCH, ABI, COMPATIBLE_TAGS,
-                           is_compatible)
+from distlib.util import get_executable, HTTPRangeFile
+from distlib.wheel import (Wheel, RemoteWheel, PYVER, IMPVER, ARCH, ABI,
+                           COMPATIBLE_TAGS, is_compatible)
 
 try:
     with open(os.devnull, 'wb') as junk:
@@ -416,6 +418,105 @@ class WheelTestCase(unittest.TestCase):
         }
         self.assertEqual(actual, expected)
 
+    def test_remote(self):
+        # A wheel whose dist-info is after a large, incompressible member,
+        # as is usual.
+        bio = io.BytesIO()
+        with ZipFile(bio, 'w') as zf:
+            zf.writestr('big/payload.bin', os.urandom(2000000))
+            zf.writestr('big-1.0.dist-info/METADATA',
+                        'Metadata-Version: 2.1\nName: big\nVersion: 1.0\n'
+                        'Requires-Dist: small (>=0.1)\n')
+            zf.writestr('big-1.0.dist-info/WHEEL',
+                        'Wheel-Version: 1.0\nRoot-Is-Purelib: true\n'
+                        'Tag: py2.py3-none-any\n')
+        data = bio.getvalue()
+        server = IndexServerThread({
+            '/files/big-1.0-py2.py3-none-any.whl': {
+                'body': data,
+                'content_type': 'application/octet-stream',
+            },
+            '/nr/big-1.0-py2.py3-none-any.whl': {
+                'body': data,
+                'content_type': 'application/octet-stream',
+                'ranges': False,
+            },
+        })
+        server.start()
+        try:
+            w = RemoteWheel(server.url + 'files/big-1.0-py2.py3-none-any.whl')
+            self.assertEqual((w.name, w.version), ('big', '1.0'))
+            md = w.metadata
+            self.assertEqual(md.name, 'big')
+            self.assertEqual(md.run_requires, ['small (>=0.1)'])
+            self.assertEqual(w.info['Tag'], 'py2.py3-none-any')
+            self.assertEqual(w.archive.size, len(data))
+            self.assertLess(w.archive.bytes_fetched, len(data) // 10)
+            self.assertEqual(w.archive.requests, len(server.requests))
+            for path, headers in server.requests:
+                self.assertIn('range', headers)
+            # Servers which don't support ranges still work
+            w = RemoteWheel(server.url + 'nr/big-1.0-py2.py3-none-any.whl')
+            self.assertEqual(w.metadata.run_requires, ['small (>=0.1)'])
+            self.assertEqual(w.archive.requests, 1)
+        finally:
+            server.stop()
+
+    def test_remote_size_unknown(self):
+        # Servers may not say how big the resource is ("bytes a-b/*")
+        bio = io.BytesIO()
+        with ZipFile(bio, 'w') as zf:
+            zf.writestr('big/payload.bin', os.urandom(200000))
+            zf.writestr('big-1.0.dist-info/METADATA',
+                        'Metadata-Version: 2.1\nName: big\nVersion: 1.0\n')
+            zf.writestr('big-1.0.dist-info/WHEEL',
+                        'Wheel-Version: 1.0\nRoot-Is-Purelib: true\n'
+                        'Tag: py2.py3-none-any\n')
+        data = bio.getvalue()
+        server = IndexServerThread({
+            '/files/big-1.0-py2.py3-none-any.whl': {
+                'body': data,
+                'content_type': 'application/octet-stream',
+                'size_unknown': True,
+            },
+        })
+        server.start()
+        try:
+            url = server.url + 'files/big-1.0-py2.py3-none-any.whl'
+            # A suffix range ends with the resource, which gives its size
+            w = RemoteWheel(url)
+            self.assertEqual(w.metadata.name, 'big')
+            self.assertEqual(w.archive.size, len(data))
+            self.assertLess(w.archive.bytes_fetched, len(data) // 2)
+
+            # If the size still isn't known, reads stop at a short response
+            # and reading to the end or seeking from it finds the size
+            f = HTTPRangeFile(url)
+            f.size = None
+            f._ranges = []
+            f.min_fetch = 1000
+            self.assertEqual(f.read(100), data[:100])
+            self.assertIsNone(f.size)
+            f.seek(len(data) - 10)
+            self.assertEqual(f.read(100), data[-10:])
+            self.assertEqual(f.size, len(data))
+            self.assertEqual(f.read(100), b'')
+            f.size = None
+            self.assertEqual(f.seek(0, 2), len(data))
+            f.seek(-5, 2)
+            self.assertEqual(f.read(), data[-5:])
+            # Reading past the end gets a 416, without a size
+            f = HTTPRangeFile(url)
+            f.size = None
+            f.seek(len(data) + 10)
+            self.assertEqual(f.read(10), b'')
+            self.assertIsNone(f.size)
+            f.seek(0)
+            self.assertEqual(f.read(), data)
+            self.assertEqual(f.size, len(data))
+        finally:
+            server.stop()
+
     @unittest.skipIf(sys.version_info[:2] != (2, 7), 'The test wheel is only '
                                                '2.7 mountable')
     def test_mount(self):